@@ -0,0 +1,355 @@
+'''
+Benchmarks for the signal, connect and motor hot paths of
+ophyd_tango_devices, run offline against SimProxy devices from a generated
+SimBackend. Results are written as JSON so that runs from different commits
+can be compared:
+
+    python benchmarks/benchmark_sim.py --output before.json
+    python benchmarks/benchmark_sim.py --output after.json \
+        --compare before.json
+'''
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+import bluesky.plans as bp
+import numpy as np  # type: ignore
+from bluesky import RunEngine
+from bluesky.run_engine import call_in_bluesky_event_loop
+from ophyd.v2.core import CommsConnector, SignalCollection  # type: ignore
+
+from ophyd_tango_devices.devices import TangoDevice
+from ophyd_tango_devices.faults import (FaultInjector, FaultProfile,
+                                        disable_fault_injection,
+                                        enable_fault_injection)
+from ophyd_tango_devices.motor import tango_motor
+from ophyd_tango_devices.signals import (ConnectWithoutReading, TangoAttrR,
+                                         TangoAttrRW, TangoComm,
+                                         get_proxy_pool, tango_connector)
+from ophyd_tango_devices.simulation import (SimBackend, set_sim_backend,
+                                            sim_motor_spec)
+
+DEVICE_NAME = 'bench/device/{}'
+MOTOR_NAME = 'bench/motor/{}'
+DETECTOR_NAME = 'bench/detector/0'
+IMAGE_SHAPE = (1024, 1024)
+
+
+def _timings(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {'count': len(samples),
+            'mean': statistics.fmean(samples),
+            'min': ordered[0],
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'max': ordered[-1]}
+
+
+def make_backend(n_devices: int, n_signals: int) -> SimBackend:
+    backend = SimBackend()
+    backend.load({'devices': [{
+        'name': DEVICE_NAME,
+        'count': n_devices,
+        'attributes': {f'attr{i}': {'dtype': 'DevDouble'}
+                       for i in range(n_signals)}}]})
+    backend.add_devices([MOTOR_NAME.format(i) for i in range(n_devices)],
+                        sim_motor_spec())
+    backend.load({'devices': [{
+        'name': DETECTOR_NAME,
+        'attributes': {'image': {'dtype': 'DevUShort',
+                                 'shape': list(IMAGE_SHAPE)}}}]})
+    return backend
+
+
+def make_comm_class(n_signals: int, name: str) -> Type[TangoComm]:
+    hints = {f'attr{i}': TangoAttrRW for i in range(n_signals)}
+    return type(name, (TangoComm,), {'__annotations__': hints})
+
+
+class BenchDevice(TangoDevice):
+    pass
+
+
+def make_device(comm: TangoComm) -> TangoDevice:
+    device = BenchDevice(comm)
+    device._read_signals = SignalCollection(  # type: ignore
+        **{name: getattr(comm, name) for name in comm._signals_})
+    return device
+
+
+def bench_connect(n_devices: int, n_signals: int) -> Dict[str, Dict]:
+    '''Times creating comms (make_tango_signals) and connecting them with
+    ConnectSimilarlyNamed and ConnectWithoutReading'''
+    results = {}
+    similar_cls = make_comm_class(n_signals, 'SimilarlyNamedComm')
+    without_reading_cls = make_comm_class(n_signals, 'WithoutReadingComm')
+
+    async def connect_without_reading(comm, proxy):
+        await ConnectWithoutReading(comm, proxy)()
+    tango_connector(connect_without_reading, without_reading_cls)
+
+    for label, comm_cls in (('ConnectSimilarlyNamed', similar_cls),
+                            ('ConnectWithoutReading', without_reading_cls)):
+        start = time.perf_counter()
+        with CommsConnector(sim_mode=True):
+            for i in range(n_devices):
+                comm_cls(DEVICE_NAME.format(i))
+            created = time.perf_counter()
+        connected = time.perf_counter()
+        results[label] = {
+            'devices': n_devices,
+            'signals_per_device': n_signals,
+            'make_tango_signals_s': created - start,
+            'connect_s': connected - created,
+            'signals_per_s': n_devices * n_signals / (connected - created)}
+    return results
+
+
+def bench_read_describe(n_signals: int, repeat: int) -> Dict[str, Dict]:
+    '''Throughput of TangoDevice.read() and describe()'''
+    with CommsConnector(sim_mode=True):
+        comm = make_comm_class(n_signals, 'ReadComm')(DEVICE_NAME.format(0))
+    device = make_device(comm)
+    results = {}
+    for label, method in (('read', device.read),
+                          ('describe', device.describe)):
+        async def run(method=method):
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await method()
+                samples.append(time.perf_counter() - start)
+            return samples
+        samples = call_in_bluesky_event_loop(run())
+        results[label] = dict(_timings(samples),
+                              calls_per_s=len(samples) / sum(samples),
+                              signals=n_signals)
+    return results
+
+
+class ImageComm(TangoComm):
+    image: TangoAttrR
+
+
+def bench_image_read(repeat: int) -> Dict[str, Dict]:
+    '''Time to read a 1024x1024 DevUShort image attribute, returning a new
+    array and copying into a preallocated buffer'''
+    with CommsConnector(sim_mode=True):
+        comm = ImageComm(DETECTOR_NAME)
+    buffer = np.empty(IMAGE_SHAPE, dtype=np.uint16)
+    results = {}
+    for label, kwargs in (('new_array', {}), ('buffer', {'out': buffer})):
+        async def run(kwargs=kwargs):
+            await comm.image.get_descriptor()
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await comm.image.get_value(**kwargs)
+                samples.append(time.perf_counter() - start)
+            return samples
+        samples = call_in_bluesky_event_loop(run())
+        results[label] = dict(_timings(samples),
+                              frames_per_s=len(samples) / sum(samples))
+    return results
+
+
+def bench_monitor_latency(n_monitors: int, repeat: int) -> Dict[str, float]:
+    '''Time from a write to the delivery of its change event to each of
+    n_monitors monitors of the written attribute'''
+    with CommsConnector(sim_mode=True):
+        comm = make_comm_class(1, 'MonitorComm')(DEVICE_NAME.format(0))
+
+    async def run():
+        samples: List[float] = []
+        written_at = [0.0]
+        expected: List[Optional[float]] = [None]
+        received = asyncio.Event()
+
+        def callback(value):
+            if value == expected[0]:
+                samples.append(time.perf_counter() - written_at[0])
+                if len(samples) % n_monitors == 0:
+                    received.set()
+        monitors = [await comm.attr0.monitor_value(callback)
+                    for _ in range(n_monitors)]
+        await asyncio.sleep(0)
+        for i in range(1, repeat + 1):
+            received.clear()
+            expected[0] = float(i)
+            written_at[0] = time.perf_counter()
+            await comm.attr0.put(float(i))
+            await received.wait()
+        for monitor in monitors:
+            monitor.close()
+        return samples
+    samples = call_in_bluesky_event_loop(run())
+    return dict(_timings(samples), monitors=n_monitors)
+
+
+def bench_motor_set(repeat: int) -> Dict[str, float]:
+    '''Overhead of TangoMotor.set() for a move that completes immediately'''
+    with CommsConnector(sim_mode=True):
+        motor = tango_motor(MOTOR_NAME.format(0), 'bench_motor')
+
+    async def run():
+        samples = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            await motor.set(float(i % 2))
+            samples.append(time.perf_counter() - start)
+        return samples
+    return _timings(call_in_bluesky_event_loop(run()))
+
+
+def bench_plans(RE: RunEngine, n_signals: int, num: int) -> Dict[str, Dict]:
+    '''Event documents per second in bluesky count and scan plans'''
+    with CommsConnector(sim_mode=True):
+        comm = make_comm_class(n_signals, 'PlanComm')(DEVICE_NAME.format(1))
+        motor = tango_motor(MOTOR_NAME.format(1), 'plan_motor')
+    detector = make_device(comm)
+    results = {}
+    plans: Dict[str, Callable] = {
+        'count': lambda: bp.count([detector], num=num),
+        'scan': lambda: bp.scan([detector], motor, 0, 1, num)}
+    for label, plan in plans.items():
+        events = []
+        start = time.perf_counter()
+        RE(plan(), lambda name, doc: events.append(name))
+        elapsed = time.perf_counter() - start
+        n_events = events.count('event')
+        results[label] = {'events': n_events, 'elapsed_s': elapsed,
+                          'events_per_s': n_events / elapsed}
+    return results
+
+
+def bench_degraded_scan(RE: RunEngine, n_signals: int, num: int,
+                        profile: FaultProfile,
+                        seed: Optional[int] = None) -> Dict[str, Dict]:
+    '''Time between the event documents of a bluesky scan, with the faults
+    of profile injected into every call to the simulated devices'''
+    pool = get_proxy_pool(sim_mode=True)
+    injector = FaultInjector(seed)
+    injector.set_profile(profile)
+    enable_fault_injection(injector, pool)
+    try:
+        with CommsConnector(sim_mode=True):
+            comm = make_comm_class(n_signals, 'DegradedComm')(
+                DEVICE_NAME.format(2))
+            motor = tango_motor(MOTOR_NAME.format(2), 'degraded_motor')
+        detector = make_device(comm)
+        times: List[float] = []
+
+        def on_document(name, doc):
+            if name == 'event':
+                times.append(time.perf_counter())
+        start = time.perf_counter()
+        RE(bp.scan([detector], motor, 0, 1, num), on_document)
+        elapsed = time.perf_counter() - start
+    finally:
+        disable_fault_injection(pool)
+    return {'event_interval': _timings(list(np.diff([start] + times))),
+            'elapsed_s': elapsed,
+            'injected': injector.stats()}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(devices: int, signals: int, repeat: int,
+                   monitors: int,
+                   fault_profile: Optional[FaultProfile] = None) -> Dict:
+    RE = RunEngine()
+    previous_backend = set_sim_backend(make_backend(devices, signals))
+    try:
+        results = {
+            'connect': bench_connect(devices, signals),
+            'read_describe': bench_read_describe(signals, repeat),
+            'image_read': bench_image_read(repeat),
+            'monitor_latency': bench_monitor_latency(monitors, repeat),
+            'motor_set': bench_motor_set(repeat),
+            'plans': bench_plans(RE, signals, repeat),
+            'degraded_scan': bench_degraded_scan(
+                RE, signals, repeat, fault_profile or FaultProfile(),
+                seed=0),
+            'proxy_pool': get_proxy_pool(sim_mode=True).stats(),
+        }
+    finally:
+        set_sim_backend(previous_backend)
+    return {'meta': {'commit': _git_commit(),
+                     'python': platform.python_version(),
+                     'time': time.time(),
+                     'parameters': {'devices': devices, 'signals': signals,
+                                    'repeat': repeat, 'monitors': monitors,
+                                    'fault_profile': vars(fault_profile)
+                                    if fault_profile else None}},
+            'results': results}
+
+
+def _flatten(results: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict):
+    '''Prints the ratio of each result to the same result in a baseline'''
+    now = _flatten(current['results'])
+    before = _flatten(baseline['results'])
+    for key in sorted(now.keys() & before.keys()):
+        if before[key]:
+            print(f'{key:60s} {before[key]:12.6g} -> {now[key]:12.6g}'
+                  f'  ({now[key] / before[key]:.2f}x)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--signals', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--monitors', type=int, default=10)
+    parser.add_argument('--fault-latency', type=float, default=0.001,
+                        help='latency in seconds injected into each call in'
+                             ' the degraded scan')
+    parser.add_argument('--fault-jitter', type=float, default=0.5)
+    parser.add_argument('--fault-distribution', default='lognormal')
+    parser.add_argument('--fault-error-rate', type=float, default=0.0)
+    parser.add_argument('--fault-stall-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='JSON file to write results to')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    args = parser.parse_args(argv)
+    profile = FaultProfile(latency=args.fault_latency,
+                           jitter=args.fault_jitter,
+                           distribution=args.fault_distribution,
+                           error_rate=args.fault_error_rate,
+                           stall_rate=args.fault_stall_rate)
+    results = run_benchmarks(args.devices, args.signals, args.repeat,
+                             args.monitors, profile)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import os
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Sequence, Tuple
+import numpy as np  # type: ignore
+
+FRAMES_SPEC = 'TANGO_FRAMES'
+
+
+class FrameFile:
+    """
+    FrameFile(path: str, frame_shape: Sequence[int], dtype)
+    File of frames of a single shape and dtype, appended one after another
+    with no header, so that frame i is found at byte offset
+    i * frame_nbytes and the whole file can be memory mapped as an array of
+    shape (n_frames, *frame_shape).
+    """
+    def __init__(self, path: str, frame_shape: Sequence[int], dtype):
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_count = 0
+        self._file = open(path, 'ab')
+
+    def append(self, frame) -> int:
+        '''Writes the frame to the end of the file, returning its index'''
+        frame = np.asarray(frame)
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame of shape {frame.shape} can not be"
+                             f" written to {self.path}, whose frames are"
+                             f" of shape {self.frame_shape}")
+        np.ascontiguousarray(frame, dtype=self.dtype).tofile(self._file)
+        self.frame_count += 1
+        return self.frame_count - 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class FrameFileHandler:
+    """
+    FrameFileHandler(resource_path: str, frame_shape: Sequence[int], dtype)
+    Handler for resources of spec TANGO_FRAMES, for registration with
+    databroker. Called with the index from a datum, it returns that frame
+    from a memory map of the file.
+    """
+    specs = {FRAMES_SPEC}
+
+    def __init__(self, resource_path: str, frame_shape: Sequence[int],
+                 dtype: str):
+        self._path = resource_path
+        self._frame_shape = tuple(frame_shape)
+        self._dtype = np.dtype(dtype)
+
+    def __call__(self, index: int) -> np.ndarray:
+        frames = np.memmap(self._path, dtype=self._dtype, mode='r')
+        return frames.reshape((-1,) + self._frame_shape)[index]
+
+
+class ExternalAssetWriter:
+    """
+    ExternalAssetWriter(directory: str)
+    Writes array values to a FrameFile per data key and run in directory in
+    place of putting them in event documents. write() appends a frame and
+    returns the datum_id that stands in for it, and the resource and datum
+    documents that describe the frames are handed out by
+    collect_asset_docs(). open_run() starts new files for the next frames.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._files: Dict[str, Tuple[FrameFile, str]] = {}
+        self._asset_docs: Deque[Tuple[str, Dict[str, Any]]] = deque()
+
+    def open_run(self):
+        self.close()
+
+    def close(self):
+        for frame_file, _ in self._files.values():
+            frame_file.close()
+        self._files = {}
+
+    def _open(self, key: str, frame: np.ndarray) -> Tuple[FrameFile, str]:
+        os.makedirs(self.directory, exist_ok=True)
+        resource_uid = str(uuid.uuid4())
+        file_name = f'{key}_{resource_uid}.frames'
+        frame_file = FrameFile(os.path.join(self.directory, file_name),
+                               frame.shape, frame.dtype)
+        self._asset_docs.append(('resource', {
+            'spec': FRAMES_SPEC,
+            'root': self.directory,
+            'resource_path': file_name,
+            'resource_kwargs': {'frame_shape': list(frame.shape),
+                                'dtype': frame_file.dtype.str},
+            'path_semantics': 'posix' if os.sep == '/' else 'windows',
+            'uid': resource_uid}))
+        return frame_file, resource_uid
+
+    def write(self, key: str, value) -> str:
+        frame = np.asarray(value)
+        if key not in self._files:
+            self._files[key] = self._open(key, frame)
+        frame_file, resource_uid = self._files[key]
+        index = frame_file.append(frame)
+        datum_id = f'{resource_uid}/{index}'
+        self._asset_docs.append(('datum', {'resource': resource_uid,
+                                           'datum_id': datum_id,
+                                           'datum_kwargs': {'index': index}}))
+        return datum_id
+
+    def collect_asset_docs(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # the frames must be on disk before their datums are handed out
+        for frame_file, _ in self._files.values():
+            frame_file.flush()
+        while self._asset_docs:
+            yield self._asset_docs.popleft()
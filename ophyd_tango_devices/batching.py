@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+from PyTango import DevFailed  # type: ignore
+from .pool import ProxyHelper, ProxyHelpers
+from .proxy import DeviceProxy
+
+_batch_reads: ContextVar[bool] = ContextVar('_batch_reads', default=False)
+
+
+class ReadCoalescer(ProxyHelper):
+    """
+    ReadCoalescer(proxy: DeviceProxy)
+    Collects the read_attribute calls made against a single DeviceProxy
+    during one iteration of the event loop and issues them as a single
+    read_attributes call, handing each caller the DeviceAttribute for the
+    attribute it asked for. Duplicate requests for the same attribute within
+    a batch share one result.
+    """
+    def __init__(self, proxy: DeviceProxy):
+        super().__init__(proxy)
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self.batches = 0
+
+    async def read_attribute(self, attr_name: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.setdefault(attr_name, []).append(future)
+        return await future
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._read_pending(pending))
+
+    async def _read_pending(self, pending: Dict[str, List[asyncio.Future]]):
+        attr_names = list(pending)
+        self.batches += 1
+        try:
+            attr_data = await self.proxy.read_attributes(attr_names)
+        except Exception as exc:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for attr_name, data in zip(attr_names, attr_data):
+            for future in pending[attr_name]:
+                if future.done():
+                    continue
+                if getattr(data, 'has_failed', False):
+                    future.set_exception(DevFailed(*data.get_err_stack()))
+                else:
+                    future.set_result(data)
+
+
+_read_coalescers = ProxyHelpers(ReadCoalescer)
+
+
+def get_read_coalescer(proxy: DeviceProxy) -> ReadCoalescer:
+    return _read_coalescers.get(proxy)
+
+
+def batching_reads() -> bool:
+    return _batch_reads.get()
+
+
+@contextmanager
+def batched_reads(enabled: bool = True):
+    '''
+    batched_reads(enabled: bool = True)
+    Context manager under which attribute reads made by TangoAttrR signals,
+    including those in tasks created inside the block, are routed through the
+    ReadCoalescer of their DeviceProxy.
+    '''
+    token = _batch_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _batch_reads.reset(token)
@@ -0,0 +1,190 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Sequence, Tuple
+import numpy as np  # type: ignore
+
+
+class RingBuffer:
+    """
+    RingBuffer(capacity: int, shape: Sequence[int] = (), dtype=float,
+               ragged: bool = False)
+    Preallocated buffer of the last capacity values of a fixed shape and
+    dtype, and their timestamps. Appending to a full buffer overwrites the
+    oldest value, which is counted in dropped. If ragged, shape is the
+    largest shape of a value, such as the max_dim_x of a spectrum
+    attribute, and the shape of each value is kept so that it is drained
+    as it was appended.
+    """
+    def __init__(self, capacity: int, shape: Sequence[int] = (),
+                 dtype=float, ragged: bool = False):
+        if capacity < 1:
+            raise ValueError("RingBuffer capacity must be at least 1")
+        self.capacity = capacity
+        self.values = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.shapes = np.empty((capacity, len(shape)), dtype=np.intp) \
+            if ragged else None
+        self._start = 0
+        self._count = 0
+        self.appended = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value, timestamp: float):
+        end = (self._start + self._count) % self.capacity
+        if self.shapes is None:
+            self.values[end] = value
+        else:
+            value = np.asarray(value)
+            self.values[end][self._region(value.shape)] = value
+            self.shapes[end] = value.shape
+        self.timestamps[end] = timestamp
+        self.appended += 1
+        if self._count == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self.dropped += 1
+        else:
+            self._count += 1
+
+    def latest(self):
+        '''Returns the most recent value and its timestamp'''
+        if not self._count:
+            raise IndexError("RingBuffer is empty")
+        end = (self._start + self._count - 1) % self.capacity
+        return self._value(end), self.timestamps[end]
+
+    @staticmethod
+    def _region(shape: Sequence[int]) -> Tuple[slice, ...]:
+        return tuple(slice(0, length) for length in shape)
+
+    def _value(self, index: int):
+        if self.shapes is None:
+            return self.values[index]
+        return self.values[index][self._region(self.shapes[index])]
+
+    def drain(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''Returns copies of the buffered values and timestamps, oldest
+        first, and empties the buffer. The values of a ragged buffer are
+        given as an object array of arrays.'''
+        indices = (self._start + np.arange(self._count)) % self.capacity
+        timestamps = self.timestamps[indices]
+        if self.shapes is None:
+            values = self.values[indices]
+        else:
+            values = np.empty(len(indices), dtype=object)
+            for position, index in enumerate(indices):
+                values[position] = self._value(index).copy()
+        self._start = 0
+        self._count = 0
+        return values, timestamps
+
+
+class MonitorDelivery:
+    """
+    MonitorDelivery()
+    Hands the values (or event data) of a monitor to an asynchronous
+    consumer, which takes them with get(), get_nowait() or drain(). Counts
+    the items received from the monitor, delivered to the consumer, dropped
+    and coalesced. This base class keeps every item; its subclasses bound
+    the memory used when the consumer falls behind.
+    """
+    def __init__(self):
+        self._items: Deque = deque()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item):
+        self.received += 1
+        self._store(item)
+        while self._waiters and self._items:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _store(self, item):
+        self._items.append(item)
+
+    async def get(self):
+        while not self._items:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        return self.get_nowait()
+
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty
+        self.delivered += 1
+        return self._items.popleft()
+
+    def drain(self) -> List:
+        '''Returns every item held, oldest first'''
+        items = list(self._items)
+        self._items.clear()
+        self.delivered += len(items)
+        return items
+
+    def stats(self) -> Dict[str, int]:
+        return {'received': self.received, 'delivered': self.delivered,
+                'dropped': self.dropped, 'coalesced': self.coalesced,
+                'pending': len(self._items)}
+
+
+class BoundedQueue(MonitorDelivery):
+    """
+    BoundedQueue(maxsize: int)
+    MonitorDelivery holding at most maxsize items, which drops items that
+    arrive while it is full, so that the consumer sees the oldest ones.
+    """
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def _store(self, item):
+        if len(self._items) >= self.maxsize:
+            self.dropped += 1
+        else:
+            self._items.append(item)
+
+
+class RingQueue(MonitorDelivery):
+    """
+    RingQueue(capacity: int)
+    MonitorDelivery holding the last capacity items, overwriting the oldest
+    when full, so that the consumer sees the most recent ones.
+    """
+    def __init__(self, capacity: int):
+        super().__init__()
+        self._items = deque(maxlen=capacity)
+
+    def _store(self, item):
+        if len(self._items) == self._items.maxlen:
+            self.dropped += 1
+        self._items.append(item)
+
+
+class LatestValue(MonitorDelivery):
+    """
+    LatestValue()
+    MonitorDelivery holding only the most recent item. An item that is
+    replaced before the consumer takes it is counted as coalesced.
+    """
+    def _store(self, item):
+        if self._items:
+            self._items.clear()
+            self.coalesced += 1
+        self._items.append(item)
@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from .metrics import MetricsRegistry, get_metrics_registry
+from .pool import ProxyPool
+from .proxy import DeviceProxy, ProxyWrapper
+from .signals import get_proxy_pools
+
+
+class TangoTimeoutError(asyncio.TimeoutError):
+    """
+    TangoTimeoutError(device: str, attr_names: Tuple[str, ...],
+                      operation: str, timeout: float)
+    Raised when a call to a Tango device does not complete within its
+    deadline. The call has been cancelled.
+    """
+    def __init__(self, device: str, attr_names: Tuple[str, ...],
+                 operation: str, timeout: float):
+        super().__init__(f"{operation} of {device}/{', '.join(attr_names)}"
+                         f" did not complete within {timeout} s")
+        self.device = device
+        self.attr_names = attr_names
+        self.operation = operation
+        self.timeout = timeout
+
+
+class DeadlinePolicy:
+    """
+    DeadlinePolicy(timeout: Optional[float] = None)
+    The time in seconds that calls made through a DeadlineProxy may take,
+    by default timeout for every call, or None for no deadline. Deadlines
+    for a device, an attribute (or command or pipe) or an operation are set
+    with set_timeout(), and the most specific one is used.
+    """
+    def __init__(self, timeout: Optional[float] = None):
+        self._timeouts: Dict[Tuple[Optional[str], Optional[str],
+                                   Optional[str]], Optional[float]] = {}
+        if timeout is not None:
+            self.set_timeout(timeout)
+
+    def set_timeout(self, timeout: Optional[float],
+                    device: Optional[str] = None,
+                    attribute: Optional[str] = None,
+                    operation: Optional[str] = None):
+        '''Applies timeout to the calls matching device, attribute and
+        operation ('read', 'write', 'command', 'read_pipe', 'write_pipe',
+        'get_config' or 'subscribe'), any of which may be None to match
+        all. A timeout of None removes the deadline of the matching calls.'''
+        self._timeouts[(device, attribute and attribute.lower(),
+                        operation)] = timeout
+
+    def clear(self):
+        self._timeouts = {}
+
+    def timeout_for(self, device: str, attribute: str,
+                    operation: str) -> Optional[float]:
+        attribute = attribute.lower()
+        for key in ((device, attribute, operation), (device, attribute, None),
+                    (device, None, operation), (device, None, None),
+                    (None, attribute, operation), (None, attribute, None),
+                    (None, None, operation), (None, None, None)):
+            if key in self._timeouts:
+                return self._timeouts[key]
+        return None
+
+
+class DeadlineProxy(ProxyWrapper):
+    """
+    DeadlineProxy(proxy: DeviceProxy, dev_name: str, policy: DeadlinePolicy,
+                  registry: Optional[MetricsRegistry] = None)
+    ProxyWrapper cancelling the calls that exceed their deadline in policy
+    and raising TangoTimeoutError in their place. A call on several
+    attributes, such as read_attributes, has the shortest of their
+    deadlines. Timeouts are recorded against each attribute in registry, by
+    default the one returned by get_metrics_registry().
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str,
+                 policy: DeadlinePolicy,
+                 registry: Optional[MetricsRegistry] = None):
+        super().__init__(proxy, dev_name)
+        self.policy = policy
+        self.registry = registry or get_metrics_registry()
+
+    def _timeout(self, operation: str,
+                 attr_names: Tuple[str, ...]) -> Optional[float]:
+        timeouts = [self.policy.timeout_for(self.dev_name, attr_name,
+                                            operation)
+                    for attr_name in attr_names or ('',)]
+        return min((timeout for timeout in timeouts if timeout is not None),
+                   default=None)
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        timeout = self._timeout(operation, attr_names)
+        if timeout is None:
+            return await super()._call(operation, attr_names, method,
+                                       *args, **kwargs)
+        call = asyncio.ensure_future(
+            super()._call(operation, attr_names, method, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout)
+        except asyncio.TimeoutError:
+            if operation == 'subscribe':
+                # the id of a late subscription is still needed to undo it
+                call.add_done_callback(self._unsubscribe_late)
+            else:
+                call.cancel()
+            for attr_name in attr_names:
+                self.registry.record_timeout(self.dev_name, attr_name,
+                                             operation)
+            raise TangoTimeoutError(self.dev_name, attr_names, operation,
+                                    timeout) from None
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+
+    def _unsubscribe_late(self, call: asyncio.Future):
+        if call.cancelled() or call.exception() is not None:
+            return
+        try:
+            self.unsubscribe_event(call.result())
+        except Exception:
+            logging.exception(f"Could not undo a subscription to"
+                              f" {self.dev_name} that timed out")
+
+
+_deadline_wrappers: Dict[ProxyPool, Callable] = {}
+
+
+def enable_deadlines(policy: Optional[DeadlinePolicy] = None,
+                     pool: Optional[ProxyPool] = None,
+                     registry: Optional[MetricsRegistry] = None
+                     ) -> DeadlinePolicy:
+    '''Applies the deadlines of policy, a new DeadlinePolicy with no
+    deadlines by default, to every proxy created from now on by pool, or
+    by both the pools used by _get_device_proxy if no pool is given.
+    Returns the policy, which may still be changed.'''
+    policy = policy or DeadlinePolicy()
+    pools: List[ProxyPool] = [pool] if pool is not None \
+        else get_proxy_pools()
+    for pool in pools:
+        disable_deadlines(pool)
+        _deadline_wrappers[pool] = functools.partial(
+            DeadlineProxy, policy=policy, registry=registry)
+        pool.add_wrapper(_deadline_wrappers[pool])
+    return policy
+
+
+def disable_deadlines(pool: Optional[ProxyPool] = None):
+    pools: List[ProxyPool] = [pool] if pool is not None \
+        else get_proxy_pools()
+    for pool in pools:
+        if pool in _deadline_wrappers:
+            pool.remove_wrapper(_deadline_wrappers.pop(pool))
@@ -1,9 +1,14 @@
+import asyncio
+import itertools
 import re
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
 from bluesky.protocols import Readable, Configurable
 from ophyd.v2.core import SignalCollection  # type: ignore
-from .signals import (TangoAttrRW, TangoPipeRW, TangoCommand,
-                      TangoComm, tango_connector)
+from .assets import ExternalAssetWriter
+from .batching import batched_reads
+from .signals import (TangoAttrRW, TangoAttrW, TangoPipeRW, TangoCommand,
+                      TangoComm, tango_connector, put_attributes)
+from .values import values_equal
 
 
 class WrongNumberOfArgumentsError(TypeError):
@@ -15,11 +20,14 @@ class TangoConfigurable(Configurable):
         '''Returns old result of read_configuration and new result of
         read_configuration. Pass an arbitrary number of pairs of args where the
         first arg is the attribute name as a string and the second arg is the
-        new value of the attribute'''
+        new value of the attribute. Values equal to those already read are
+        not written, and the attributes sharing a DeviceProxy are written
+        with a single write_attributes call.'''
         if len(args) % 2:  # != 0
             raise WrongNumberOfArgumentsError(
                 "configure() can not parse an odd number of arguments")
         old_reading = await self.read_configuration()  # type: ignore
+        attr_values, other_puts = [], []
         for attr_name, value in zip(args[0::2], args[1::2]):
             attr = getattr(self.comm, attr_name)
             unique_name = self._get_unique_name(attr_name)
@@ -28,12 +36,36 @@ class TangoConfigurable(Configurable):
                     f"The attribute {unique_name} is not "
                     "designated as configurable"
                     )
-            await attr.put(value)
+            if values_equal(old_reading[unique_name]["value"], value):
+                continue
+            if isinstance(attr, TangoAttrW):
+                attr_values.append((attr, value))
+            else:
+                other_puts.append(attr.put(value))
+        if not attr_values and not other_puts:
+            return (old_reading, old_reading)
+        await asyncio.gather(put_attributes(attr_values), *other_puts)
         new_reading = await self.read_configuration()  # type: ignore
         return (old_reading, new_reading)
 
 
+async def configure_devices(
+        configurations: Dict[TangoConfigurable, Dict[str, Any]]
+        ) -> Dict[TangoConfigurable, Tuple[Dict, Dict]]:
+    '''Configures many devices concurrently, given a dictionary of the
+    attribute names and values to configure for each device. Returns the old
+    and new results of read_configuration for each device.'''
+    devices = list(configurations)
+    results = await asyncio.gather(*[
+        device.configure(*itertools.chain.from_iterable(
+            configurations[device].items()))
+        for device in devices])
+    return dict(zip(devices, results))
+
+
 class TangoDevice(Readable, TangoConfigurable):
+    _asset_writer: Optional[ExternalAssetWriter] = None
+    _external_signals: Optional[Set[str]] = None
 
     def __init__(self, comm: TangoComm, name: Optional[str] = None):
         self._name = name
@@ -64,13 +96,66 @@ class TangoDevice(Readable, TangoConfigurable):
         return self._name
 
     async def read(self):
-        return await self.read_signals.read(self.signal_prefix)
+        with batched_reads():
+            reading = await self.read_signals.read(self.signal_prefix)
+        if self._asset_writer is not None:
+            for key in await self._external_keys():
+                value = reading[key]["value"]
+                if value is None:  # e.g. an attribute of INVALID quality
+                    continue  # left as None, with no frame written
+                reading[key]["value"] = self._asset_writer.write(key, value)
+        return reading
 
     async def describe(self):
-        return await self.read_signals.describe(self.signal_prefix)
+        description = await self.read_signals.describe(self.signal_prefix)
+        if self._asset_writer is not None:
+            for key in await self._external_keys(description):
+                description[key]["external"] = "FILESTORE:"
+        return description
+
+    def write_arrays_externally(self, directory: str,
+                                signals: Optional[Iterable[str]] = None):
+        '''Writes the values of the read signals named in signals, or of
+        every array valued read signal, to a file per signal and run in
+        directory, putting datum references in event documents in place of
+        the values. The resource and datum documents are collected by the
+        RunEngine from collect_asset_docs().'''
+        self._asset_writer = ExternalAssetWriter(directory)
+        self._external_signals = set(signals) if signals is not None \
+            else None
+
+    def write_arrays_inline(self):
+        if self._asset_writer is not None:
+            self._asset_writer.close()
+        self._asset_writer = None
+
+    async def _external_keys(self, description=None) -> Set[str]:
+        if self._external_signals is not None:
+            return {self._get_unique_name(name)
+                    for name in self._external_signals}
+        if description is None:  # descriptors are cached, so this is cheap
+            description = await self.read_signals.describe(
+                self.signal_prefix)
+        return {key for key, descriptor in description.items()
+                if descriptor["shape"]}
+
+    def collect_asset_docs(self):
+        if self._asset_writer is not None:
+            yield from self._asset_writer.collect_asset_docs()
+
+    def stage(self):
+        if self._asset_writer is not None:
+            self._asset_writer.open_run()
+        return [self]
+
+    def unstage(self):
+        if self._asset_writer is not None:
+            self._asset_writer.close()
+        return [self]
 
     async def read_configuration(self):
-        return await self.conf_signals.read(self.signal_prefix)
+        with batched_reads():
+            return await self.conf_signals.read(self.signal_prefix)
 
     async def describe_configuration(self):
         return await self.conf_signals.describe(self.signal_prefix)
@@ -0,0 +1,247 @@
+import asyncio
+import functools
+import random
+import time
+import weakref
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+from PyTango import DevError, DevFailed  # type: ignore
+from .pool import ProxyPool
+from .polling import PolledEvent
+from .proxy import DeviceProxy, ProxyWrapper
+from .signals import get_proxy_pools
+
+_distributions = ('uniform', 'normal', 'exponential', 'lognormal')
+
+
+def injected_fault(reason: str, desc: str) -> DevFailed:
+    error = DevError()
+    error.reason = reason
+    error.desc = desc
+    error.origin = 'FaultInjector'
+    return DevFailed(error)
+
+
+class FaultProfile:
+    """
+    FaultProfile(latency: float = 0.0, jitter: float = 0.0,
+                 distribution: str = 'uniform', error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_time: float = 3.0,
+                 drop_rate: float = 0.0)
+    How a device answers under a FaultInjector. Each call is delayed by
+    latency seconds, varied according to distribution: 'uniform' adds up to
+    jitter either way, 'normal' takes jitter as the standard deviation,
+    'exponential' has a mean of latency, and 'lognormal' a median of latency
+    and jitter as the sigma of the underlying normal distribution. A
+    fraction stall_rate of calls stall for a further stall_time seconds, a
+    fraction error_rate raise DevFailed, and a fraction drop_rate of events
+    are not delivered.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 distribution: str = 'uniform', error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_time: float = 3.0,
+                 drop_rate: float = 0.0):
+        if distribution not in _distributions:
+            raise ValueError(f"Unknown latency distribution {distribution},"
+                             f" expected one of {_distributions}")
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.drop_rate = drop_rate
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.distribution == 'uniform':
+            delay = self.latency + rng.uniform(-self.jitter, self.jitter)
+        elif self.distribution == 'normal':
+            delay = rng.gauss(self.latency, self.jitter)
+        elif self.distribution == 'exponential':
+            delay = rng.expovariate(1 / self.latency) if self.latency else 0
+        else:
+            delay = self.latency * rng.lognormvariate(0, self.jitter)
+        return max(delay, 0.0)
+
+
+class FaultInjector:
+    """
+    FaultInjector(seed: Optional[int] = None)
+    Holds the FaultProfiles applied by FaultInjectingProxies, set for all
+    devices or for a device, attribute or operation with set_profile(), and
+    counts the faults injected. restart() simulates a device server
+    restart. Given a seed, the same faults are injected on every run.
+    """
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self._profiles: Dict[Tuple[Optional[str], Optional[str],
+                                   Optional[str]], FaultProfile] = {}
+        self._down_until: Dict[str, float] = {}
+        self._proxies: 'weakref.WeakSet[FaultInjectingProxy]' = \
+            weakref.WeakSet()
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float))
+
+    def set_profile(self, profile: FaultProfile, device: Optional[str] = None,
+                    attribute: Optional[str] = None,
+                    operation: Optional[str] = None):
+        '''Applies profile to the calls matching device, attribute and
+        operation (such as 'read', 'write' or 'command'), any of which
+        may be None to match all. The most specific profile is used.'''
+        self._profiles[(device, attribute and attribute.lower(),
+                        operation)] = profile
+
+    def clear_profiles(self):
+        self._profiles = {}
+
+    def profile_for(self, device: str, attribute: str,
+                    operation: str) -> Optional[FaultProfile]:
+        attribute = attribute.lower()
+        for key in ((device, attribute, operation), (device, attribute, None),
+                    (device, None, operation), (device, None, None),
+                    (None, attribute, operation), (None, attribute, None),
+                    (None, None, operation), (None, None, None)):
+            if key in self._profiles:
+                return self._profiles[key]
+        return None
+
+    def is_down(self, device: str) -> bool:
+        down_until = self._down_until.get(device)
+        if down_until is None:
+            return False
+        if time.monotonic() < down_until:
+            return True
+        del self._down_until[device]
+        return False
+
+    def restart(self, device: str, downtime: float = 1.0):
+        '''Simulates a restart of the server of device: its subscriptions
+        receive an error event and no further events, and every call fails
+        for downtime seconds'''
+        self._down_until[device] = time.monotonic() + downtime
+        self._stats[device]['restarts'] += 1
+        for proxy in list(self._proxies):
+            if proxy.dev_name == device:
+                proxy._lose_subscriptions()
+
+    async def inject(self, device: str, attribute: str, operation: str):
+        '''Waits for, or raises, the faults of a call'''
+        stats = self._stats[device]
+        stats['calls'] += 1
+        if self.is_down(device):
+            stats['refused'] += 1
+            raise injected_fault('API_CantConnectToDevice',
+                                 f"{device} is restarting")
+        profile = self.profile_for(device, attribute, operation)
+        if profile is None:
+            return
+        delay = profile.sample_latency(self.rng)
+        if profile.stall_rate and self.rng.random() < profile.stall_rate:
+            stats['stalls'] += 1
+            delay += profile.stall_time
+        stats['delay'] += delay
+        await asyncio.sleep(delay)
+        if profile.error_rate and self.rng.random() < profile.error_rate:
+            stats['errors'] += 1
+            raise injected_fault('API_InjectedFault',
+                                 f"Injected failure of {operation} of"
+                                 f" {device}/{attribute}")
+
+    def drop_event(self, device: str, attribute: str) -> bool:
+        profile = self.profile_for(device, attribute, 'event')
+        if self.is_down(device) or (
+                profile and profile.drop_rate
+                and self.rng.random() < profile.drop_rate):
+            self._stats[device]['dropped_events'] += 1
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        '''Returns, for each device, the number of calls, the calls refused
+        while restarting, the stalls, errors, dropped events and restarts
+        injected, and the total delay added in seconds'''
+        return {device: dict(stats) for device, stats in self._stats.items()}
+
+
+class FaultInjectingProxy(ProxyWrapper):
+    """
+    FaultInjectingProxy(proxy: DeviceProxy, dev_name: str,
+                        injector: FaultInjector)
+    ProxyWrapper delaying, stalling or failing calls and dropping events
+    as set in a FaultInjector, in front of a SimProxy or any other
+    DeviceProxy.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str,
+                 injector: FaultInjector):
+        super().__init__(proxy, dev_name)
+        self.injector = injector
+        self._generation = 0
+        self._callbacks: Dict[int, Tuple[str, Callable]] = {}
+        injector._proxies.add(self)
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        await self.injector.inject(self.dev_name,
+                                   attr_names[0] if attr_names else '',
+                                   operation)
+        return await super()._call(operation, attr_names, method,
+                                   *args, **kwargs)
+
+    def _wrap_callback(self, attr_name: str, event_type,
+                       callback: Callable) -> Callable:
+        injector, dev_name = self.injector, self.dev_name
+        generation = self._generation
+
+        def faulty_callback(event):
+            # subscriptions made before a restart receive no more events
+            if generation != self._generation or \
+                    injector.drop_event(dev_name, attr_name):
+                return
+            return callback(event)
+        return super()._wrap_callback(attr_name, event_type, faulty_callback)
+
+    async def subscribe_event(self, attr_name, event_type, callback,
+                              *args, **kwargs):
+        sub_id = await super().subscribe_event(attr_name, event_type,
+                                               callback, *args, **kwargs)
+        if callback:
+            self._callbacks[sub_id] = (attr_name, callback)
+        return sub_id
+
+    def unsubscribe_event(self, sub_id):
+        self._callbacks.pop(sub_id, None)
+        return super().unsubscribe_event(sub_id)
+
+    def _lose_subscriptions(self):
+        self._generation += 1
+        error = injected_fault('API_EventTimeout',
+                               f"Event channel of {self.dev_name} is not"
+                               f" responding")
+        for attr_name, callback in list(self._callbacks.values()):
+            callback(PolledEvent(attr_name, errors=(error,)))
+
+
+_fault_injectors: Dict[ProxyPool, Callable] = {}
+
+
+def enable_fault_injection(injector: Optional[FaultInjector] = None,
+                           pool: Optional[ProxyPool] = None
+                           ) -> FaultInjector:
+    '''Injects the faults of injector, a new FaultInjector by default, into
+    every proxy created from now on by pool, or by both the pools used by
+    _get_device_proxy if no pool is given. Returns the injector.'''
+    injector = injector or FaultInjector()
+    for pool in [pool] if pool is not None else get_proxy_pools():
+        disable_fault_injection(pool)
+        _fault_injectors[pool] = functools.partial(FaultInjectingProxy,
+                                                   injector=injector)
+        pool.add_wrapper(_fault_injectors[pool])
+    return injector
+
+
+def disable_fault_injection(pool: Optional[ProxyPool] = None):
+    pools: List[ProxyPool] = [pool] if pool is not None \
+        else get_proxy_pools()
+    for pool in pools:
+        if pool in _fault_injectors:
+            pool.remove_wrapper(_fault_injectors.pop(pool))
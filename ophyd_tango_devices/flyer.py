@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from typing import Dict, Iterator, Set
+import numpy as np  # type: ignore
+from bluesky.protocols import Descriptor, Flyable
+from ophyd.v2.core import AsyncStatus  # type: ignore
+from PyTango._tango import EventType  # type: ignore
+from .buffers import RingBuffer
+from .signals import TangoAttrR
+from .subscriptions import get_subscription_registry
+
+
+class TangoFlyer(Flyable):
+    """
+    TangoFlyer(signals: Dict[str, TangoAttrR], name: str,
+               capacity: int = 100000,
+               event_type: EventType = EventType.CHANGE_EVENT)
+    Fly scanning device that records every event of the given attribute
+    signals between kickoff() and complete(). Values are kept with their
+    Tango timestamps in a preallocated RingBuffer of capacity entries per
+    signal, and are handed to bluesky in bulk, one event page per signal, by
+    collect_pages() (or as single events by collect()). Each signal's values
+    form their own stream, named by its data key. With event_type
+    DATA_READY_EVENT the attribute is read whenever the device reports that
+    new data is ready.
+    """
+    def __init__(self, signals: Dict[str, TangoAttrR], name: str,
+                 capacity: int = 100000,
+                 event_type: EventType = EventType.CHANGE_EVENT):
+        self._signals = signals
+        self._name = name
+        self.parent = None
+        self.capacity = capacity
+        self.event_type = event_type
+        self._buffers: Dict[str, RingBuffer] = {}
+        self._descriptions: Dict[str, Descriptor] = {}
+        self._tokens: Dict[str, int] = {}
+        self._pending_reads: Set[asyncio.Future] = set()
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _get_unique_name(self, signal_name: str) -> str:
+        return f'{self.name}-{signal_name}'
+
+    @property
+    def dropped(self) -> int:
+        '''The number of values overwritten before they were collected'''
+        return sum(buffer.dropped for buffer in self._buffers.values())
+
+    def kickoff(self) -> AsyncStatus:
+        return AsyncStatus(self._kickoff())
+
+    async def _kickoff(self):
+        if self._tokens:
+            raise RuntimeError(f"{self.name} has already been kicked off")
+        for signal_name, signal in self._signals.items():
+            descriptor = dict(await signal.get_descriptor())
+            key = self._get_unique_name(signal_name)
+            self._descriptions[key] = descriptor  # type: ignore
+            if key not in self._buffers:
+                # strings have no numpy dtype, so are held as objects
+                dtype = descriptor.get('dtype_numpy') or object
+                # spectra and images may be smaller than their max_dim_x
+                # and max_dim_y, which give the shape in the descriptor
+                self._buffers[key] = RingBuffer(
+                    self.capacity, descriptor['shape'], dtype,
+                    ragged=bool(descriptor['shape']))
+        for signal_name, signal in self._signals.items():
+            registry = get_subscription_registry(signal._proxy_)
+            callback = self._make_callback(
+                signal, self._buffers[self._get_unique_name(signal_name)])
+            self._tokens[signal_name] = await registry.subscribe(
+                signal._signal_name, self.event_type, callback)
+
+    def _make_callback(self, signal: TangoAttrR, buffer: RingBuffer):
+        if self.event_type == EventType.DATA_READY_EVENT:
+            def on_data_ready(event):
+                if getattr(event, 'err', False):
+                    self.errors += 1
+                    return
+                read = asyncio.ensure_future(self._read_into(signal, buffer))
+                self._pending_reads.add(read)
+                read.add_done_callback(self._pending_reads.discard)
+            return on_data_ready
+
+        def on_event(event):
+            if getattr(event, 'err', False) or event.attr_value is None:
+                self.errors += 1
+                return
+            buffer.append(event.attr_value.value,
+                          event.attr_value.time.totime())
+        return on_event
+
+    async def _read_into(self, signal: TangoAttrR, buffer: RingBuffer):
+        try:
+            attr_data = await signal._read_attribute()
+        except Exception:
+            self.errors += 1
+            logging.exception(f"{self.name} could not read"
+                              f" {signal._signal_name} on data ready")
+        else:
+            buffer.append(attr_data.value, attr_data.time.totime())
+
+    def complete(self) -> AsyncStatus:
+        return AsyncStatus(self._complete())
+
+    async def _complete(self):
+        for signal_name, token in self._tokens.items():
+            signal = self._signals[signal_name]
+            get_subscription_registry(signal._proxy_).unsubscribe(token)
+        self._tokens = {}
+        if self._pending_reads:
+            await asyncio.gather(*self._pending_reads)
+
+    async def describe_collect(self) -> Dict[str, Dict[str, Descriptor]]:
+        if not self._descriptions:
+            for signal_name, signal in self._signals.items():
+                self._descriptions[self._get_unique_name(signal_name)] = \
+                    await signal.get_descriptor()
+        return {key: {key: descriptor}
+                for key, descriptor in self._descriptions.items()}
+
+    def collect_pages(self) -> Iterator[Dict]:
+        '''Yields an event page of the values buffered for each signal since
+        the last collection'''
+        for key, buffer in self._buffers.items():
+            if not len(buffer):
+                continue
+            values, timestamps = buffer.drain()
+            timestamp_list = timestamps.tolist()
+            if values.dtype == object:  # may hold arrays, of ragged buffers
+                value_list = [value.tolist()
+                              if isinstance(value, np.ndarray) else value
+                              for value in values]
+            else:
+                value_list = values.tolist()
+            yield {'time': timestamp_list,
+                   'data': {key: value_list},
+                   'timestamps': {key: timestamp_list}}
+
+    def collect(self) -> Iterator[Dict]:
+        for page in self.collect_pages():
+            [(key, values)] = page['data'].items()
+            for value, timestamp in zip(values, page['time']):
+                yield {'time': timestamp, 'data': {key: value},
+                       'timestamps': {key: timestamp}}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        '''Returns the number of values received, currently buffered and
+        dropped for each data key'''
+        return {key: {'appended': buffer.appended,
+                      'buffered': len(buffer),
+                      'dropped': buffer.dropped}
+                for key, buffer in self._buffers.items()}
@@ -0,0 +1,289 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set
+from PyTango._tango import (AttrDataFormat, AttrWriteType,  # type: ignore
+                            CmdArgType)
+from .proxy import DeviceProxy
+from .introspection import (get_attribute_list, get_command_list,
+                            get_pipe_list, run_blocking)
+
+_config_enums = {'data_format': AttrDataFormat, 'data_type': CmdArgType,
+                 'writable': AttrWriteType}
+_config_fields = ('name', 'data_format', 'data_type', 'writable', 'max_dim_x',
+                  'max_dim_y', 'unit', 'min_value', 'max_value')
+_alarm_fields = ('min_alarm', 'max_alarm', 'min_warning', 'max_warning')
+
+
+def _config_to_dict(config) -> Dict[str, Any]:
+    fields = {}
+    for field in _config_fields + _alarm_fields:
+        value = getattr(config, field, None)
+        fields[field] = int(value) if field in _config_enums \
+            and value is not None else value
+    return fields
+
+
+def _config_from_dict(fields: Dict[str, Any]) -> SimpleNamespace:
+    '''Rebuilds an object with the fields of an AttributeInfoEx that are
+    kept in the cache'''
+    config = SimpleNamespace(**fields)
+    for field, enum in _config_enums.items():
+        if fields.get(field) is not None:
+            setattr(config, field, enum.values[fields[field]])
+    config.alarms = SimpleNamespace(
+        **{field: fields.get(field) for field in _alarm_fields})
+    return config
+
+
+class DeviceInterface:
+    """
+    DeviceInterface(attributes, commands, pipes, attribute_configs,
+                    fingerprint)
+    The names of the attributes, commands and pipes exported by a device and
+    its attribute configurations, as kept by the InterfaceCache. Name lookups
+    are case insensitive, as they are in Tango.
+    """
+    def __init__(self, attributes: List[str], commands: List[str],
+                 pipes: List[str], attribute_configs: Dict[str, Any],
+                 fingerprint: str):
+        self.attributes = list(attributes)
+        self.commands = list(commands)
+        self.pipes = list(pipes)
+        self.fingerprint = fingerprint
+        self._configs = {name.lower(): config
+                         for name, config in attribute_configs.items()}
+        self._attribute_names = {name.lower() for name in self.attributes}
+        self._command_names = {name.lower() for name in self.commands}
+        self._pipe_names = {name.lower() for name in self.pipes}
+
+    def has_attribute(self, attr_name: str) -> bool:
+        return attr_name.lower() in self._attribute_names
+
+    def has_command(self, command: str) -> bool:
+        return command.lower() in self._command_names
+
+    def has_pipe(self, pipe_name: str) -> bool:
+        return pipe_name.lower() in self._pipe_names
+
+    def attribute_config(self, attr_name: str):
+        return self._configs.get(attr_name.lower())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'fingerprint': self.fingerprint,
+                'attributes': self.attributes,
+                'commands': self.commands,
+                'pipes': self.pipes,
+                'attribute_configs': {
+                    config.name: _config_to_dict(config)
+                    for config in self._configs.values()}}
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> 'DeviceInterface':
+        return cls(entry['attributes'], entry['commands'], entry['pipes'],
+                   {name: _config_from_dict(fields) for name, fields
+                    in entry['attribute_configs'].items()},
+                   entry['fingerprint'])
+
+
+async def _interface_fingerprint(proxy: DeviceProxy, dev_name: str) -> str:
+    '''Identifies the running instance of a device's server, from the
+    server name, its version and the time it was started'''
+    def device_info():
+        return proxy.get_device_db().get_device_info(dev_name)
+    info = await run_blocking(device_info)
+    return f'{info.ds_full_name}|{info.version}|{info.started_date}'
+
+
+async def _introspect(proxy: DeviceProxy, dev_name: str) -> DeviceInterface:
+    fingerprint, attributes, commands, pipes = await asyncio.gather(
+        _interface_fingerprint(proxy, dev_name), get_attribute_list(proxy),
+        get_command_list(proxy), get_pipe_list(proxy))
+    configs = await proxy.get_attribute_config(attributes) \
+        if attributes else []
+    return DeviceInterface(attributes, commands, pipes,
+                           {config.name: config for config in configs},
+                           fingerprint)
+
+
+class InterfaceCache:
+    """
+    InterfaceCache(path: Optional[str] = None)
+    Keeps the DeviceInterface of each device in a JSON file, keyed by the
+    Tango host and device name, so that signals can be connected in later
+    sessions without introspecting each device. A cached interface is used
+    straight away, and is revalidated in the background, once per session,
+    by comparing the server's name, version and start time with those it
+    was cached with. Interfaces that are found to be stale are replaced in
+    the cache for the next session.
+    """
+    save_delay = 1.0
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(
+            os.path.expanduser('~'), '.cache', 'ophyd_tango_devices',
+            'interfaces.json')
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._interfaces: Dict[str, DeviceInterface] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._validated: Set[str] = set()
+        self._dirty = False
+        self._save_scheduled = False
+        self.stats = {'hits': 0, 'misses': 0, 'fresh': 0, 'stale': 0}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as cache_file:
+                    self._entries = json.load(cache_file)
+            except (OSError, ValueError):
+                logging.warning(f"Ignoring unreadable interface cache"
+                                f" {self.path}")
+
+    @staticmethod
+    def _key(proxy: DeviceProxy, dev_name: str) -> str:
+        return f'{proxy.get_db_host()}:{proxy.get_db_port()}/{dev_name}'
+
+    def get_cached(self, proxy: DeviceProxy,
+                   dev_name: str) -> Optional[DeviceInterface]:
+        '''Returns the cached interface of the device, if any, without any
+        network calls, scheduling its revalidation if an event loop is
+        running'''
+        key = self._key(proxy, dev_name)
+        if key not in self._interfaces:
+            if key not in self._entries:
+                return None
+            self._interfaces[key] = DeviceInterface.from_dict(
+                self._entries[key])
+        if key not in self._validated:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                self._validated.add(key)
+                asyncio.ensure_future(self.revalidate(proxy, dev_name))
+        return self._interfaces[key]
+
+    async def get(self, proxy: DeviceProxy,
+                  dev_name: str) -> DeviceInterface:
+        interface = self.get_cached(proxy, dev_name)
+        if interface is not None:
+            self.stats['hits'] += 1
+            return interface
+        self.stats['misses'] += 1
+        key = self._key(proxy, dev_name)
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(
+                self.refresh(proxy, dev_name))
+        try:
+            return await asyncio.shield(self._pending[key])
+        finally:
+            self._pending.pop(key, None)
+
+    async def refresh(self, proxy: DeviceProxy,
+                      dev_name: str) -> DeviceInterface:
+        '''Introspects the device and replaces its cached interface'''
+        key = self._key(proxy, dev_name)
+        interface = await _introspect(proxy, dev_name)
+        self._interfaces[key] = interface
+        self._entries[key] = interface.to_dict()
+        self._validated.add(key)
+        self._mark_dirty()
+        return interface
+
+    async def revalidate(self, proxy: DeviceProxy, dev_name: str) -> bool:
+        '''Returns True if the cached interface of the device is still that
+        of the running server, otherwise refreshes it and returns False'''
+        key = self._key(proxy, dev_name)
+        try:
+            fingerprint = await _interface_fingerprint(proxy, dev_name)
+        except Exception:
+            logging.exception(f"Could not revalidate interface of {key}")
+            return False
+        if key in self._interfaces and \
+                self._interfaces[key].fingerprint == fingerprint:
+            self.stats['fresh'] += 1
+            return True
+        self.stats['stale'] += 1
+        logging.warning(f"Cached interface of {dev_name} is out of date,"
+                        f" it will be refreshed for the next connection")
+        await self.refresh(proxy, dev_name)
+        return False
+
+    def invalidate(self, dev_name: Optional[str] = None):
+        '''Forgets the cached interface of all devices with the given name,
+        or of every device'''
+        for key in list(self._entries):
+            if dev_name is None or key.endswith('/' + dev_name):
+                del self._entries[key]
+                self._interfaces.pop(key, None)
+                self._validated.discard(key)
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._save_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+        else:
+            self._save_scheduled = True
+            loop.call_later(self.save_delay, self.save_if_dirty)
+
+    def save_if_dirty(self):
+        self._save_scheduled = False
+        if self._dirty:
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump(self._entries, cache_file)
+        os.replace(temporary_path, self.path)
+        self._dirty = False
+
+
+_interface_cache: Optional[InterfaceCache] = None
+
+
+def enable_interface_cache(path: Optional[str] = None) -> InterfaceCache:
+    '''Makes signals and connectors take device interfaces from an
+    InterfaceCache kept at path'''
+    global _interface_cache
+    disable_interface_cache()
+    _interface_cache = InterfaceCache(path)
+    return _interface_cache
+
+
+def disable_interface_cache():
+    global _interface_cache
+    if _interface_cache is not None:
+        _interface_cache.save_if_dirty()
+    _interface_cache = None
+
+
+def get_interface_cache() -> Optional[InterfaceCache]:
+    return _interface_cache
+
+
+@atexit.register
+def _save_interface_cache():
+    # only the enabled cache is saved on exit, others are saved by save()
+    if _interface_cache is not None:
+        _interface_cache.save_if_dirty()
+
+
+async def get_device_interface(proxy: DeviceProxy,
+                               dev_name: str) -> Optional[DeviceInterface]:
+    '''Returns the interface of the device from the enabled InterfaceCache,
+    or None if the cache is not enabled'''
+    if _interface_cache is None:
+        return None
+    return await _interface_cache.get(proxy, dev_name)
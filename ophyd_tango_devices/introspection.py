@@ -0,0 +1,47 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from .proxy import DeviceProxy
+
+max_introspection_workers = 16
+_introspection_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _introspection_executor
+    if _introspection_executor is None:
+        _introspection_executor = ThreadPoolExecutor(
+            max_workers=max_introspection_workers,
+            thread_name_prefix='tango-introspection')
+    return _introspection_executor
+
+
+async def run_blocking(func: Callable, *args):
+    '''Runs a blocking call, such as a synchronous DeviceProxy or Database
+    method, in the introspection executor so that it does not stall the
+    event loop'''
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_executor(), functools.partial(func, *args))
+
+
+async def introspect(proxy: DeviceProxy, method_name: str, *args):
+    '''Awaitable version of a synchronous introspection method of proxy.
+    Proxies that answer locally (with blocking_introspection set to False,
+    such as SimProxy) are called directly.'''
+    method = getattr(proxy, method_name)
+    if not getattr(proxy, 'blocking_introspection', True):
+        return method(*args)
+    return await run_blocking(method, *args)
+
+
+async def get_attribute_list(proxy: DeviceProxy) -> List[str]:
+    return list(await introspect(proxy, 'get_attribute_list'))
+
+
+async def get_command_list(proxy: DeviceProxy) -> List[str]:
+    return list(await introspect(proxy, 'get_command_list'))
+
+
+async def get_pipe_list(proxy: DeviceProxy) -> List[str]:
+    return list(await introspect(proxy, 'get_pipe_list'))
@@ -0,0 +1,140 @@
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+import numpy as np  # type: ignore
+from .pool import ProxyHelper, ProxyHelpers
+from .proxy import DeviceProxy
+from .signal_index import get_signal_index
+
+
+class OutsideLimitsError(ValueError):
+    ...
+
+
+def _parse_limit(limit) -> Optional[float]:
+    # Tango gives limits as strings, 'Not specified' when they are unset
+    if limit is None:
+        return None
+    try:
+        return float(limit)
+    except (TypeError, ValueError):
+        return None
+
+
+class AttributeLimits:
+    """
+    AttributeLimits(min_value=None, max_value=None, min_alarm=None,
+                    max_alarm=None, min_warning=None, max_warning=None)
+    The limits of an attribute as floats, or None where they are not
+    specified. Values outside min_value and max_value can not be written.
+    """
+    names = ('min_value', 'max_value', 'min_alarm', 'max_alarm',
+             'min_warning', 'max_warning')
+
+    def __init__(self, min_value: Optional[float] = None,
+                 max_value: Optional[float] = None,
+                 min_alarm: Optional[float] = None,
+                 max_alarm: Optional[float] = None,
+                 min_warning: Optional[float] = None,
+                 max_warning: Optional[float] = None):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.min_alarm = min_alarm
+        self.max_alarm = max_alarm
+        self.min_warning = min_warning
+        self.max_warning = max_warning
+
+    @classmethod
+    def from_config(cls, config) -> 'AttributeLimits':
+        '''Parses the limits from an AttributeInfoEx'''
+        alarms = getattr(config, 'alarms', None)
+        limits = {}
+        for name in cls.names:
+            limit = getattr(alarms, name, None)
+            if limit is None:
+                limit = getattr(config, name, None)
+            limits[name] = _parse_limit(limit)
+        return cls(**limits)
+
+    def __repr__(self) -> str:
+        limits = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self.names)
+        return f'AttributeLimits({limits})'
+
+    def outside(self, values) -> np.ndarray:
+        '''Returns a boolean array marking the values outside min_value and
+        max_value'''
+        values = np.asarray(values, dtype=float)
+        outside = np.zeros(values.shape, dtype=bool)
+        if self.min_value is not None:
+            outside |= values < self.min_value
+        if self.max_value is not None:
+            outside |= values > self.max_value
+        return outside
+
+    def check(self, values, attr_name: str = 'value'):
+        '''Raises OutsideLimitsError if any of the values, a scalar or an
+        array such as a scan trajectory, is outside min_value and
+        max_value'''
+        outside = self.outside(values)
+        if not outside.any():
+            return
+        if outside.ndim == 0:
+            message = f"{attr_name} {values} is"
+        else:
+            index = int(np.flatnonzero(outside)[0])
+            message = (f"{int(outside.sum())} of {outside.size} values of"
+                       f" {attr_name} are outside its limits, the first"
+                       f" {np.ravel(values)[index]} at index {index}, which"
+                       f" is")
+        raise OutsideLimitsError(f"{message} outside the limits"
+                                 f" [{self.min_value}, {self.max_value}]")
+
+
+class LimitsCache(ProxyHelper):
+    """
+    LimitsCache(proxy: DeviceProxy, dev_name: str)
+    Shared record of the limits of the attributes of a single DeviceProxy.
+    The limits of an attribute are parsed from its configuration in the
+    SignalIndex, which is watched from first use so that ATTR_CONF_EVENTs
+    keep it up to date, and parsed again only when it changes. Checking
+    values against them makes no network calls.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str):
+        super().__init__(proxy)
+        self.dev_name = dev_name
+        self._index = get_signal_index(proxy, dev_name)
+        self._limits: Dict[str, Tuple[Any, AttributeLimits]] = {}
+        self._watches: Dict[str, asyncio.Future] = {}
+        self.fetches = 0
+
+    def cached(self, attr_name: str) -> Optional[AttributeLimits]:
+        limits = self._limits.get(attr_name.lower())
+        config = self._index.cached_attribute_config(attr_name)
+        if limits is None or limits[0] is not config:
+            return None
+        return limits[1]
+
+    async def get(self, attr_name: str) -> AttributeLimits:
+        key = attr_name.lower()
+        if key not in self._watches:
+            self._watches[key] = asyncio.ensure_future(
+                self._index.watch_config(attr_name))
+        try:
+            await asyncio.shield(self._watches[key])
+        except Exception:
+            self._watches.pop(key, None)  # watched again on the next check
+            raise
+        config = await self._index.attribute_config(attr_name)
+        limits = self._limits.get(key)
+        if limits is None or limits[0] is not config:
+            self.fetches += 1
+            limits = (config, AttributeLimits.from_config(config))
+            self._limits[key] = limits
+        return limits[1]
+
+
+_limits_caches = ProxyHelpers(LimitsCache)
+
+
+def get_limits_cache(proxy: DeviceProxy, dev_name: str) -> LimitsCache:
+    return _limits_caches.get(proxy, dev_name)
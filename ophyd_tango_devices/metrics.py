@@ -0,0 +1,252 @@
+import bisect
+import functools
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from .pool import ProxyPool
+from .proxy import DeviceProxy, ProxyWrapper
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _OperationMetrics:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.bucket_counts = [0] * (len(buckets) + 1)  # the last is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.timeouts = 0
+        self.first = 0.0
+        self.last = 0.0
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry(buckets: Tuple[float, ...] = DEFAULT_BUCKETS)
+    In-process record of the calls made to Tango devices and the events
+    they send, kept per (device, signal, operation): a histogram of
+    latencies in seconds with the given bucket bounds, and counts of errors
+    and timeouts. Events are recorded under the operation 'event', with the
+    time spent in their callbacks as the latency, and their rate is given
+    by snapshot(). The registry may be read from other threads, such as
+    that of the HTTP server started by serve_prometheus().
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._metrics: Dict[Tuple[str, str, str], _OperationMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple[str, str, str]) -> _OperationMetrics:
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = self._metrics[key] = _OperationMetrics(self.buckets)
+        return metrics
+
+    def observe(self, device: str, signal: str, operation: str,
+                latency: float, error: bool = False):
+        '''Records a call or event taking latency seconds'''
+        now = time.monotonic()
+        with self._lock:
+            metrics = self._get((device, signal, operation))
+            metrics.bucket_counts[
+                bisect.bisect_left(self.buckets, latency)] += 1
+            metrics.count += 1
+            metrics.total += latency
+            if error:
+                metrics.errors += 1
+            if not metrics.first:
+                metrics.first = now
+            metrics.last = now
+
+    def record_timeout(self, device: str, signal: str, operation: str):
+        with self._lock:
+            self._get((device, signal, operation)).timeouts += 1
+
+    def clear(self):
+        with self._lock:
+            self._metrics = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Dict]]]:
+        '''Returns the metrics as a dictionary nested by device, signal and
+        operation, holding the count, total and mean latency, errors,
+        timeouts, rate (per second, between the first and last calls) and
+        the cumulative count in each histogram bucket'''
+        with self._lock:
+            items = [(key, metrics, list(metrics.bucket_counts))
+                     for key, metrics in self._metrics.items()]
+        snapshot: Dict[str, Dict[str, Dict[str, Dict]]] = {}
+        for (device, signal, operation), metrics, bucket_counts in items:
+            span = metrics.last - metrics.first
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (float('inf'),),
+                                    bucket_counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            snapshot.setdefault(device, {}).setdefault(signal, {})[
+                operation] = {
+                    'count': metrics.count,
+                    'total': metrics.total,
+                    'mean': metrics.total / metrics.count
+                    if metrics.count else 0.0,
+                    'errors': metrics.errors,
+                    'timeouts': metrics.timeouts,
+                    'rate': (metrics.count - 1) / span if span else 0.0,
+                    'buckets': buckets}
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        '''Returns the metrics in the Prometheus text exposition format'''
+        lines: List[str] = [
+            '# HELP tango_operation_seconds Latency of Tango device calls'
+            ' and event callbacks',
+            '# TYPE tango_operation_seconds histogram']
+        errors, timeouts = [], []
+        for device, signals in self.snapshot().items():
+            for signal, operations in signals.items():
+                for operation, metrics in operations.items():
+                    labels = (f'device="{_escape(device)}",'
+                              f'signal="{_escape(signal)}",'
+                              f'operation="{_escape(operation)}"')
+                    for bound, count in metrics['buckets'].items():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'tango_operation_seconds_bucket'
+                                     f'{{{labels},le="{le}"}} {count}')
+                    lines.append(f'tango_operation_seconds_sum{{{labels}}}'
+                                 f' {metrics["total"]!r}')
+                    lines.append(f'tango_operation_seconds_count{{{labels}}}'
+                                 f' {metrics["count"]}')
+                    errors.append(f'tango_operation_errors_total{{{labels}}}'
+                                  f' {metrics["errors"]}')
+                    timeouts.append(f'tango_operation_timeouts_total'
+                                    f'{{{labels}}} {metrics["timeouts"]}')
+        lines += ['# HELP tango_operation_errors_total Failed Tango device'
+                  ' calls and error events',
+                  '# TYPE tango_operation_errors_total counter'] + errors
+        lines += ['# HELP tango_operation_timeouts_total Tango device calls'
+                  ' that exceeded their deadline',
+                  '# TYPE tango_operation_timeouts_total counter'] + timeouts
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        '''Writes the metrics to path in the Prometheus text format, for
+        example for the textfile collector of the node exporter. The file is
+        replaced atomically, so it is never read half written.'''
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(self.to_prometheus())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def serve_prometheus(self, port: int = 9464,
+                         host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        '''Serves the metrics over HTTP from a daemon thread, returning the
+        server, whose shutdown() method stops it'''
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+_metrics_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _metrics_registry
+
+
+class MetricsProxy(ProxyWrapper):
+    """
+    MetricsProxy(proxy: DeviceProxy, dev_name: str,
+                 registry: Optional[MetricsRegistry] = None)
+    ProxyWrapper recording the latency and outcome of every call, and of
+    every event callback, in a MetricsRegistry (by default the one returned
+    by get_metrics_registry()). A call on several attributes, such as
+    read_attributes, is recorded against each of them.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str,
+                 registry: Optional[MetricsRegistry] = None):
+        super().__init__(proxy, dev_name)
+        self.registry = registry or get_metrics_registry()
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        error = True
+        try:
+            result = await super()._call(operation, attr_names, method,
+                                         *args, **kwargs)
+            error = False
+            return result
+        finally:
+            latency = time.perf_counter() - start
+            for attr_name in attr_names:
+                self.registry.observe(self.dev_name, attr_name, operation,
+                                      latency, error)
+
+    def _wrap_callback(self, attr_name: str, event_type,
+                       callback: Callable) -> Callable:
+        registry, dev_name = self.registry, self.dev_name
+
+        def timed_callback(event):
+            start = time.perf_counter()
+            try:
+                return callback(event)
+            finally:
+                registry.observe(dev_name, attr_name, 'event',
+                                 time.perf_counter() - start,
+                                 bool(getattr(event, 'err', False)))
+        return super()._wrap_callback(attr_name, event_type, timed_callback)
+
+
+_metrics_wrappers: Dict[ProxyPool, Callable] = {}
+
+
+def _default_pools() -> List[ProxyPool]:
+    # imported here as signals will itself record metrics
+    from .signals import get_proxy_pools
+    return get_proxy_pools()
+
+
+def enable_metrics(pool: Optional[ProxyPool] = None,
+                   registry: Optional[MetricsRegistry] = None):
+    '''Records metrics in registry for every proxy created from now on by
+    pool, or by both the pools used by _get_device_proxy if no pool is
+    given'''
+    for pool in [pool] if pool is not None else _default_pools():
+        if pool not in _metrics_wrappers:
+            _metrics_wrappers[pool] = functools.partial(MetricsProxy,
+                                                        registry=registry)
+            pool.add_wrapper(_metrics_wrappers[pool])
+
+
+def disable_metrics(pool: Optional[ProxyPool] = None):
+    for pool in [pool] if pool is not None else _default_pools():
+        if pool in _metrics_wrappers:
+            pool.remove_wrapper(_metrics_wrappers.pop(pool))
@@ -1,13 +1,15 @@
 from .signals import (TangoAttrRW, TangoCommand, TangoComm,
-                      tango_connector, ConnectWithoutReading)
+                      tango_connector, ConnectWithoutReading, put_attributes)
 from .devices import TangoDevice
+from .buffers import LatestValue
+from .limits import get_limits_cache
 from .proxy import DeviceProxy
 from PyTango._tango import DevState  # type: ignore
 from ophyd.v2.core import SignalCollection, AsyncStatus  # type: ignore
 from bluesky.protocols import Movable
 import re
 import asyncio
-from typing import Optional
+from typing import Dict, Optional, Sequence
 
 
 class TangoMotorComm(TangoComm):
@@ -30,14 +32,15 @@ class TangoMotor(TangoDevice, Movable):
         return SignalCollection(velocity=self.comm.velocity)
 
     async def check_value(self, value):
-        config = await self.comm.position._proxy_.get_attribute_config(
-            self.comm.position.name)
-        if not isinstance(config.min_value, str):
-            assert value >= config.min_value, f"Value {value} is less than"\
-                                              f" min value {config.min_value}"
-        if not isinstance(config.max_value, str):
-            assert value <= config.max_value, f"Value {value} is greater than"\
-                                              f" max value {config.max_value}"
+        '''Raises OutsideLimitsError if value, a position or an array of
+        positions such as a scan trajectory, is outside the limits of the
+        position attribute. The limits are cached, so that this makes no
+        network calls after the first check.'''
+        position = self.comm.position
+        await position._ensure_connected()
+        limits = await get_limits_cache(position._proxy_, position._dev_name
+                                        ).get(position._signal_name)
+        limits.check(value, f"{self.name} position")
 
     @property
     def timeout(self):
@@ -51,23 +54,64 @@ class TangoMotor(TangoDevice, Movable):
 
         async def write_and_wait():
             await self.comm.position.put(value)
-            q = asyncio.Queue()
-            monitor = await self.comm.state.monitor_value(q.put_nowait)
-            while True:
-                state_value = await q.get()
-                if state_value != DevState.MOVING:
-                    monitor.close()
-                    break
+            await self._wait_until_stopped()
         status = AsyncStatus(asyncio.wait_for(
             write_and_wait(), timeout=timeout))
         return status
 
+    async def _wait_until_stopped(self):
+        # only the most recent state matters, so events are coalesced
+        states = LatestValue()
+        monitor = await self.comm.state.monitor_queue(states)
+        try:
+            while await states.get() == DevState.MOVING:
+                pass
+        finally:
+            monitor.close()
+
+
+def move_motors(moves: Dict[TangoMotor, float],
+                timeout: Optional[float] = None) -> AsyncStatus:
+    '''Moves the motors to their positions together, returning a single
+    status that finishes when the last of them has stopped'''
+    async def write_and_wait():
+        await put_attributes([(motor.comm.position, value)
+                              for motor, value in moves.items()])
+        await asyncio.gather(*[motor._wait_until_stopped()
+                               for motor in moves])
+    return AsyncStatus(asyncio.wait_for(write_and_wait(), timeout=timeout))
+
+
+class TangoMotorGroup(Movable):
+    """
+    TangoMotorGroup(motors: Sequence[TangoMotor], name: str)
+    Movable moving several TangoMotors as one, for example the axes of a
+    sample stage. set() takes a position per motor, in order, and moves them
+    with move_motors(), so bps.mv(group, [x, y, z]) costs about as long as
+    the slowest axis.
+    """
+    def __init__(self, motors: Sequence[TangoMotor], name: str):
+        self.motors = list(motors)
+        self._name = name
+        self.parent = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def set(self, values: Sequence[float],
+            timeout: Optional[float] = None) -> AsyncStatus:
+        if len(values) != len(self.motors):
+            raise ValueError(f"{self.name} needs {len(self.motors)} positions"
+                             f", got {len(values)}")
+        return move_motors(dict(zip(self.motors, values)), timeout)
+
 
 @tango_connector
-def motor_connector(comm: TangoMotorComm, proxy: DeviceProxy):
+async def motor_connector(comm: TangoMotorComm, proxy: DeviceProxy):
     connector = ConnectWithoutReading(comm, proxy)
-    connector(position="Position", velocity="Velocity",
-              state="State", stop="Stop")
+    await connector(position="Position", velocity="Velocity",
+                    state="State", stop="Stop")
 
 
 def tango_motor(dev_name: str, name: Optional[str] = None):
@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from .pool import ProxyHelper, ProxyHelpers
+from .proxy import DeviceProxy
+from .values import values_equal
+
+
+class PolledEvent:
+    """
+    PolledEvent(attr_name: str, attr_value=None,
+                errors: Tuple[Exception, ...] = ())
+    Stands in for the EventData of a change event when an attribute is
+    polled, so that the same callbacks can be used for both.
+    """
+    event = 'change'
+
+    def __init__(self, attr_name: str, attr_value=None,
+                 errors: Tuple[Exception, ...] = ()):
+        self.attr_name = attr_name
+        self.attr_value = attr_value
+        self.errors = errors
+        self.err = bool(errors)
+
+
+class _PolledAttribute:
+    def __init__(self, attr_name: str):
+        self.attr_name = attr_name
+        self.callbacks: Dict[int, Optional[Callable]] = {}
+        self.periods: Dict[int, float] = {}
+        self.adaptive: Dict[int, bool] = {}
+        self.period = 0.0
+        self.next_due = 0.0
+        self.last_event: Optional[PolledEvent] = None
+
+    @property
+    def base_period(self) -> float:
+        return min(self.periods.values())
+
+    @property
+    def is_adaptive(self) -> bool:
+        return all(self.adaptive.values())
+
+    def changed(self, attr_data) -> bool:
+        if self.last_event is None or self.last_event.err:
+            return True
+        last = self.last_event.attr_value
+        return (getattr(last, 'quality', None)
+                != getattr(attr_data, 'quality', None)
+                or not values_equal(last.value, attr_data.value))
+
+    def dispatch(self, event: PolledEvent):
+        self.last_event = event
+        for callback in list(self.callbacks.values()):
+            if callback:
+                try:
+                    callback(event)
+                except Exception:
+                    logging.exception(
+                        f"Error in polling callback {callback!r}")
+
+
+class PollingScheduler(ProxyHelper):
+    """
+    PollingScheduler(proxy: DeviceProxy, backoff: float = 2.0,
+                     max_backoff: float = 16.0)
+    Polls attributes of a single DeviceProxy for devices that do not push
+    change events, with a single task that reads every attribute due in a
+    tick with one read_attributes call. Each subscriber gives its own
+    period; an attribute is polled at the shortest period asked for. While
+    an attribute's value stays the same its period is multiplied by backoff
+    on each poll, up to max_backoff times the requested period, and it
+    returns to the requested period as soon as the value changes. Callbacks
+    receive a PolledEvent, shaped like the EventData of a change event, for
+    the first poll and whenever the value, quality or error state changes.
+    """
+    def __init__(self, proxy: DeviceProxy, backoff: float = 2.0,
+                 max_backoff: float = 16.0):
+        super().__init__(proxy)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._attributes: Dict[str, _PolledAttribute] = {}
+        self._tokens: Dict[int, str] = {}
+        self._token_count = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.ticks = 0
+
+    def subscribe(self, attr_name: str, callback: Optional[Callable] = None,
+                  period: float = 1.0, adaptive: bool = True) -> int:
+        key = attr_name.lower()
+        token = next(self._token_count)
+        self._tokens[token] = key
+        attr = self._attributes.get(key)
+        if attr is None:
+            attr = self._attributes[key] = _PolledAttribute(attr_name)
+        elif callback and attr.last_event is not None:
+            callback(attr.last_event)
+        attr.callbacks[token] = callback
+        attr.periods[token] = period
+        attr.adaptive[token] = adaptive
+        if attr.last_event is None or period < attr.period:
+            attr.period = attr.base_period
+            attr.next_due = 0.0  # poll on the next tick
+            self._wake()
+        return token
+
+    def unsubscribe(self, token: int):
+        key = self._tokens.pop(token)
+        attr = self._attributes[key]
+        for mapping in (attr.callbacks, attr.periods, attr.adaptive):
+            del mapping[token]  # type: ignore
+        if not attr.callbacks:
+            del self._attributes[key]
+        else:
+            attr.period = max(attr.period, attr.base_period)
+
+    def polled_attributes(self) -> List[Tuple[str, float]]:
+        '''Returns the name and current period of each polled attribute'''
+        return [(attr.attr_name, attr.period)
+                for attr in self._attributes.values()]
+
+    def _wake(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        elif self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._attributes and self.proxy_alive:
+            now = loop.time()
+            due = [attr for attr in self._attributes.values()
+                   if attr.next_due <= now]
+            if due:
+                await self._poll(due, now)
+                continue
+            delay = min(attr.next_due for attr in self._attributes.values())
+            self._wakeup.clear()  # type: ignore
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),  # type: ignore
+                                       delay - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, due: List[_PolledAttribute], started: float):
+        self.ticks += 1
+        attr_names = [attr.attr_name for attr in due]
+        try:
+            attr_data = await self.proxy.read_attributes(attr_names)
+        except Exception as exc:
+            logging.warning(f"Polling {attr_names} failed: {exc!r}")
+            attr_data = [exc] * len(due)
+        for attr, data in zip(due, attr_data):
+            errors: Tuple[Exception, ...]
+            if self._attributes.get(attr.attr_name.lower()) is not attr:
+                continue  # unsubscribed during the read
+            if isinstance(data, Exception):
+                failed, errors = True, (data,)
+            elif getattr(data, 'has_failed', False):
+                failed, errors = True, tuple(data.get_err_stack())
+            else:
+                failed, errors = False, ()
+            if failed:
+                attr.period = attr.base_period
+                if attr.last_event is None or not attr.last_event.err:
+                    attr.dispatch(PolledEvent(attr.attr_name,
+                                              errors=errors))
+            elif attr.changed(data):
+                attr.period = attr.base_period
+                attr.dispatch(PolledEvent(attr.attr_name, data))
+            elif attr.is_adaptive:
+                attr.period = min(attr.period * self.backoff,
+                                  attr.base_period * self.max_backoff)
+            attr.next_due = started + attr.period
+
+
+_pollers = ProxyHelpers(PollingScheduler)
+
+
+def get_poller(proxy: DeviceProxy) -> PollingScheduler:
+    return _pollers.get(proxy)
@@ -0,0 +1,171 @@
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+from .proxy import DeviceProxy
+
+HelperT = TypeVar('HelperT', bound='ProxyHelper')
+
+
+class ProxyReleasedError(ReferenceError):
+    ...
+
+
+class ProxyHelper:
+    """
+    ProxyHelper(proxy: DeviceProxy)
+    Base of the shared state kept for a single DeviceProxy, such as its
+    SubscriptionRegistry or SignalIndex. The proxy is held by a weak
+    reference, so that proxies evicted from their pool can be garbage
+    collected along with their helpers.
+    """
+    def __init__(self, proxy: DeviceProxy):
+        self._proxy_ref = weakref.ref(proxy)
+
+    @property
+    def proxy_alive(self) -> bool:
+        return self._proxy_ref() is not None
+
+    @property
+    def proxy(self) -> DeviceProxy:
+        proxy = self._proxy_ref()
+        if proxy is None:
+            raise ProxyReleasedError(
+                f"The DeviceProxy of this {type(self).__name__} has been"
+                f" garbage collected")
+        return proxy
+
+
+class ProxyHelpers(Generic[HelperT]):
+    """
+    ProxyHelpers(factory: Callable[..., HelperT])
+    The helper of each DeviceProxy made by factory(proxy, *args) when first
+    requested with get(proxy, *args), and dropped with its proxy.
+    """
+    def __init__(self, factory: Callable[..., HelperT]):
+        self._factory = factory
+        self._helpers: 'weakref.WeakKeyDictionary[DeviceProxy, HelperT]' = \
+            weakref.WeakKeyDictionary()
+
+    def get(self, proxy: DeviceProxy, *args) -> HelperT:
+        helper = self._helpers.get(proxy)
+        if helper is None:
+            helper = self._helpers[proxy] = self._factory(proxy, *args)
+        return helper
+
+
+class ProxyPool:
+    """
+    ProxyPool(proxy_class, max_size: Optional[int] = None,
+              idle_timeout: Optional[float] = None)
+    Cache of DeviceProxy objects of a single proxy class, keyed by device
+    name. Concurrent requests for a device that is still being created all
+    wait for the same creation rather than each building a proxy. If
+    max_size is set the least recently used proxies are evicted to keep the
+    pool within it, and if idle_timeout is set proxies that have not been
+    requested for that many seconds are evicted on the next request.
+    Evicted proxies remain usable by the signals that hold them. Wrappers
+    added with add_wrapper() are applied to each proxy as it is created.
+    """
+    def __init__(self, proxy_class, max_size: Optional[int] = None,
+                 idle_timeout: Optional[float] = None):
+        self.proxy_class = proxy_class
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._proxies: OrderedDict[str, DeviceProxy] = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._wrappers: List[Callable[[DeviceProxy, str], DeviceProxy]] = []
+        self._stats = {'hits': 0, 'misses': 0, 'joined': 0, 'created': 0,
+                       'failed': 0, 'evicted': 0, 'creation_time': 0.0}
+
+    async def get(self, dev_name: str) -> DeviceProxy:
+        self._evict_idle()
+        if dev_name in self._proxies:
+            self._stats['hits'] += 1
+            self._touch(dev_name)
+            return self._proxies[dev_name]
+        if dev_name in self._pending:
+            self._stats['joined'] += 1
+            return await asyncio.shield(self._pending[dev_name])
+        self._stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[dev_name] = future
+        start = time.perf_counter()
+        try:
+            proxy = await self.proxy_class(dev_name)
+            for wrapper in self._wrappers:
+                proxy = wrapper(proxy, dev_name)
+        except BaseException as exc:
+            self._stats['failed'] += 1
+            future.set_exception(exc)
+            future.exception()  # mark as retrieved if nobody joined
+            raise
+        else:
+            self._stats['created'] += 1
+            self._stats['creation_time'] += time.perf_counter() - start
+            self._proxies[dev_name] = proxy
+            self._touch(dev_name)
+            self._evict_lru()
+            future.set_result(proxy)
+            return proxy
+        finally:
+            del self._pending[dev_name]
+
+    def add_wrapper(self, wrapper: Callable[[DeviceProxy, str], DeviceProxy]):
+        '''Wraps each proxy created from now on with wrapper, called with
+        the proxy and the device name, such as a ProxyWrapper subclass.
+        Proxies already in the pool are evicted, so that they are created
+        again with the wrapper when next requested.'''
+        self._wrappers.append(wrapper)
+        self.clear()
+
+    def remove_wrapper(self,
+                       wrapper: Callable[[DeviceProxy, str], DeviceProxy]):
+        self._wrappers.remove(wrapper)
+        self.clear()
+
+    def _touch(self, dev_name: str):
+        self._proxies.move_to_end(dev_name)
+        self._last_used[dev_name] = time.monotonic()
+
+    def _evict_lru(self):
+        if self.max_size is None:
+            return
+        while len(self._proxies) > self.max_size:
+            self.evict(next(iter(self._proxies)))
+
+    def _evict_idle(self):
+        if self.idle_timeout is None:
+            return
+        now = time.monotonic()
+        for dev_name, last_used in list(self._last_used.items()):
+            if now - last_used > self.idle_timeout:
+                self.evict(dev_name)
+
+    def evict(self, dev_name: str):
+        if dev_name in self._proxies:
+            del self._proxies[dev_name]
+            del self._last_used[dev_name]
+            self._stats['evicted'] += 1
+
+    def clear(self):
+        for dev_name in list(self._proxies):
+            self.evict(dev_name)
+
+    def stats(self) -> Dict[str, float]:
+        '''Returns the counts of hits, misses, requests that joined a pending
+        creation, proxies created, failed creations and evictions, along
+        with the total and mean time spent creating proxies'''
+        stats = dict(self._stats, size=len(self._proxies))
+        stats['mean_creation_time'] = (
+            stats['creation_time'] / stats['created']
+            if stats['created'] else 0.0)
+        return stats
+
+    def __contains__(self, dev_name: str) -> bool:
+        return dev_name in self._proxies
+
+    def __len__(self) -> int:
+        return len(self._proxies)
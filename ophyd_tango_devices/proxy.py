@@ -1,19 +1,35 @@
 import time
 import os
 import asyncio
-from typing import Protocol
+import inspect
+from typing import (Callable, Dict, Optional, Protocol, Sequence, Tuple,
+                    Union)
 from PyTango.asyncio import DeviceProxy as AsyncDeviceProxy  # type: ignore
+import numpy as np  # type: ignore
+from PyTango._tango import (AttrDataFormat, AttrQuality,  # type: ignore
+                            CmdArgType, DevState, EventType)
+from .simulation import SimBackend, get_sim_backend
 
 _sim_sub_count = 0
 
 
 class DeviceProxy(Protocol):
-    async def read_attribute(self, attr_name: str):
+    async def read_attribute(self, attr_name: str, extract_as=None):
+        ...
+
+    async def read_attributes(self, attr_names: list[str],
+                              extract_as=None) -> list:
         ...
 
     async def write_attribute(self, attr_name: str, value):
         ...
 
+    async def write_attributes(self, name_values: list[tuple]):
+        ...
+
+    async def command_inout(self, cmd_name: str, value=None):
+        ...
+
     async def read_pipe(self, attr_name: str) -> tuple:
         ...
 
@@ -26,6 +42,10 @@ class DeviceProxy(Protocol):
     async def subscribe_event(self, attr_name, event_type, callback) -> int:
         ...
 
+    async def get_attribute_config(
+            self, attr_names: Union[str, Sequence[str]]):
+        ...
+
     def get_db_port(self) -> str:
         ...
 
@@ -48,16 +68,102 @@ class DeviceProxy(Protocol):
 TangoProxy = AsyncDeviceProxy
 
 
+class ProxyWrapper:
+    """
+    ProxyWrapper(proxy: DeviceProxy, dev_name: str)
+    Base of DeviceProxy classes that add behaviour around the calls made to
+    another DeviceProxy. Every asynchronous call goes through
+    _call(operation, attr_names, method, *args, **kwargs), and every event
+    callback is wrapped by _wrap_callback(attr_name, event_type, callback),
+    which subclasses override. Everything else is taken from the wrapped
+    proxy. Wrappers may be stacked, and are applied to the proxies of a
+    ProxyPool with its add_wrapper() method.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str):
+        self._proxy = proxy
+        self.dev_name = dev_name
+
+    def __getattr__(self, name: str):
+        return getattr(self._proxy, name)
+
+    @property
+    def wrapped(self) -> DeviceProxy:
+        return self._proxy
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        # some PyTango methods return their result rather than a Future
+        result = method(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _wrap_callback(self, attr_name: str, event_type,
+                       callback: Callable) -> Callable:
+        return callback
+
+    async def read_attribute(self, attr_name: str, *args, **kwargs):
+        return await self._call('read', (attr_name,),
+                                self._proxy.read_attribute, attr_name,
+                                *args, **kwargs)
+
+    async def read_attributes(self, attr_names: list[str], *args, **kwargs):
+        return await self._call('read', tuple(attr_names),
+                                self._proxy.read_attributes, attr_names,
+                                *args, **kwargs)
+
+    async def write_attribute(self, attr_name: str, value):
+        return await self._call('write', (attr_name,),
+                                self._proxy.write_attribute, attr_name, value)
+
+    async def write_attributes(self, name_values: list[tuple]):
+        return await self._call('write',
+                                tuple(name for name, _ in name_values),
+                                self._proxy.write_attributes, name_values)
+
+    async def command_inout(self, cmd_name: str, *args, **kwargs):
+        return await self._call('command', (cmd_name,),
+                                self._proxy.command_inout, cmd_name,
+                                *args, **kwargs)
+
+    async def read_pipe(self, pipe_name: str):
+        return await self._call('read_pipe', (pipe_name,),
+                                self._proxy.read_pipe, pipe_name)
+
+    async def write_pipe(self, pipe_name: str, value):
+        return await self._call('write_pipe', (pipe_name,),
+                                self._proxy.write_pipe, pipe_name, value)
+
+    async def get_attribute_config(self, attr_names):
+        names = (attr_names,) if isinstance(attr_names, str) \
+            else tuple(attr_names)
+        return await self._call('get_config', names,
+                                self._proxy.get_attribute_config, attr_names)
+
+    async def subscribe_event(self, attr_name, event_type, callback,
+                              *args, **kwargs):
+        if callback:
+            callback = self._wrap_callback(attr_name, event_type, callback)
+        return await self._call('subscribe', (attr_name,),
+                                self._proxy.subscribe_event, attr_name,
+                                event_type, callback, *args, **kwargs)
+
+    def unsubscribe_event(self, sub_id):
+        return self._proxy.unsubscribe_event(sub_id)
+
+
 class _SimDeviceAttribute:
     """Class resembling PyTango.DeviceAttribute. Dot-accessible dict returned
     as the value of the "value" key of the DeviceProxy's read_attribute()
     method, containing some of the expected fields"""
-    def __init__(self, attr_name):
+    def __init__(self, attr_name, value=0, dim_x=1, dim_y=0,
+                 quality=AttrQuality.ATTR_VALID):
         self.name = attr_name
-        self.value = 0
+        self.value = value
         self.time = _SimTangoTimestamp()
-        self.dim_x = 1
-        self.dim_y = 0
+        self.dim_x = dim_x
+        self.dim_y = dim_y
+        self.quality = quality
 
     def __repr__(self):
         repr = 'DeviceAttribute['
@@ -69,12 +175,13 @@ class _SimDeviceAttribute:
 
 
 class _SimEventData:
-    def __init__(self, attr_name, dev_name, hostname):
+    def __init__(self, attr_name, dev_name, hostname, attr_value=None):
         self.attr_name = 'tango://' + hostname + ':10000/' + 'dev_name' \
                          + '/' + attr_name.lower()
-        self.attr_value = _SimDeviceAttribute(attr_name)
+        self.attr_value = attr_value or _SimDeviceAttribute(attr_name)
         self.reception_date = _SimTangoTimestamp()
         self.event = 'change'
+        self.err = False
 
     def __repr__(self):
         repr = 'EventData['
@@ -104,94 +211,239 @@ class _SimTangoTimestamp:
                 f"tv_usec: {self.tv_usec})")
 
 
+def _sim_limit(limits: dict, name: str) -> str:
+    # like Tango, unspecified limits are given as strings
+    limit = limits.get(name)
+    return 'Not specified' if limit is None else str(limit)
+
+
+class _SimAlarmInfo:
+    def __init__(self, limits):
+        self.min_alarm = _sim_limit(limits, 'min_alarm')
+        self.max_alarm = _sim_limit(limits, 'max_alarm')
+        self.min_warning = _sim_limit(limits, 'min_warning')
+        self.max_warning = _sim_limit(limits, 'max_warning')
+
+
 class _SimAttributeInfoEx:
-    def __init__(self):
-        self.min_alarm = 'Not specified'
-        self.max_alarm = 'Not specified'
-        self.min_warning = 'Not specified'
-        self.max_warning = 'Not specified'
-        self.min_alarm = 'Not specified'
-        self.max_alarm = 'Not specified'
+    def __init__(self, data_type=CmdArgType.DevDouble,
+                 data_format=AttrDataFormat.SCALAR, max_dim_x=1, max_dim_y=0,
+                 limits: Optional[dict] = None):
+        limits = limits or {}
+        self.data_type = data_type
+        self.data_format = data_format
+        self.max_dim_x = max_dim_x
+        self.max_dim_y = max_dim_y
+        self.min_value = _sim_limit(limits, 'min_value')
+        self.max_value = _sim_limit(limits, 'max_value')
+        self.alarms = _SimAlarmInfo(limits)
+        self.min_alarm = self.alarms.min_alarm
+        self.max_alarm = self.alarms.max_alarm
+        self.min_warning = self.alarms.min_warning
+        self.max_warning = self.alarms.max_warning
+
+
+class _SimDbDevFullInfo:
+    def __init__(self, name, spec):
+        self.name = name
+        self.ds_full_name = 'SimProxy/' + name
+        self.version = spec.version
+        self.started_date = spec.started_date
+        self.exported = True
+
+
+class _SimDatabase:
+    """Class resembling PyTango.Database, returned by SimProxy's
+    get_device_db() method"""
+    def __init__(self, spec):
+        self._spec = spec
+
+    def get_device_info(self, dev_name):
+        return _SimDbDevFullInfo(dev_name, self._spec)
 
 
 class SimProxy:
     """Simulated PyTango.asyncio.DeviceProxy containing all methods
-    required by DeviceProxyProtocol. Only designed to work when instantiated
-    with "mock/device/name" for testing purposes, and holds attributes and
-    commands resembling those of TangoMotorComm."""
+    required by DeviceProxyProtocol. The attributes, commands and pipes of
+    the device are given by the SimDeviceSpec registered under its name in
+    the SimBackend returned by ophyd_tango_devices.simulation.get_sim_backend()
+    (or the backend passed as the second argument), which by default holds
+    "mock/device/name", a device resembling the signals of TangoMotorComm.
+    Change events are pushed to subscribers from the event loop whenever an
+    attribute is written or changed by simulated motion, in which the
+    position attribute of the spec's SimMotion moves towards its setpoint at
+    the current velocity while the state attribute is MOVING."""
+    _motion_update_period = 0.05
+    blocking_introspection = False  # the signal lists are held locally
+
     async def __new__(cls, *args, **kwargs):
         instance = super().__new__(cls)
         return instance(*args, **kwargs)
 
-    def __call__(self, name):
-        if name != "mock/device/name":
-            raise KeyError("SimProxy must be instantiated with"
-                           "'mock/device/name'")
+    def __call__(self, name, backend: Optional[SimBackend] = None):
+        self._spec = (backend or get_sim_backend()).get_spec(name)
         self._name = name
-        self._attributes = ['Position', 'Velocity', 'State']
-        self._attribute_values = {}
-        self._commands = ['Stop']
-        self._pipes = []
+        self._attributes = list(self._spec.attributes)
+        self._attribute_values = {
+            attr_name: attr.initial_value()
+            for attr_name, attr in self._spec.attributes.items()}
+        self._commands = list(self._spec.commands)
+        self._pipes = list(self._spec.pipes)
+        self._pipe_values = {pipe_name: pipe.value
+                             for pipe_name, pipe in self._spec.pipes.items()}
         self._port_num = 10000  # magic number for ease of testing
         self._host = os.uname().nodename
-        self._active_subs = []
+        self._active_subs: Dict[
+            int, Tuple[str, EventType, Optional[Callable]]] = {}
+        self._motion: Optional[asyncio.Task] = None
         return self
 
-    async def read_attribute(self, attr_name: str):
+    async def read_attribute(self, attr_name: str, extract_as=None):
+        # values are always held as they would be extracted as numpy
         return self._read_attribute_sync(attr_name)
 
     def _read_attribute_sync(self, attr_name: str):
-        if attr_name not in self._attributes:
+        if attr_name not in self._spec.attributes:
             raise KeyError(f"Could not connect to {attr_name}. Note:"
                            " real device proxy raises DevFailed")
-        attr = getattr(self, attr_name, _SimDeviceAttribute(attr_name))
-        if attr_name in self._attribute_values:
-            attr.value = self._attribute_values[attr_name]  # type: ignore
-        return attr
+        attr = self._spec.attributes[attr_name]
+        value = self._attribute_values[attr_name]
+        return _SimDeviceAttribute(attr_name, value, attr.max_dim_x,
+                                   attr.max_dim_y, attr.quality(value))
+
+    async def read_attributes(self, attr_names: list[str], extract_as=None):
+        return [self._read_attribute_sync(attr_name)
+                for attr_name in attr_names]
 
     async def write_attribute(self, attr_name: str, value):
-        if attr_name not in self._attributes:
+        if attr_name not in self._spec.attributes:
             raise KeyError(f"Could not connect to {attr_name}. Note:"
                            " real device proxy raises DevFailed")
+        attr = self._spec.attributes[attr_name]
+        attr.check_write(value)
+        value = attr.coerce(value)
+        motion = self._spec.motion
+        if motion and attr_name == motion.position:
+            self._start_motion(value)
+        else:
+            self._set_value(attr_name, value)
+
+    async def write_attributes(self, name_values: list[tuple]):
+        # all the values are checked before any is written
+        for attr_name, value in name_values:
+            if attr_name not in self._spec.attributes:
+                raise KeyError(f"Could not connect to {attr_name}. Note:"
+                               " real device proxy raises DevFailed")
+            self._spec.attributes[attr_name].check_write(value)
+        for attr_name, value in name_values:
+            await self.write_attribute(attr_name, value)
+
+    def _set_value(self, attr_name: str, value):
+        old_value = self._attribute_values.get(attr_name)
+        if old_value is None:
+            changed = True
+        elif isinstance(value, np.ndarray):
+            changed = not np.array_equal(old_value, value)
+        else:
+            changed = old_value != value
         self._attribute_values[attr_name] = value
+        if changed:
+            self._push_change_event(attr_name)
+
+    def _push_change_event(self, attr_name: str):
+        subscribers = [callback for name, event_type, callback
+                       in self._active_subs.values()
+                       if name == attr_name and callback
+                       and event_type == EventType.CHANGE_EVENT]
+        if not subscribers:
+            return
+        event = _SimEventData(attr_name, self._name, self._host,
+                              self._read_attribute_sync(attr_name))
+        loop = asyncio.get_running_loop()
+        for callback in subscribers:
+            loop.call_soon(callback, event)
+
+    def _start_motion(self, setpoint):
+        if self._motion:
+            self._motion.cancel()
+        self._set_value(self._spec.motion.state, DevState.MOVING)
+        self._motion = asyncio.ensure_future(self._move_to(setpoint))
+
+    async def _move_to(self, setpoint):
+        motion = self._spec.motion
+        try:
+            start = self._attribute_values[motion.position]
+            velocity = abs(self._attribute_values[motion.velocity])
+            duration = abs(setpoint - start) / velocity if velocity else 0
+            t0 = time.monotonic()
+            while (elapsed := time.monotonic() - t0) < duration:
+                self._set_value(motion.position, start + (setpoint - start)
+                                * elapsed / duration)
+                await asyncio.sleep(self._motion_update_period)
+            self._set_value(motion.position, setpoint)
+        finally:
+            # a motion retargeted by a new setpoint hands the state over
+            if self._motion is asyncio.current_task():
+                self._motion = None
+                self._set_value(motion.state, DevState.ON)
+
+    async def command_inout(self, cmd_name: str, value=None):
+        if cmd_name not in self._spec.commands:
+            raise KeyError(f"No command {cmd_name}. Note:"
+                           " real device proxy raises DevFailed")
+        motion = self._spec.motion
+        if motion and cmd_name == motion.stop and self._motion:
+            self._motion.cancel()
+        handler = self._spec.commands[cmd_name].handler
+        if handler:
+            return handler(self, value)
+
+    async def read_pipe(self, pipe_name: str):
+        if pipe_name not in self._pipe_values:
+            raise KeyError(f"Could not read pipe {pipe_name}. Note:"
+                           " real device proxy raises DevFailed")
+        return self._pipe_values[pipe_name]
+
+    async def write_pipe(self, pipe_name: str, value):
+        if pipe_name not in self._pipe_values:
+            raise KeyError(f"Could not write pipe {pipe_name}. Note:"
+                           " real device proxy raises DevFailed")
+        self._pipe_values[pipe_name] = tuple(value)
 
     def unsubscribe_event(self, sub_id):
-        self._active_subs.remove(sub_id)
+        del self._active_subs[sub_id]
 
     async def subscribe_event(self, attr_name, event_type, callback):
         global _sim_sub_count
         _sim_sub_count += 1
 
         sub_id = _sim_sub_count
-        self._active_subs.append(sub_id)
-
-        def sub_loop():
-            last_reading = self._read_attribute_sync(attr_name)
-            last_value = last_reading.value  # type: ignore
-            event = _SimEventData(attr_name, self._name, self._host)
-            if callback:
-                callback(event)
-            while True:
-                new_reading = self._read_attribute_sync(attr_name)
-                new_value = new_reading.value  # type: ignore
-                if new_value != last_value:
-                    event = _SimEventData(attr_name, self._name, self._host)
-                    if callback:
-                        callback(event)
-                elif sub_id not in self._active_subs:
-                    return
-        loop = asyncio.new_event_loop()
-        loop.run_in_executor(None, sub_loop)
+        event = _SimEventData(attr_name, self._name, self._host,
+                              self._read_attribute_sync(attr_name))
+        self._active_subs[sub_id] = (attr_name, event_type, callback)
+        # simulated attribute configurations never change, so only change
+        # events are sent, starting with the current value like Tango does
+        if callback and event_type == EventType.CHANGE_EVENT:
+            asyncio.get_running_loop().call_soon(callback, event)
         return sub_id
 
     async def get_attribute_config(self, attr_name):
-        if attr_name not in self._attributes:
-            raise Exception()  # what kind of exception should I raise?
-        # in current implementation does not specify limits
-        info = _SimAttributeInfoEx()
+        if not isinstance(attr_name, str):
+            return [await self.get_attribute_config(name)
+                    for name in attr_name]
+        if attr_name not in self._spec.attributes:
+            raise KeyError(f"Could not connect to {attr_name}. Note:"
+                           " real device proxy raises DevFailed")
+        attr = self._spec.attributes[attr_name]
+        info = _SimAttributeInfoEx(attr.data_type, attr.data_format,
+                                   attr.max_dim_x, attr.max_dim_y,
+                                   attr.limits)
         info.name = attr_name
         return info
 
+    def get_device_db(self):
+        return _SimDatabase(self._spec)
+
     def get_db_port(self):
         return str(self._port_num)
 
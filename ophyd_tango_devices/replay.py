@@ -0,0 +1,521 @@
+import asyncio
+import builtins
+import enum
+import gzip
+import itertools
+import logging
+import pickle
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np  # type: ignore
+from PyTango import DevError, DevFailed  # type: ignore
+from .pool import ProxyPool
+from .proxy import DeviceProxy, ProxyWrapper
+from .signals import get_proxy_pool
+
+TRACE_VERSION = 1
+
+# PyTango objects are not picklable, so only these attributes are kept
+_skipped_attributes = {'device'}
+_max_depth = 4
+
+
+class TraceObject:
+    """
+    TraceObject(type_name: str, attributes: Dict[str, Any],
+                time: Optional[float] = None)
+    Stands in for a PyTango object in a trace, such as a DeviceAttribute,
+    EventData or AttributeInfoEx, holding the public attributes it had when
+    recorded. Objects with a totime() method, such as TimeVal, keep it.
+    """
+    def __init__(self, type_name: str, attributes: Dict[str, Any],
+                 time: Optional[float] = None):
+        self._type_name = type_name
+        self._time = time
+        self.__dict__.update(attributes)
+
+    def totime(self) -> Optional[float]:
+        return self._time
+
+    def __repr__(self) -> str:
+        return f'TraceObject({self._type_name})'
+
+
+class _TracedError:
+    def __init__(self, exc: BaseException):
+        self.type_name = type(exc).__name__
+        self.message = str(exc)
+        self.errors = [{field: str(getattr(error, field, ''))
+                        for field in ('reason', 'desc', 'origin', 'severity')}
+                       for error in exc.args] \
+            if isinstance(exc, DevFailed) else []
+
+    def exception(self) -> BaseException:
+        if self.type_name == 'DevFailed':
+            errors = []
+            for fields in self.errors:
+                error = DevError()
+                error.reason = fields['reason']
+                error.desc = fields['desc']
+                error.origin = fields['origin']
+                errors.append(error)
+            return DevFailed(*errors)
+        exc_class = getattr(builtins, self.type_name, None)
+        if isinstance(exc_class, type) and issubclass(exc_class, Exception):
+            return exc_class(self.message)
+        return RuntimeError(f'{self.type_name}: {self.message}')
+
+
+def _freeze(obj, depth: int = 0):
+    '''Returns a picklable copy of a result, argument or event'''
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes,
+                                       np.ndarray, np.generic)):
+        return obj  # includes the PyTango enums, which are IntEnums
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_freeze(item, depth) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _freeze(value, depth) for key, value in obj.items()}
+    if isinstance(obj, BaseException):
+        return _TracedError(obj)
+    if depth >= _max_depth:
+        return None
+    attributes = {}
+    for name in dir(obj):
+        if name.startswith('_') or name in _skipped_attributes:
+            continue
+        try:
+            value = getattr(obj, name)
+        except Exception:
+            continue
+        if not callable(value):
+            attributes[name] = _freeze(value, depth + 1)
+    totime = getattr(obj, 'totime', None)
+    return TraceObject(type(obj).__name__, attributes,
+                       totime() if callable(totime) else None)
+
+
+class TraceRecorder:
+    """
+    TraceRecorder(path: str)
+    Writes the calls made through RecordingProxies, with their results and
+    durations, and the events they deliver, to a gzip compressed file of
+    pickled records at path, for replay by a ReplayProxy.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = gzip.open(path, 'wb')
+        self._lock = threading.Lock()  # events may arrive from other threads
+        self._start = time.perf_counter()
+        self._subscription_ids = itertools.count(1)
+        self._pools: List[Tuple[ProxyPool, Callable]] = []
+        self.records = 0
+        self.write(('trace', TRACE_VERSION, time.time()))
+
+    def now(self) -> float:
+        return time.perf_counter() - self._start
+
+    def next_subscription_id(self) -> int:
+        return next(self._subscription_ids)
+
+    def write(self, record: tuple):
+        with self._lock:
+            if not self._file.closed:
+                pickle.dump(record, self._file, pickle.HIGHEST_PROTOCOL)
+                self.records += 1
+
+    def record_pool(self, pool: ProxyPool):
+        '''Records the proxies created by pool from now on'''
+        def wrapper(proxy: DeviceProxy, dev_name: str) -> DeviceProxy:
+            return RecordingProxy(proxy, dev_name, self)
+        pool.add_wrapper(wrapper)
+        self._pools.append((pool, wrapper))
+
+    def close(self):
+        for pool, wrapper in self._pools:
+            pool.remove_wrapper(wrapper)
+        self._pools = []
+        with self._lock:
+            self._file.close()
+
+
+class RecordingProxy(ProxyWrapper):
+    """
+    RecordingProxy(proxy: DeviceProxy, dev_name: str,
+                   recorder: TraceRecorder)
+    ProxyWrapper recording every call, its result or error and duration,
+    and every event, with a TraceRecorder. A call on several attributes is
+    recorded as a call on each of them.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str,
+                 recorder: TraceRecorder):
+        super().__init__(proxy, dev_name)
+        self._recorder = recorder
+        info = {}
+        for method in ('get_db_host', 'get_db_port', 'get_db_port_num'):
+            try:
+                info[method] = getattr(proxy, method)()
+            except Exception:
+                pass
+        recorder.write(('device', dev_name, info))
+
+    def _record(self, operation: str, attr_names: Tuple[str, ...],
+                start: float, ok: bool, result, per_attribute: bool = False):
+        duration = self._recorder.now() - start
+        if ok and per_attribute:
+            results = result
+        else:
+            results = [result] * len(attr_names)
+        for attr_name, attr_result in zip(attr_names, results):
+            self._recorder.write(('call', self.dev_name, operation,
+                                  attr_name.lower(), start, duration, ok,
+                                  _freeze(attr_result)))
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        start = self._recorder.now()
+        try:
+            result = await super()._call(operation, attr_names, method,
+                                         *args, **kwargs)
+        except Exception as exc:
+            self._record(operation, attr_names, start, False, exc)
+            raise
+        # calls given a list of names return a list of results
+        self._record(operation, attr_names, start, True, result,
+                     isinstance(result, list) and not isinstance(
+                         args[0] if args else None, str))
+        return result
+
+    def _list(self, method: str) -> List[str]:
+        start = self._recorder.now()
+        try:
+            result = getattr(self._proxy, method)()
+        except Exception as exc:
+            self._record(method, ('',), start, False, exc)
+            raise
+        self._record(method, ('',), start, True, list(result))
+        return result
+
+    def get_attribute_list(self) -> List[str]:
+        return self._list('get_attribute_list')
+
+    def get_command_list(self) -> List[str]:
+        return self._list('get_command_list')
+
+    def get_pipe_list(self) -> List[str]:
+        return self._list('get_pipe_list')
+
+    async def subscribe_event(self, attr_name, event_type, callback,
+                              *args, **kwargs):
+        recorder = self._recorder
+        subscription = recorder.next_subscription_id()
+        start = recorder.now()
+        if callback:
+            callback = self._recording_callback(subscription, callback)
+        try:
+            sub_id = await super().subscribe_event(
+                attr_name, event_type, callback, *args, **kwargs)
+        except Exception as exc:
+            recorder.write(('subscribe', self.dev_name, subscription,
+                            attr_name.lower(), int(event_type), start,
+                            _freeze(exc)))
+            raise
+        recorder.write(('subscribe', self.dev_name, subscription,
+                        attr_name.lower(), int(event_type), start, None))
+        return sub_id
+
+    def _recording_callback(self, subscription: int,
+                            callback: Callable) -> Callable:
+        recorder, dev_name = self._recorder, self.dev_name
+
+        def recording_callback(event):
+            recorder.write(('event', dev_name, subscription, recorder.now(),
+                            _freeze(event)))
+            return callback(event)
+        return recording_callback
+
+
+def record_trace(path: str, pool: Optional[ProxyPool] = None
+                 ) -> TraceRecorder:
+    '''Records the proxies created from now on by pool, by default the pool
+    of real Tango proxies used by _get_device_proxy, to a trace file at
+    path. Call close() on the returned TraceRecorder to stop.'''
+    if pool is None:
+        pool = get_proxy_pool(sim_mode=False)
+    recorder = TraceRecorder(path)
+    recorder.record_pool(pool)
+    return recorder
+
+
+class _TraceUnpickler(pickle.Unpickler):
+    # only the classes that _freeze produces may be loaded from a trace
+    _allowed = {
+        __name__: {'TraceObject', '_TracedError'},
+        'builtins': {'complex', 'set', 'frozenset', 'slice', 'bytearray'},
+        'numpy': {'dtype', 'ndarray'},
+        'numpy.core.multiarray': {'_reconstruct', 'scalar'},
+        'numpy._core.multiarray': {'_reconstruct', 'scalar'},
+        'numpy.core.numeric': {'_frombuffer'},
+        'numpy._core.numeric': {'_frombuffer'},
+    }
+
+    def find_class(self, module: str, name: str):
+        if name in self._allowed.get(module, ()) or module == 'numpy.dtypes':
+            return super().find_class(module, name)
+        if module in ('tango._tango', 'PyTango._tango'):
+            found = super().find_class(module, name)
+            if isinstance(found, type) and issubclass(found, enum.Enum):
+                return found
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a"
+                                     f" trace")
+
+
+class _CallRecord:
+    def __init__(self, duration: float, ok: bool, result):
+        self.duration = duration
+        self.ok = ok
+        self.result = result
+
+
+class _SubscriptionRecord:
+    def __init__(self, attr_name: str, event_type: int, start: float,
+                 error: Optional[_TracedError]):
+        self.attr_name = attr_name
+        self.event_type = event_type
+        self.start = start
+        self.error = error
+        self.events: List[Tuple[float, Any]] = []
+
+
+class _DeviceTrace:
+    def __init__(self, dev_name: str):
+        self.dev_name = dev_name
+        self.info: Dict[str, Any] = {}
+        self.calls: Dict[Tuple[str, str], List[_CallRecord]] = \
+            defaultdict(list)
+        self.subscriptions: Dict[Tuple[str, int],
+                                 List[_SubscriptionRecord]] = \
+            defaultdict(list)
+
+
+class Trace:
+    """
+    Trace()
+    The calls and events of a recorded session, by device, as read from a
+    trace file with Trace.load().
+    """
+    def __init__(self):
+        self.devices: Dict[str, _DeviceTrace] = {}
+        self.created: Optional[float] = None
+
+    def _device(self, dev_name: str) -> _DeviceTrace:
+        if dev_name not in self.devices:
+            self.devices[dev_name] = _DeviceTrace(dev_name)
+        return self.devices[dev_name]
+
+    @classmethod
+    def load(cls, path: str) -> 'Trace':
+        trace = cls()
+        subscriptions: Dict[int, _SubscriptionRecord] = {}
+        events: Dict[int, List[Tuple[float, Any]]] = defaultdict(list)
+        with gzip.open(path, 'rb') as file:
+            while True:
+                try:
+                    # each record was pickled with its own memo
+                    record = _TraceUnpickler(file).load()
+                except EOFError:
+                    break
+                kind = record[0]
+                if kind == 'trace':
+                    if record[1] != TRACE_VERSION:
+                        raise ValueError(f"{path} is a version {record[1]}"
+                                         f" trace, not {TRACE_VERSION}")
+                    trace.created = record[2]
+                elif kind == 'device':
+                    trace._device(record[1]).info.update(record[2])
+                elif kind == 'call':
+                    (_, dev_name, operation, attr_name, _, duration, ok,
+                     result) = record
+                    trace._device(dev_name).calls[
+                        (operation, attr_name)].append(
+                            _CallRecord(duration, ok, result))
+                elif kind == 'subscribe':
+                    (_, dev_name, number, attr_name, event_type, start,
+                     error) = record
+                    subscription = _SubscriptionRecord(attr_name, event_type,
+                                                       start, error)
+                    subscriptions[number] = subscription
+                    trace._device(dev_name).subscriptions[
+                        (attr_name, event_type)].append(subscription)
+                elif kind == 'event':
+                    _, dev_name, number, at, event = record
+                    events[number].append((at, event))
+        for number, subscription in subscriptions.items():
+            subscription.events = [(at - subscription.start, event)
+                                   for at, event in events[number]]
+        return trace
+
+
+_replay_trace: Optional[Trace] = None
+_replay_time_scale = 1.0
+
+
+def set_replay_trace(trace: Optional[Union[Trace, str]],
+                     time_scale: float = 1.0) -> Optional[Trace]:
+    '''Makes ReplayProxies replay trace, a Trace or the path of a trace
+    file, with durations and event times multiplied by time_scale,
+    returning the previous trace'''
+    global _replay_trace, _replay_time_scale
+    if isinstance(trace, str):
+        trace = Trace.load(trace)
+    previous, _replay_trace = _replay_trace, trace
+    _replay_time_scale = time_scale
+    return previous
+
+
+class ReplayProxy:
+    """
+    ReplayProxy(name: str, trace: Optional[Trace] = None,
+                time_scale: Optional[float] = None)
+    DeviceProxy that serves the calls and events recorded for the device
+    in a Trace, by default the one set with set_replay_trace(), making no
+    calls to Tango. Each call returns (or raises) the next result recorded
+    for the same operation on the same attribute, after waiting for the
+    recorded duration multiplied by time_scale, and the last result is
+    repeated once they run out. Each subscription replays the events of the
+    next recorded subscription to the same attribute and event type, at
+    their recorded times after the subscription. To replay devices created
+    in sim_mode, pass ReplayProxy to set_sim_proxy_class().
+    """
+    blocking_introspection = False  # the signal lists are held locally
+
+    async def __new__(cls, *args, **kwargs):
+        instance = super().__new__(cls)
+        return instance(*args, **kwargs)
+
+    def __call__(self, name: str, trace: Optional[Trace] = None,
+                 time_scale: Optional[float] = None):
+        trace = trace or _replay_trace
+        if trace is None or name not in trace.devices:
+            raise KeyError(f"No device {name} in the replayed trace. Note:"
+                           " real device proxy raises DevFailed")
+        self._name = name
+        self._device = trace.devices[name]
+        self.time_scale = _replay_time_scale if time_scale is None \
+            else time_scale
+        self._cursors: Dict[Tuple, int] = defaultdict(int)
+        self._replays: Dict[int, asyncio.Task] = {}
+        self._sub_ids = itertools.count(1)
+        return self
+
+    def __repr__(self) -> str:
+        return f'ReplayProxy({self._name})'
+
+    def _next(self, key: Tuple, records: List):
+        index = min(self._cursors[key], len(records) - 1)
+        self._cursors[key] += 1
+        return records[index]
+
+    def _next_call(self, operation: str, attr_name: str) -> _CallRecord:
+        records = self._device.calls.get((operation, attr_name.lower()))
+        if not records:
+            raise KeyError(f"No {operation} of {attr_name} recorded for"
+                           f" {self._name}. Note: real device proxy raises"
+                           f" DevFailed")
+        return self._next((operation, attr_name.lower()), records)
+
+    async def _replay(self, operation: str, attr_names: List[str]) -> List:
+        records = [self._next_call(operation, attr_name)
+                   for attr_name in attr_names]
+        await asyncio.sleep(
+            max(record.duration for record in records) * self.time_scale)
+        for record in records:
+            if not record.ok:
+                raise record.result.exception()
+        return [record.result for record in records]
+
+    async def read_attribute(self, attr_name: str, *args, **kwargs):
+        return (await self._replay('read', [attr_name]))[0]
+
+    async def read_attributes(self, attr_names: List[str], *args, **kwargs):
+        return await self._replay('read', list(attr_names))
+
+    async def write_attribute(self, attr_name: str, value):
+        await self._replay('write', [attr_name])
+
+    async def write_attributes(self, name_values: List[tuple]):
+        await self._replay('write', [name for name, _ in name_values])
+
+    async def command_inout(self, cmd_name: str, *args, **kwargs):
+        return (await self._replay('command', [cmd_name]))[0]
+
+    async def read_pipe(self, pipe_name: str):
+        return (await self._replay('read_pipe', [pipe_name]))[0]
+
+    async def write_pipe(self, pipe_name: str, value):
+        await self._replay('write_pipe', [pipe_name])
+
+    async def get_attribute_config(self, attr_names):
+        if isinstance(attr_names, str):
+            return (await self._replay('get_config', [attr_names]))[0]
+        return await self._replay('get_config', list(attr_names))
+
+    def _list(self, method: str) -> List[str]:
+        record = self._next_call(method, '')
+        if not record.ok:
+            raise record.result.exception()
+        return list(record.result)
+
+    def get_attribute_list(self) -> List[str]:
+        return self._list('get_attribute_list')
+
+    def get_command_list(self) -> List[str]:
+        return self._list('get_command_list')
+
+    def get_pipe_list(self) -> List[str]:
+        return self._list('get_pipe_list')
+
+    def get_db_host(self) -> str:
+        return self._device.info.get('get_db_host', 'replay')
+
+    def get_db_port(self) -> str:
+        return str(self.get_db_port_num())
+
+    def get_db_port_num(self) -> int:
+        return self._device.info.get('get_db_port_num', 10000)
+
+    async def subscribe_event(self, attr_name, event_type, callback,
+                              *args, **kwargs):
+        key = (attr_name.lower(), int(event_type))
+        records = self._device.subscriptions.get(key)
+        if not records:
+            raise KeyError(f"No subscription to {attr_name} recorded for"
+                           f" {self._name}. Note: real device proxy raises"
+                           f" DevFailed")
+        record = self._next(('subscribe',) + key, records)
+        if record.error is not None:
+            raise record.error.exception()
+        sub_id = next(self._sub_ids)
+        if callback:
+            self._replays[sub_id] = asyncio.ensure_future(
+                self._replay_events(record, callback))
+        return sub_id
+
+    async def _replay_events(self, record: _SubscriptionRecord,
+                             callback: Callable):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for offset, event in record.events:
+            delay = start + offset * self.time_scale - loop.time()
+            await asyncio.sleep(max(delay, 0))
+            try:
+                callback(event)
+            except Exception:
+                logging.exception(f"Error in replayed event callback"
+                                  f" {callback!r}")
+
+    def unsubscribe_event(self, sub_id: int):
+        replay = self._replays.pop(sub_id, None)
+        if replay is not None:
+            replay.cancel()
@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import itertools
+import logging
+import random
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+from PyTango import DevError, DevFailed  # type: ignore
+from .pool import ProxyPool
+from .proxy import DeviceProxy, ProxyWrapper
+from .signals import get_proxy_pools
+
+# errors of the device or the network, as opposed to those of the caller
+_device_errors = (DevFailed, asyncio.TimeoutError)
+
+
+class CircuitOpenError(DevFailed):
+    """
+    CircuitOpenError(device: str)
+    DevFailed raised in place of calling a device whose CircuitBreaker is
+    open, without waiting for the device.
+    """
+    def __init__(self, device: str):
+        error = DevError()
+        error.reason = 'API_CircuitOpen'
+        error.desc = (f"{device} is not answering, calls fail until it"
+                      f" answers a health probe")
+        error.origin = 'CircuitBreaker'
+        super().__init__(error)
+        self.device = device
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker(device: str, policy: ResiliencePolicy)
+    Tracks the health of a device for the ResilientProxies created for it.
+    After failure_threshold consecutive failed calls the breaker opens, and
+    calls raise CircuitOpenError straight away. Every probe_period seconds
+    the device is then probed by reading its probe_attribute, and once that
+    succeeds the breaker closes and the subscriptions of its proxies are
+    made again.
+    """
+    def __init__(self, device: str, policy: 'ResiliencePolicy'):
+        self.device = device
+        self.policy = policy
+        self.state = 'closed'
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._proxies: 'weakref.WeakSet[ResilientProxy]' = weakref.WeakSet()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _add_proxy(self, proxy: 'ResilientProxy'):
+        self._proxies.add(proxy)
+        if self.state == 'open' and self._probe_task is None:
+            self._start_probe()
+
+    def check(self):
+        '''Raises CircuitOpenError if the breaker is open'''
+        if self.state == 'open':
+            self.rejected += 1
+            raise CircuitOpenError(self.device)
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self) -> bool:
+        '''Counts a failed call, returning True if the breaker is open'''
+        self.failures += 1
+        if self.state == 'closed' and \
+                self.failures >= self.policy.failure_threshold:
+            self.state = 'open'
+            self.trips += 1
+            logging.warning(f"{self.device} failed {self.failures} times in"
+                            f" a row, failing calls to it until it answers")
+            self._start_probe()
+        return self.state == 'open'
+
+    def _start_probe(self):
+        self._probe_task = asyncio.ensure_future(self._probe())
+
+    async def _probe(self):
+        try:
+            while self.state == 'open':
+                await asyncio.sleep(self.policy.probe_period)
+                proxies = list(self._proxies)
+                if not proxies:
+                    return  # probed again when a proxy is next created
+                try:
+                    await proxies[0].wrapped.read_attribute(
+                        self.policy.probe_attribute)
+                except Exception:
+                    continue
+                self.state = 'closed'
+                self.failures = 0
+                for proxy in proxies:
+                    await proxy._resubscribe()
+        finally:
+            self._probe_task = None
+
+
+class ResiliencePolicy:
+    """
+    ResiliencePolicy(attempts: int = 3, base_delay: float = 0.05,
+                     max_delay: float = 1.0,
+                     retry_operations: Tuple[str, ...] = ('read',
+                                                          'read_pipe',
+                                                          'get_config'),
+                     failure_threshold: int = 5, probe_period: float = 1.0,
+                     probe_attribute: str = 'State',
+                     seed: Optional[int] = None)
+    How ResilientProxies handle failing devices. Calls of the idempotent
+    retry_operations that raise DevFailed or time out are made up to
+    attempts times, waiting a random time of up to base_delay * 2 ** n
+    seconds (at most max_delay) before the nth retry. Each device has a
+    CircuitBreaker, returned by breaker(), set by the other arguments.
+    """
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05,
+                 max_delay: float = 1.0,
+                 retry_operations: Tuple[str, ...] = ('read', 'read_pipe',
+                                                      'get_config'),
+                 failure_threshold: int = 5, probe_period: float = 1.0,
+                 probe_attribute: str = 'State',
+                 seed: Optional[int] = None):
+        if attempts < 1:
+            raise ValueError("ResiliencePolicy attempts must be at least 1")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_operations = retry_operations
+        self.failure_threshold = failure_threshold
+        self.probe_period = probe_period
+        self.probe_attribute = probe_attribute
+        self.rng = random.Random(seed)
+        self.retries = 0
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def backoff(self, attempt: int) -> float:
+        '''Returns the time to wait before retrying a call that has failed
+        attempt + 1 times'''
+        return self.rng.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def breaker(self, device: str) -> CircuitBreaker:
+        if device not in self._breakers:
+            self._breakers[device] = CircuitBreaker(device, self)
+        return self._breakers[device]
+
+    def stats(self) -> Dict[str, Dict]:
+        '''Returns, for each device, the state of its breaker, the number of
+        consecutive failures, the times it has opened and the calls it has
+        rejected'''
+        return {device: {'state': breaker.state,
+                         'failures': breaker.failures,
+                         'trips': breaker.trips,
+                         'rejected': breaker.rejected}
+                for device, breaker in self._breakers.items()}
+
+
+class _ResilientSubscription:
+    def __init__(self, attr_name: str, event_type, callback, args, kwargs):
+        self.attr_name = attr_name
+        self.event_type = event_type
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.sub_id = None  # of the subscription on the wrapped proxy
+
+
+class ResilientProxy(ProxyWrapper):
+    """
+    ResilientProxy(proxy: DeviceProxy, dev_name: str,
+                   policy: ResiliencePolicy)
+    ProxyWrapper retrying idempotent calls and failing fast through the
+    CircuitBreaker of its device, as set by policy. The ids it returns from
+    subscribe_event() stay valid when the subscriptions are made again
+    after the breaker closes.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str,
+                 policy: ResiliencePolicy):
+        super().__init__(proxy, dev_name)
+        self.policy = policy
+        self.breaker = policy.breaker(dev_name)
+        self._subscriptions: Dict[int, _ResilientSubscription] = {}
+        self._sub_count = itertools.count(1)
+        self.breaker._add_proxy(self)
+
+    async def _call(self, operation: str, attr_names: Tuple[str, ...],
+                    method: Callable, *args, **kwargs):
+        for attempt in itertools.count():
+            self.breaker.check()
+            try:
+                result = await super()._call(operation, attr_names, method,
+                                             *args, **kwargs)
+            except _device_errors:
+                if self.breaker.record_failure() or \
+                        operation not in self.policy.retry_operations or \
+                        attempt + 1 >= self.policy.attempts:
+                    raise
+                self.policy.retries += 1
+                await asyncio.sleep(self.policy.backoff(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def subscribe_event(self, attr_name, event_type, callback,
+                              *args, **kwargs):
+        subscription = _ResilientSubscription(attr_name, event_type,
+                                              callback, args, kwargs)
+        subscription.sub_id = await super().subscribe_event(
+            attr_name, event_type, callback, *args, **kwargs)
+        sub_id = next(self._sub_count)
+        self._subscriptions[sub_id] = subscription
+        return sub_id
+
+    def unsubscribe_event(self, sub_id):
+        subscription = self._subscriptions.pop(sub_id)
+        return super().unsubscribe_event(subscription.sub_id)
+
+    async def _resubscribe(self):
+        for subscription in list(self._subscriptions.values()):
+            try:
+                self._proxy.unsubscribe_event(subscription.sub_id)
+            except Exception:
+                pass  # lost along with the device
+            try:
+                subscription.sub_id = await super().subscribe_event(
+                    subscription.attr_name, subscription.event_type,
+                    subscription.callback, *subscription.args,
+                    **subscription.kwargs)
+            except Exception:
+                logging.exception(
+                    f"Could not subscribe again to"
+                    f" {self.dev_name}/{subscription.attr_name}")
+
+
+_resilience_wrappers: Dict[ProxyPool, Callable] = {}
+
+
+def enable_resilience(policy: Optional[ResiliencePolicy] = None,
+                      pool: Optional[ProxyPool] = None) -> ResiliencePolicy:
+    '''Wraps every proxy created from now on by pool, or by both the pools
+    used by _get_device_proxy if no pool is given, in a ResilientProxy
+    following policy, a default ResiliencePolicy if not given. Returns the
+    policy.'''
+    policy = policy or ResiliencePolicy()
+    pools: List[ProxyPool] = [pool] if pool is not None \
+        else get_proxy_pools()
+    for pool in pools:
+        disable_resilience(pool)
+        _resilience_wrappers[pool] = functools.partial(ResilientProxy,
+                                                       policy=policy)
+        pool.add_wrapper(_resilience_wrappers[pool])
+    return policy
+
+
+def disable_resilience(pool: Optional[ProxyPool] = None):
+    pools: List[ProxyPool] = [pool] if pool is not None \
+        else get_proxy_pools()
+    for pool in pools:
+        if pool in _resilience_wrappers:
+            pool.remove_wrapper(_resilience_wrappers.pop(pool))
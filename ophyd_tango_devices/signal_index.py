@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from PyTango import DevFailed  # type: ignore
+from PyTango._tango import EventType  # type: ignore
+from .pool import ProxyHelper, ProxyHelpers
+from .proxy import DeviceProxy
+from .interface_cache import get_interface_cache
+from .introspection import (get_attribute_list, get_command_list,
+                            get_pipe_list)
+from .subscriptions import get_subscription_registry
+
+
+class SignalNotFoundError(KeyError):
+    ...
+
+
+class SignalIndex(ProxyHelper):
+    """
+    SignalIndex(proxy: DeviceProxy, dev_name: str)
+    Shared record of the attributes, commands and pipes exported by the
+    device behind a single DeviceProxy, used to validate signals at connect
+    time without reading their values. Each signal list is fetched once, and
+    the attribute configurations requested during one iteration of the event
+    loop are fetched with a single get_attribute_config call. If an
+    InterfaceCache is enabled the index is filled from it instead. Name
+    lookups are case insensitive, as they are in Tango.
+    The configuration of an attribute is kept up to date while it is
+    watched with watch_config(), through a single ATTR_CONF_EVENT
+    subscription shared by all its watchers, so the limits and descriptors
+    derived from it can be cached by comparing the configuration objects.
+    """
+    def __init__(self, proxy: DeviceProxy, dev_name: str):
+        super().__init__(proxy)
+        self.dev_name = dev_name
+        self._lists: Dict[str, asyncio.Future] = {}
+        self._names: Dict[str, Dict[str, str]] = {}
+        self._configs: Dict[str, Any] = {}
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._loaded: Optional[asyncio.Future] = None
+        self._conf_tokens: Dict[str, Optional[int]] = {}
+        self._watches: Dict[int, str] = {}
+        self._watch_count = itertools.count(1)
+        self.config_batches = 0
+
+    async def _load_from_cache(self):
+        '''Fills the index from the enabled InterfaceCache, once'''
+        if self._loaded is None:
+            self._loaded = asyncio.ensure_future(self._load())
+        await asyncio.shield(self._loaded)
+
+    async def _load(self):
+        cache = get_interface_cache()
+        if cache is None:
+            return
+        try:
+            interface = await cache.get(self.proxy, self.dev_name)
+        except Exception:
+            logging.exception(f"Could not get the interface of"
+                              f" {self.dev_name} from the cache")
+            return
+        for kind, names in (('attributes', interface.attributes),
+                            ('commands', interface.commands),
+                            ('pipes', interface.pipes)):
+            self._set_list(kind, names)
+        for name in interface.attributes:
+            config = interface.attribute_config(name)
+            if config is not None:
+                self._configs[name.lower()] = config
+
+    def _set_list(self, kind: str, names: List[str]):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(names)
+        self._lists[kind] = future
+        self._names[kind] = {name.lower(): name for name in names}
+
+    async def _get_list(self, kind: str,
+                        getter: Callable[[DeviceProxy], Awaitable[List[str]]]
+                        ) -> List[str]:
+        await self._load_from_cache()
+        if kind not in self._lists:
+            self._lists[kind] = asyncio.ensure_future(
+                self._fetch_list(kind, getter))
+        return await asyncio.shield(self._lists[kind])
+
+    async def _fetch_list(self, kind: str, getter) -> List[str]:
+        try:
+            names = await getter(self.proxy)
+        except Exception:
+            del self._lists[kind]  # retry on the next request
+            raise
+        self._names[kind] = {name.lower(): name for name in names}
+        return names
+
+    async def attributes(self) -> List[str]:
+        return await self._get_list('attributes', get_attribute_list)
+
+    async def commands(self) -> List[str]:
+        return await self._get_list('commands', get_command_list)
+
+    async def pipes(self) -> List[str]:
+        return await self._get_list('pipes', get_pipe_list)
+
+    async def find_attribute(self, attr_name: str) -> Optional[str]:
+        '''Returns the name of the attribute as exported by the device, or
+        None if the device has no such attribute'''
+        await self.attributes()
+        return self._names['attributes'].get(attr_name.lower())
+
+    async def find_command(self, command: str) -> Optional[str]:
+        await self.commands()
+        return self._names['commands'].get(command.lower())
+
+    async def find_pipe(self, pipe_name: str) -> Optional[str]:
+        await self.pipes()
+        return self._names['pipes'].get(pipe_name.lower())
+
+    def cached_attribute_config(self, attr_name: str):
+        return self._configs.get(attr_name.lower())
+
+    async def _exported_attribute(self, attr_name: str) -> str:
+        exported_name = await self.find_attribute(attr_name)
+        if exported_name is None:
+            raise SignalNotFoundError(
+                f"No attribute {attr_name} exported by {self.dev_name}")
+        return exported_name
+
+    async def attribute_config(self, attr_name: str):
+        '''Returns the configuration of the attribute, raising
+        SignalNotFoundError if the device does not export it'''
+        exported_name = await self._exported_attribute(attr_name)
+        key = exported_name.lower()
+        if key in self._configs:
+            return self._configs[key]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.setdefault(exported_name, []).append(future)
+        return await future
+
+    async def attribute_configs(self, attr_names: Iterable[str]) -> List:
+        return list(await asyncio.gather(
+            *[self.attribute_config(name) for name in attr_names]))
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._fetch_configs(pending))
+
+    async def _fetch_configs(self, pending: Dict[str, List[asyncio.Future]]):
+        attr_names = list(pending)
+        self.config_batches += 1
+        try:
+            configs = await self.proxy.get_attribute_config(attr_names)
+        except Exception as exc:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for attr_name, config in zip(attr_names, configs):
+            self._configs[attr_name.lower()] = config
+            for future in pending[attr_name]:
+                if not future.done():
+                    future.set_result(config)
+
+    async def watch_config(self, attr_name: str) -> int:
+        '''Keeps the cached configuration of the attribute up to date with
+        its ATTR_CONF_EVENTs until unwatch_config() is called with the
+        returned token'''
+        exported_name = await self._exported_attribute(attr_name)
+        key = exported_name.lower()
+        token = next(self._watch_count)
+        self._watches[token] = key
+        if key in self._conf_tokens:
+            return token
+        self._conf_tokens[key] = None
+        registry = get_subscription_registry(self.proxy)
+        try:
+            conf_token = await registry.subscribe(
+                exported_name, EventType.ATTR_CONF_EVENT,
+                lambda event: self._on_conf_event(key, event))
+        except DevFailed:
+            logging.warning(
+                f"Could not subscribe to configuration events for"
+                f" {self.dev_name}/{exported_name}, its configuration will"
+                f" not be refreshed")
+            return token
+        if key in self._conf_tokens and self._conf_tokens[key] is None:
+            self._conf_tokens[key] = conf_token
+        else:  # unwatched while subscribing
+            registry.unsubscribe(conf_token)
+        return token
+
+    def unwatch_config(self, token: int):
+        '''Releases a token returned by watch_config(), cancelling the
+        ATTR_CONF_EVENT subscription once the attribute has no watchers'''
+        key = self._watches.pop(token)
+        if key in self._watches.values():
+            return
+        conf_token = self._conf_tokens.pop(key, None)
+        # no longer refreshed, so fetched again when next requested
+        self._configs.pop(key, None)
+        if conf_token is not None and self.proxy_alive:
+            get_subscription_registry(self.proxy).unsubscribe(conf_token)
+
+    def _on_conf_event(self, key: str, event):
+        config = getattr(event, 'attr_conf', None)
+        if getattr(event, 'err', False) or config is None:
+            self._configs.pop(key, None)  # fetched again when next requested
+        else:
+            self._configs[key] = config
+
+
+_signal_indexes = ProxyHelpers(SignalIndex)
+
+
+def get_signal_index(proxy: DeviceProxy, dev_name: str) -> SignalIndex:
+    return _signal_indexes.get(proxy, dev_name)
@@ -1,43 +1,74 @@
-from PyTango import DevFailed, EventData  # type: ignore
-from PyTango._tango import (DevState,  # type: ignore
-                            EventType, TimeVal)
+from PyTango import DevFailed, EventData, ExtractAs  # type: ignore
+from PyTango._tango import (EventType, TimeVal,  # type: ignore
+                            AttrDataFormat, CmdArgType)
 import logging
 from .proxy import TangoProxy, SimProxy, DeviceProxy
-from typing import (Callable, Generic, TypeVar, get_type_hints, List,
-                    Dict, Protocol, Type, Optional, Coroutine)
+from .batching import batching_reads, get_read_coalescer
+from .buffers import MonitorDelivery
+from .subscriptions import get_subscription_registry
+from .polling import get_poller
+from .pool import ProxyPool
+from .signal_index import get_signal_index
+from .values import NUMPY_DTYPES
+from typing import (Any, Callable, Generic, TypeVar, get_type_hints, List,
+                    Dict, Protocol, Tuple, Type, Optional, Coroutine,
+                    Iterable)
 from ophyd.v2.core import CommsConnector  # type: ignore
 from bluesky.protocols import Reading, Descriptor
 from abc import ABC, abstractmethod
 from bluesky.protocols import Dtype
 from ophyd.v2.core import Signal, SignalR, SignalW, Comm
-import numpy as np  # type: ignore
 import asyncio
 import re
+import weakref
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from ophyd.v2.core import Monitor
+import numpy as np  # type: ignore
 
-_tango_dev_proxies: Dict[DeviceProxy, Dict[str, DeviceProxy]] = {}
+_tango_proxy_pools: Dict[type, ProxyPool] = {}
+_sim_proxy_class: type = SimProxy
+_lazy_connect: ContextVar[bool] = ContextVar('_lazy_connect', default=False)
 
 
 class TangoDeviceNotFoundError(KeyError):
     ...
 
 
+def set_sim_proxy_class(proxy_class) -> type:
+    '''Replaces the proxy class used in sim_mode, SimProxy by default,
+    returning the previous one'''
+    global _sim_proxy_class
+    previous, _sim_proxy_class = _sim_proxy_class, proxy_class
+    return previous
+
+
+def get_proxy_pool(sim_mode: bool = False) -> ProxyPool:
+    '''Returns the ProxyPool from which _get_device_proxy takes proxies,
+    whose max_size and idle_timeout may be set to bound it'''
+    proxy_class = TangoProxy if not sim_mode else _sim_proxy_class
+    if proxy_class not in _tango_proxy_pools:
+        _tango_proxy_pools[proxy_class] = ProxyPool(proxy_class)
+    return _tango_proxy_pools[proxy_class]
+
+
+def get_proxy_pools() -> List[ProxyPool]:
+    '''Returns the ProxyPools of both real and simulated proxies'''
+    return [get_proxy_pool(sim_mode=False), get_proxy_pool(sim_mode=True)]
+
+
 async def _get_device_proxy(
             dev_name: str,
             sim_mode: bool = False,
-            proxy_dict=_tango_dev_proxies) -> DeviceProxy:
-    proxy_class = TangoProxy if not sim_mode else SimProxy
-    if proxy_class not in proxy_dict:
-        proxy_dict[proxy_class] = {}
-    if dev_name not in proxy_dict[proxy_class]:
-        try:
-            proxy_future = proxy_class(dev_name)
-            proxy = await proxy_future
-            proxy_dict[proxy_class][dev_name] = proxy
-        except DevFailed or KeyError:
-            raise TangoDeviceNotFoundError(
-                f"Could not connect to {proxy_class} for {dev_name}")
-    return proxy_dict[proxy_class][dev_name]
+            pool: Optional[ProxyPool] = None) -> DeviceProxy:
+    if pool is None:  # an empty pool is falsy
+        pool = get_proxy_pool(sim_mode)
+    try:
+        return await pool.get(dev_name)
+    except (DevFailed, KeyError):
+        raise TangoDeviceNotFoundError(
+            f"Could not connect to {pool.proxy_class} for {dev_name}")
 
 
 class TangoSignal(Signal, ABC):
@@ -51,12 +82,19 @@ class TangoSignal(Signal, ABC):
         ...
     _connected: bool = False
     _source: Optional[str] = None
+    _lazy_comm: Optional['TangoComm'] = None  # set for lazily connected comms
     name: str  # set in make_tango_signals
 
     @property
     def connected(self):
         return self._connected
 
+    async def _ensure_connected(self):
+        '''Connects the signal through its comm if it belongs to a lazily
+        connected TangoComm and has not been connected yet'''
+        if not self._connected and self._lazy_comm is not None:
+            await self._lazy_comm._connect_lazily_(self)
+
     @property
     def source(self) -> str:
         if not self._source:
@@ -73,33 +111,124 @@ class TangoSignal(Signal, ABC):
         return self._source
 
 
+# reasons for which Tango refuses change events that polling can replace,
+# as opposed to errors such as the device being down
+_no_change_events_reasons = ('API_EventPropertiesNotSet',
+                             'API_AttributePollingNotStarted')
+
+
+def _no_change_events(error: DevFailed) -> bool:
+    return any(getattr(err, 'reason', None) in _no_change_events_reasons
+               for err in error.args)
+
+
 class TangoSignalMonitor(Monitor):
     """
-    TangoSignalMonitor(signal: TangoSignal)
+    TangoSignalMonitor(signal: TangoSignal,
+                       poll_period: Optional[float] = None)
     Callable with a single argument: callback, which gets called on the
     event data whenever there is an update to the Signal.
     close() is used to cancel the subscription and must be called manually
     when the desired end condition for monitoring is met.
+    Monitors of the same signal share a single Tango subscription through
+    the SubscriptionRegistry of the signal's DeviceProxy, which unsubscribes
+    when the last of them is closed.
+    If poll_period is given, or the device has no change events configured
+    for an attribute, the attribute is instead polled by the
+    PollingScheduler of the DeviceProxy, whose events the callback receives
+    in the same way. Other errors from subscribing, such as the device
+    being down, are raised.
     """
-    def __init__(self, signal: TangoSignal):
+    fallback_poll_period = 1.0
+
+    def __init__(self, signal: TangoSignal,
+                 poll_period: Optional[float] = None):
         self.signal = signal
+        self.poll_period = poll_period
         self.sub_id = None
+        self.polling = False
 
     async def __call__(self, callback=None):
         if not self.sub_id:
-            self.sub_id = await self.signal._proxy_.subscribe_event(
-                self.signal._signal_name, EventType.CHANGE_EVENT, callback)
+            await self.signal._ensure_connected()
+            poll_period = self.poll_period
+            if poll_period is None:
+                registry = get_subscription_registry(self.signal._proxy_)
+                try:
+                    self.sub_id = await registry.subscribe(
+                        self.signal._signal_name, EventType.CHANGE_EVENT,
+                        callback)
+                    return
+                except DevFailed as exc:
+                    if not isinstance(self.signal, TangoAttr) or \
+                            not _no_change_events(exc):
+                        raise
+                    poll_period = self.fallback_poll_period
+                    logging.warning(
+                        f"No change events for {self.signal._dev_name}/"
+                        f"{self.signal._signal_name}, polling it every"
+                        f" {poll_period} s instead")
+            poller = get_poller(self.signal._proxy_)
+            self.sub_id = poller.subscribe(
+                self.signal._signal_name, callback, poll_period)
+            self.polling = True
 
     def close(self):
-        self.signal._proxy_.unsubscribe_event(self.sub_id)
-        self.sub_id = None
+        if self.sub_id:
+            if self.polling:
+                get_poller(self.signal._proxy_).unsubscribe(self.sub_id)
+                self.polling = False
+            else:
+                registry = get_subscription_registry(self.signal._proxy_)
+                registry.unsubscribe(self.sub_id)
+            self.sub_id = None
 
 
 class TangoAttrReadError(KeyError):
     ...
 
 
+class _AttrValueCache:
+    """
+    _AttrValueCache(max_age: Optional[float] = None)
+    Holds the most recent DeviceAttribute of an attribute, as delivered by its
+    change events or by a fallback read. get() returns None if nothing is
+    cached, the cached value is older than max_age seconds, or the last event
+    reported an error, in which case the caller should read the attribute.
+    """
+    def __init__(self, max_age: Optional[float] = None):
+        self.max_age = max_age
+        self._attr_data = None
+        self._updated_at = 0.0
+        self._failed = False
+
+    def get(self):
+        if self._attr_data is None or self._failed:
+            return None
+        if (self.max_age is not None
+                and time.monotonic() - self._updated_at > self.max_age):
+            return None
+        return self._attr_data
+
+    def update(self, attr_data):
+        self._attr_data = attr_data
+        self._updated_at = time.monotonic()
+
+    def invalidate(self):
+        self._attr_data = None
+
+    def on_event(self, event):
+        if getattr(event, 'err', False):
+            self._failed = True
+            self._attr_data = None
+        else:
+            self._failed = False
+            self.update(event.attr_value)
+
+
 class TangoAttr(TangoSignal):
+    _value_cache: Optional[_AttrValueCache] = None
+
     def __init__(self, *args, **kwargs):
         if self.__class__ is TangoAttr:
             raise TypeError(
@@ -112,82 +241,214 @@ class TangoAttr(TangoSignal):
             self._dev_name = dev_name
             self._signal_name = attr
             self._proxy_ = proxy or await _get_device_proxy(self._dev_name)
+            # validated from its configuration, so no value is read
+            index = get_signal_index(self._proxy_, dev_name)
             try:
-                await self._proxy_.read_attribute(attr)
-            except DevFailed or KeyError:
+                await index.attribute_config(attr)
+            except (DevFailed, KeyError):
                 raise TangoAttrReadError(
-                    f"Could not read attribute {self._signal_name}")
+                    f"Could not find attribute {attr} of {dev_name}")
             self._connected = True
 
 
 class _TangoMonitorableSignal(TangoSignal):
-    async def monitor_reading(self, callback: Callable[[EventData], None]):
-        monitor = TangoSignalMonitor(self)
+    async def monitor_reading(self, callback: Callable[[EventData], None],
+                              poll_period: Optional[float] = None):
+        monitor = TangoSignalMonitor(self, poll_period)
         await monitor(callback)
         return monitor
 
-    async def monitor_value(self, callback: Callable[[EventData], None]):
-        monitor = TangoSignalMonitor(self)
+    async def monitor_value(self, callback: Callable[[EventData], None],
+                            poll_period: Optional[float] = None):
+        monitor = TangoSignalMonitor(self, poll_period)
 
         def value_callback(doc, callback=callback):
             callback(doc.attr_value.value)
         await monitor(value_callback)
         return monitor
 
+    async def monitor_queue(self, delivery: MonitorDelivery,
+                            readings: bool = False,
+                            poll_period: Optional[float] = None):
+        '''Monitors the signal, putting each new value (or event data, if
+        readings is True) into delivery, a MonitorDelivery such as a
+        BoundedQueue, RingQueue or LatestValue, from which a consumer can
+        take them at its own pace.'''
+        if readings:
+            return await self.monitor_reading(delivery.put, poll_period)
+        return await self.monitor_value(delivery.put, poll_period)
+
+
+_descriptor_dtypes: Dict[CmdArgType, Dtype] = {
+    CmdArgType.DevDouble: 'number',
+    CmdArgType.DevFloat: 'number',
+    CmdArgType.DevShort: 'integer',
+    CmdArgType.DevUShort: 'integer',
+    CmdArgType.DevLong: 'integer',
+    CmdArgType.DevULong: 'integer',
+    CmdArgType.DevLong64: 'integer',
+    CmdArgType.DevULong64: 'integer',
+    CmdArgType.DevUChar: 'integer',
+    CmdArgType.DevEnum: 'integer',
+    CmdArgType.DevString: 'string',
+    CmdArgType.DevState: 'string',
+    CmdArgType.DevBoolean: 'boolean',
+}
+
 
 class TangoAttrR(TangoAttr, _TangoMonitorableSignal, SignalR):
+    _descriptor: Optional[Descriptor] = None
+    _descriptor_config: Any = None
+    _config_watch: Optional[weakref.finalize] = None
+    _is_array: bool = False
+    _numpy_dtype: Optional[np.dtype] = None
 
-    def _get_shape(self, reading):
-        shape = []
-        if reading.dim_y:  # For 2D arrays
-            if reading.dim_x:
-                shape.append(reading.dim_x)
-            shape.append(reading.dim_y)
-        elif reading.dim_x > 1:  # for 1D arrays
-            # scalars should be returned as [], not [1]
-            shape.append(reading.dim_x)
-        return shape
-
-    def _get_dtype(self, attr_data) -> Dtype:
-        '''Returns the appropriate JSON type for the value of a Tango signal
-        reading from "string", "number", "array", "boolean" or "integer".'''
-        value_class = type(attr_data.value)
-        if value_class in (float, np.float64):
-            return 'number'
-        elif value_class is int:
-            return 'integer'
-        elif value_class is tuple:
+    async def connect(self, dev_name: str, attr: str,
+                      proxy: Optional[DeviceProxy] = None):
+        if not self.connected:
+            await super().connect(dev_name, attr, proxy)
+            await self._cache_descriptor()
+
+    def _get_shape(self, config) -> List[Optional[int]]:
+        if config.data_format == AttrDataFormat.IMAGE:
+            return [config.max_dim_y, config.max_dim_x]
+        elif config.data_format == AttrDataFormat.SPECTRUM:
+            return [config.max_dim_x]
+        # scalars should be returned as [], not [1]
+        return []
+
+    def _get_dtype(self, config) -> Dtype:
+        '''Returns the appropriate JSON type for the value of a Tango attribute
+        from "string", "number", "array", "boolean" or "integer", given its
+        attribute configuration.'''
+        if config.data_format != AttrDataFormat.SCALAR:
             return 'array'
-        elif value_class in (str, DevState):
-            return 'string'
-        elif value_class is bool:
-            return 'boolean'
-        else:
+        try:
+            return _descriptor_dtypes[config.data_type]
+        except KeyError:
             raise NotImplementedError(
                 f"Descriptor dtype not implemented for attribute"
-                f" {self._dev_name}/{self._signal_name}, type: {value_class}")
-
-    async def get_reading(self) -> Reading:
-        attr_data = await self._proxy_.read_attribute(self._signal_name)
-        return Reading({"value": attr_data.value,
+                f" {self._dev_name}/{self._signal_name},"
+                f" type: {config.data_type}")
+
+    def _make_descriptor(self, config) -> Descriptor:
+        self._is_array = config.data_format != AttrDataFormat.SCALAR
+        descriptor = Descriptor({"shape": self._get_shape(config),
+                                 "dtype": self._get_dtype(config),
+                                 "source": self.source, })
+        if config.data_type in NUMPY_DTYPES \
+                and config.data_type != CmdArgType.DevString:
+            self._numpy_dtype = np.dtype(NUMPY_DTYPES[config.data_type])
+            descriptor["dtype_numpy"] = self._numpy_dtype.str
+        return descriptor
+
+    async def _cache_descriptor(self):
+        '''Builds the descriptor from the attribute configuration in the
+        SignalIndex, unless it was built from the same configuration'''
+        index = get_signal_index(self._proxy_, self._dev_name)
+        config = await index.attribute_config(self._signal_name)
+        if config is not self._descriptor_config:
+            self._descriptor = self._make_descriptor(config)
+            self._descriptor_config = config
+
+    async def _watch_config(self):
+        '''Has the SignalIndex keep the attribute configuration up to date
+        until this signal is garbage collected'''
+        if self._config_watch is None:
+            index = get_signal_index(self._proxy_, self._dev_name)
+            token = await index.watch_config(self._signal_name)
+            if self._config_watch is None:
+                self._config_watch = weakref.finalize(
+                    self, index.unwatch_config, token)
+                self._config_watch.atexit = False
+            else:  # watched by a concurrent call
+                index.unwatch_config(token)
+
+    async def enable_value_cache(self, max_age: Optional[float] = None):
+        '''Serve get_value() and get_reading() from the latest change event
+        of the attribute, using a single subscription. Falls back to reading
+        the attribute if the cached value is older than max_age seconds
+        (if given) or if the subscription reports an error.'''
+        if self._value_cache is None:
+            self._value_cache = _AttrValueCache(max_age)
+            self._value_cache_monitor = await self.monitor_reading(
+                self._value_cache.on_event)
+        else:
+            self._value_cache.max_age = max_age
+
+    def disable_value_cache(self):
+        if self._value_cache is not None:
+            self._value_cache_monitor.close()
+            self._value_cache = None
+
+    async def _read_attribute(self):
+        await self._ensure_connected()
+        if self._value_cache is not None:
+            attr_data = self._value_cache.get()
+            if attr_data is not None:
+                return attr_data
+        if batching_reads():
+            coalescer = get_read_coalescer(self._proxy_)
+            attr_data = await coalescer.read_attribute(self._signal_name)
+        elif self._is_array:
+            attr_data = await self._proxy_.read_attribute(
+                self._signal_name, extract_as=ExtractAs.Numpy)
+        else:
+            attr_data = await self._proxy_.read_attribute(self._signal_name)
+        if self._value_cache is not None:
+            self._value_cache.update(attr_data)
+        return attr_data
+
+    def _array_value(self, value, out: Optional[np.ndarray] = None):
+        '''Returns the value of an array attribute as an ndarray, without
+        copying it unless it is copied into out'''
+        if value is None:  # e.g. an attribute of INVALID quality
+            return None
+        if not isinstance(value, np.ndarray):
+            value = np.asarray(value, dtype=self._numpy_dtype)
+        if out is None:
+            return value
+        if out.shape != value.shape:
+            raise ValueError(
+                f"Can not read {self._dev_name}/{self._signal_name} of shape"
+                f" {value.shape} into a buffer of shape {out.shape}")
+        np.copyto(out, value, casting='same_kind')
+        return out
+
+    async def get_reading(self, out: Optional[np.ndarray] = None) -> Reading:
+        '''Returns the reading of the attribute. Array values are given as
+        ndarrays, copied into out if a preallocated buffer is passed.'''
+        attr_data = await self._read_attribute()
+        value = attr_data.value
+        if self._is_array or out is not None:
+            value = self._array_value(value, out)
+        return Reading({"value": value,
                         "timestamp": attr_data.time.totime()})
 
     async def get_descriptor(self) -> Descriptor:
-        attr_data = await self._proxy_.read_attribute(self._signal_name)
-        return Descriptor({"shape": self._get_shape(attr_data),
-                           "dtype": self._get_dtype(attr_data),
-                           "source": self.source, })
-
-    async def get_value(self):
-        attr_data = await self._proxy_.read_attribute(self._signal_name)
+        await self._ensure_connected()
+        # subscribed to configuration changes on first use, not on connect,
+        # so that connecting only makes the batched configuration query
+        await self._watch_config()
+        await self._cache_descriptor()
+        return self._descriptor  # type: ignore
+
+    async def get_value(self, out: Optional[np.ndarray] = None):
+        attr_data = await self._read_attribute()
+        if self._is_array or out is not None:
+            return self._array_value(attr_data.value, out)
         return attr_data.value
 
 
 class TangoAttrW(TangoAttr, SignalW):
     async def put(self, value):
+        await self._ensure_connected()
+        if self._value_cache is not None:
+            self._value_cache.invalidate()
         await self._proxy_.write_attribute(self._signal_name, value)
 
     async def get_quality(self):
+        await self._ensure_connected()
         reading = await self._proxy_.read_attribute(self._signal_name)
         return reading.quality
 
@@ -196,6 +457,28 @@ class TangoAttrRW(TangoAttrR, TangoAttrW):
     ...
 
 
+async def put_attributes(values: Iterable[Tuple[TangoAttrW, Any]]):
+    '''Puts each value to its attribute signal, with a single
+    write_attributes call for all the signals sharing a DeviceProxy, and
+    the calls to different proxies made concurrently'''
+    groups: Dict[DeviceProxy, List[Tuple[TangoAttrW, Any]]] = {}
+    for signal, value in values:
+        await signal._ensure_connected()
+        if signal._value_cache is not None:
+            signal._value_cache.invalidate()
+        groups.setdefault(signal._proxy_, []).append((signal, value))
+    writes = []
+    for proxy, signal_values in groups.items():
+        if len(signal_values) == 1:
+            [(signal, value)] = signal_values
+            writes.append(proxy.write_attribute(signal._signal_name, value))
+        else:
+            writes.append(proxy.write_attributes(
+                [(signal._signal_name, value)
+                 for signal, value in signal_values]))
+    await asyncio.gather(*writes)
+
+
 class TangoCommand(TangoSignal):
     async def connect(
             self, dev_name: str, command: str,
@@ -204,15 +487,21 @@ class TangoCommand(TangoSignal):
             self._dev_name = dev_name
             self._signal_name = command
             self._proxy_ = proxy or await _get_device_proxy(self._dev_name)
-            commands = self._proxy_.get_command_list()
-            assert self._signal_name in commands, \
+            index = get_signal_index(self._proxy_, dev_name)
+            assert await index.find_command(command) is not None, \
                 f"Command {command} not in list of commands"
             self._connected = True
 
     def execute(self, value=None):
+        if not self._connected and self._lazy_comm is not None:
+            return self._connect_and_execute(value)
         command_args = [arg for arg in [self._signal_name, value] if arg]
         return self._proxy_.command_inout(*command_args)
 
+    async def _connect_and_execute(self, value=None):
+        await self._ensure_connected()
+        return await self.execute(value)
+
 
 class TangoPipeReadError(KeyError):
     ...
@@ -231,11 +520,10 @@ class TangoPipe(TangoSignal):
             self._dev_name = dev_name
             self._signal_name = pipe
             self._proxy_ = proxy or await _get_device_proxy(self._dev_name)
-            try:
-                await self._proxy_.read_pipe(self._signal_name)
-            except DevFailed or KeyError:
+            index = get_signal_index(self._proxy_, dev_name)
+            if await index.find_pipe(pipe) is None:
                 raise TangoPipeReadError(
-                    f"Couldn't read pipe {self._signal_name}")
+                    f"Pipe {pipe} not in list of pipes of {dev_name}")
             self._connected = True
 
 
@@ -245,6 +533,7 @@ class TangoPipeR(TangoPipe, _TangoMonitorableSignal, SignalR):
         return Reading({"value": pipe_data, "timestamp": TimeVal().now()})
 
     async def get_descriptor(self) -> Descriptor:
+        await self._ensure_connected()
         # if we are returning the pipe it is a tuple with string
         # and list of dicts, so dimensionality 2
         return Descriptor({"shape": [2],
@@ -252,6 +541,7 @@ class TangoPipeR(TangoPipe, _TangoMonitorableSignal, SignalR):
                            "source": self.source, })
 
     async def get_value(self):
+        await self._ensure_connected()
         pipe_data_or_future = self._proxy_.read_pipe(self._signal_name)
         if type(pipe_data_or_future) is tuple:
             return pipe_data_or_future
@@ -262,6 +552,7 @@ class TangoPipeR(TangoPipe, _TangoMonitorableSignal, SignalR):
 class TangoPipeW(TangoPipe, SignalW):
 
     async def put(self, value):
+        await self._ensure_connected()
         try:
             await self._proxy_.write_pipe(self._signal_name, value)
         except TypeError:
@@ -272,8 +563,33 @@ class TangoPipeRW(TangoPipeR, TangoPipeW):
     ...
 
 
+@contextmanager
+def lazy_connect(enabled: bool = True):
+    '''
+    lazy_connect(enabled: bool = True)
+    Context manager under which TangoComms are created in lazy mode, unless
+    their lazy argument says otherwise.
+    '''
+    token = _lazy_connect.set(enabled)
+    try:
+        yield
+    finally:
+        _lazy_connect.reset(token)
+
+
 class TangoComm(Comm):
-    def __init__(self, dev_name: str):
+    """
+    TangoComm(dev_name: str, lazy: Optional[bool] = None)
+    Collection of the hinted TangoSignals of a single Tango device. By default
+    the comm is connected by its connector when the enclosing CommsConnector
+    exits. In lazy mode (lazy=True, or created inside lazy_connect()) nothing
+    is connected up front; instead each signal is connected on its first
+    get_value, get_reading, get_descriptor, put, execute or monitor call.
+    Signals first used during the same iteration of the event loop are
+    connected together, and concurrent first uses of a signal share one
+    connection.
+    """
+    def __init__(self, dev_name: str, lazy: Optional[bool] = None):
         if self.__class__ is TangoComm:
             raise TypeError(
                 "Can not create instance of TangoComm class")
@@ -281,13 +597,76 @@ class TangoComm(Comm):
         self._signals_ = make_tango_signals(self)
         self._sim_mode = CommsConnector.in_sim_mode()
         self._connector = get_tango_connector(self)
-        CommsConnector.schedule_connect(self)
+        self._lazy = _lazy_connect.get() if lazy is None else lazy
+        if self._lazy:
+            self._lazy_pending: Dict[Optional[str], asyncio.Future] = {}
+            self._lazy_batch: List[str] = []
+            for signal in self._signals_.values():
+                signal._lazy_comm = self
+        else:
+            CommsConnector.schedule_connect(self)
 
     async def _connect_(self):
         proxy = await _get_device_proxy(
             self._dev_name, sim_mode=self._sim_mode)
         await self._connector(self, proxy)
 
+    async def _connect_lazily_(self, signal: TangoSignal):
+        '''Connects signal, joining a connection that is already pending.
+        The default connector connects only the signals asked for in this
+        iteration of the event loop; other connectors are run once for the
+        whole comm.'''
+        if self._connector is ConnectSimilarlyNamed:
+            name: Optional[str] = next(
+                name for name, member in self._signals_.items()
+                if member is signal)
+        else:
+            name = None
+        if name not in self._lazy_pending:
+            loop = asyncio.get_running_loop()
+            self._lazy_pending[name] = loop.create_future()
+            if name is None:
+                asyncio.ensure_future(self._run_lazy_connect([None]))
+            else:
+                if not self._lazy_batch:
+                    loop.call_soon(self._flush_lazy_batch)
+                self._lazy_batch.append(name)
+        await asyncio.shield(self._lazy_pending[name])
+
+    def _flush_lazy_batch(self):
+        batch, self._lazy_batch = self._lazy_batch, []
+        asyncio.ensure_future(self._run_lazy_connect(batch))
+
+    async def _run_lazy_connect(self, names: List[Optional[str]]):
+        try:
+            proxy = await _get_device_proxy(
+                self._dev_name, sim_mode=self._sim_mode)
+            if names == [None]:
+                results: List[Any] = [await self._connector(self, proxy)]
+            else:
+                # connected separately, so that a signal that can not be
+                # connected does not fail the others
+                results = await asyncio.gather(
+                    *[ConnectSimilarlyNamed(self, proxy, [name])
+                      for name in names], return_exceptions=True)
+        except BaseException as exc:
+            self._resolve_lazy(names, [exc] * len(names))
+            if not isinstance(exc, Exception):
+                raise
+        else:
+            self._resolve_lazy(names, results)
+
+    def _resolve_lazy(self, names: List[Optional[str]], results: List[Any]):
+        for name, result in zip(names, results):
+            future = self._lazy_pending.pop(name)
+            if isinstance(result, asyncio.CancelledError):
+                future.cancel()
+            elif isinstance(result, BaseException):
+                future.set_exception(result)
+                future.exception()  # mark as retrieved if nobody waits
+            else:
+                future.set_result(None)
+
     def __repr__(self) -> str:
         return f"{type(self).__name__}(dev_name={self._dev_name!r})"
 
@@ -341,9 +720,11 @@ def tango_connector(connector, comm_cls=None):
 
 class ConnectSimilarlyNamed:
     '''
-    ConnectSimilarlyNamed(comm: TangoComm, proxy: Optional[DeviceProxy])
+    ConnectSimilarlyNamed(comm: TangoComm, proxy: Optional[DeviceProxy],
+                          signal_names: Optional[Iterable[str]])
     Connector class that checks DeviceProxy for similarly named signals to
-    those unconnected in the comm object.
+    those unconnected in the comm object, or to those of signal_names that
+    are unconnected, if given.
     The connector connects to attributes/pipes/commands that have identical
     names to the hinted signal name when lowercased and non alphanumeric
     characters are removed. e.g. the type hint "comm._position: TangoAttrRW"
@@ -358,18 +739,27 @@ class ConnectSimilarlyNamed:
         ...
 
     async def __call__(self, comm: TangoComm,
-                       proxy: Optional[DeviceProxy] = None):
+                       proxy: Optional[DeviceProxy] = None,
+                       signal_names: Optional[Iterable[str]] = None):
         self.comm = comm
         self.unconnected: Dict[str, TangoSignal] = {}
-        for signal_name in get_type_hints(comm):
+        if signal_names is None:
+            signal_names = get_type_hints(comm)
+        for signal_name in signal_names:
             signal = getattr(self.comm, signal_name)
             if not signal.connected:
                 self.unconnected[signal_name] = signal
         if not self.unconnected:  # if dict empty
             return
         self._proxy_ = proxy or await _get_device_proxy(comm._dev_name)
+        self._index = get_signal_index(self._proxy_, comm._dev_name)
         self.coros: List[Coroutine] = []
         self.guesses: Dict[str, Dict[str, str]] = {}
+        # one signal of each type, to fetch each signal list only once
+        signals_by_type = {type(signal): signal
+                           for signal in self.unconnected.values()}
+        await asyncio.gather(*[self.make_guesses(signal)
+                               for signal in signals_by_type.values()])
         for name, signal in self.unconnected.items():
             self.schedule_signal(signal, name)
         if self.coros:
@@ -379,17 +769,17 @@ class ConnectSimilarlyNamed:
     def guess_string(signal_name):
         return re.sub(r'\W+', '', signal_name).lower()
 
-    def make_guesses(self, signal):
+    async def make_guesses(self, signal):
         signal_type = type(signal)
         if signal_type not in self.guesses:
             self.guesses[signal_type] = {}
             # attribute (or pipe or command) names
             if isinstance(signal, TangoAttr):
-                signals = self._proxy_.get_attribute_list()
+                signals = await self._index.attributes()
             elif isinstance(signal, TangoPipe):
-                signals = self._proxy_.get_pipe_list()
+                signals = await self._index.pipes()
             elif isinstance(signal, TangoCommand):
-                signals = self._proxy_.get_command_list()
+                signals = await self._index.commands()
             else:
                 return
             for sig in signals:
@@ -399,8 +789,9 @@ class ConnectSimilarlyNamed:
                 # actual attribute names are values
 
     def schedule_signal(self, signal, signal_name):
+        '''Schedules the connection of signal, whose guesses must already
+        have been made'''
         signal_type = type(signal)
-        self.make_guesses(signal)
         name_guess = self.guess_string(signal_name)
         if name_guess in self.guesses[signal_type]:  # if key exists
             coro = signal.connect(self.comm._dev_name,
@@ -421,39 +812,28 @@ class ConnectWithoutReading:
     lists. Callable with keyword arguments where the keys are the names of the
     signals in the comm object and the values are the signal names as exported
     by the Tango device server. If not specified, the default signal name will
-    be the object's Pythonic name.
+    be the object's Pythonic name. The signal lists are taken from the
+    SignalIndex of the proxy, which is shared with the signals' own connect
+    methods and ConnectSimilarlyNamed.
     """
     def __init__(self, comm: TangoComm,
                  proxy: Optional[DeviceProxy] = None):
         self.comm = comm
         self._proxy_ = proxy
-        self._attributes: List[str] = []
-        self._commands: List[str] = []
-        self._pipes: List[str] = []
 
-    def __call__(self, **signal_names):
-        connect = False
+    async def __call__(self, **signal_names):
         hint_names = get_type_hints(self.comm).keys()
         for name in hint_names:
             if name not in signal_names:
                 signal_names[name] = name
-        for ophyd_name, signal_name in signal_names.items():
-            signal = getattr(self.comm, ophyd_name)
-            if isinstance(signal, TangoAttr):
-                if not self._attributes:
-                    self._attributes = self._proxy_.get_attribute_list()
-                if signal_name in self._attributes:
-                    connect = True
-            elif isinstance(signal, TangoPipe):
-                if not self._attributes:
-                    self._pipes = self._proxy_.get_pipe_list()
-                if signal_name in self._pipes:
-                    connect = True
-            elif isinstance(signal, TangoCommand):
-                if not self._commands:
-                    self._commands = self._proxy_.get_command_list()
-                if signal_name in self._attributes:
-                    connect = True
+        self._index = get_signal_index(self._proxy_, self.comm._dev_name)
+        signals = [getattr(self.comm, ophyd_name)
+                   for ophyd_name in signal_names]
+        found = await asyncio.gather(
+            *[self._find(signal, signal_name) for signal, signal_name
+              in zip(signals, signal_names.values())])
+        for signal, signal_name, connect in zip(
+                signals, signal_names.values(), found):
             if connect:
                 signal._dev_name = self.comm._dev_name
                 signal._signal_name = signal_name
@@ -462,3 +842,14 @@ class ConnectWithoutReading:
             else:
                 raise KeyError(f"{signal.__class__.__name__}"
                                f" {signal_name} not found")
+
+    async def _find(self, signal: TangoSignal, signal_name: str) -> bool:
+        if isinstance(signal, TangoAttr):
+            exported_name = await self._index.find_attribute(signal_name)
+        elif isinstance(signal, TangoPipe):
+            exported_name = await self._index.find_pipe(signal_name)
+        elif isinstance(signal, TangoCommand):
+            exported_name = await self._index.find_command(signal_name)
+        else:
+            return False
+        return exported_name is not None
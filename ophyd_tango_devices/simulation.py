@@ -0,0 +1,311 @@
+import json
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+import numpy as np  # type: ignore
+from PyTango import DevError, DevFailed  # type: ignore
+from PyTango._tango import (AttrDataFormat, AttrQuality,  # type: ignore
+                            CmdArgType, DevState)
+from .values import NUMPY_DTYPES
+
+_python_data_types = {
+    float: CmdArgType.DevDouble,
+    int: CmdArgType.DevLong64,
+    str: CmdArgType.DevString,
+    bool: CmdArgType.DevBoolean,
+    'float': CmdArgType.DevDouble,
+    'int': CmdArgType.DevLong64,
+    'str': CmdArgType.DevString,
+    'bool': CmdArgType.DevBoolean,
+}
+
+
+def _as_data_type(dtype) -> CmdArgType:
+    if isinstance(dtype, CmdArgType):
+        return dtype
+    if dtype in _python_data_types:
+        return _python_data_types[dtype]
+    if isinstance(dtype, str) and dtype in CmdArgType.names:
+        return CmdArgType.names[dtype]
+    raise TypeError(f"Can not simulate attributes of type {dtype!r}")
+
+
+def _sim_dev_failed(reason: str, desc: str) -> DevFailed:
+    error = DevError()
+    error.reason = reason
+    error.desc = desc
+    error.origin = 'SimProxy'
+    return DevFailed(error)
+
+
+class SimAttribute:
+    '''
+    SimAttribute(name, dtype=CmdArgType.DevDouble, shape=(), value=None,
+                 writable=True, **limits)
+    Specification of a simulated attribute. dtype may be a CmdArgType, its
+    name, or one of the Python types float, int, str or bool. shape is ()
+    for scalars, (x,) for spectrum attributes and (y, x) for images. The
+    limits min_value, max_value, min_alarm, max_alarm, min_warning and
+    max_warning are reported by get_attribute_config(); writes outside
+    min_value and max_value fail, and reads report the quality implied by
+    the alarm and warning ranges.
+    '''
+    _limit_names = ('min_value', 'max_value', 'min_alarm', 'max_alarm',
+                    'min_warning', 'max_warning')
+
+    def __init__(self, name: str, dtype=CmdArgType.DevDouble,
+                 shape: Sequence[int] = (), value=None, writable=True,
+                 **limits):
+        unknown = set(limits) - set(self._limit_names)
+        if unknown:
+            raise TypeError(f"Unknown limits for {name}: {sorted(unknown)}")
+        self.name = name
+        self.data_type = _as_data_type(dtype)
+        self.shape = tuple(shape)
+        if len(self.shape) > 2:
+            raise ValueError(f"Attribute {name} has more than two dimensions")
+        self.value = value
+        self.writable = writable
+        self.limits: Dict[str, Optional[float]] = {
+            limit: limits.get(limit) for limit in self._limit_names}
+
+    @property
+    def data_format(self):
+        return (AttrDataFormat.SCALAR, AttrDataFormat.SPECTRUM,
+                AttrDataFormat.IMAGE)[len(self.shape)]
+
+    @property
+    def max_dim_x(self) -> int:
+        return self.shape[-1] if self.shape else 1
+
+    @property
+    def max_dim_y(self) -> int:
+        return self.shape[0] if len(self.shape) == 2 else 0
+
+    def initial_value(self):
+        if self.shape:
+            if self.value is not None:
+                return np.array(self.value,
+                                dtype=NUMPY_DTYPES.get(self.data_type))
+            return np.zeros(self.shape,
+                            dtype=NUMPY_DTYPES.get(self.data_type))
+        if self.value is not None:
+            return self.value
+        if self.data_type == CmdArgType.DevState:
+            return DevState.ON
+        elif self.data_type == CmdArgType.DevString:
+            return ''
+        elif self.data_type == CmdArgType.DevBoolean:
+            return False
+        elif self.data_type in (CmdArgType.DevDouble, CmdArgType.DevFloat):
+            return 0.0
+        return 0
+
+    def coerce(self, value):
+        '''Converts a written value to the type it would be read back as'''
+        if self.shape:
+            return np.asarray(value, dtype=NUMPY_DTYPES.get(self.data_type))
+        return value
+
+    def check_write(self, value):
+        if not self.writable:
+            raise _sim_dev_failed(
+                'API_AttrNotWritable', f"Attribute {self.name} is read only")
+        if self.shape:
+            return
+        min_value, max_value = (self.limits['min_value'],
+                                self.limits['max_value'])
+        if (min_value is not None and value < min_value) or \
+                (max_value is not None and value > max_value):
+            raise _sim_dev_failed(
+                'API_WAttrOutsideLimit',
+                f"Value {value} for attribute {self.name} is outside the"
+                f" limits [{min_value}, {max_value}]")
+
+    def quality(self, value):
+        if self.shape or not isinstance(value, (int, float)):
+            return AttrQuality.ATTR_VALID
+        for low, high, quality in (('min_alarm', 'max_alarm',
+                                    AttrQuality.ATTR_ALARM),
+                                   ('min_warning', 'max_warning',
+                                    AttrQuality.ATTR_WARNING)):
+            low_limit, high_limit = self.limits[low], self.limits[high]
+            if (low_limit is not None and value < low_limit) or \
+                    (high_limit is not None and value > high_limit):
+                return quality
+        return AttrQuality.ATTR_VALID
+
+
+class SimCommand:
+    '''
+    SimCommand(name, handler=None)
+    Specification of a simulated command. If given, handler is called with
+    the SimProxy and the command argument (or None) and its return value is
+    returned by command_inout().
+    '''
+    def __init__(self, name: str,
+                 handler: Optional[Callable[[Any, Any], Any]] = None):
+        self.name = name
+        self.handler = handler
+
+
+class SimPipe:
+    '''
+    SimPipe(name, value=None)
+    Specification of a simulated pipe, whose value is a (name, data elements)
+    pair as returned by read_pipe().
+    '''
+    def __init__(self, name: str, value: Optional[Tuple[str, list]] = None):
+        self.name = name
+        self.value = tuple(value) if value is not None else (name, [])
+
+
+class SimMotion:
+    '''
+    SimMotion(position="Position", velocity="Velocity", state="State",
+              stop="Stop")
+    Names of the attributes and command that take part in simulated motion.
+    Writing to the position attribute puts the state attribute into MOVING
+    while the position travels to the setpoint at the current velocity, and
+    executing the stop command halts it.
+    '''
+    def __init__(self, position: str = 'Position',
+                 velocity: str = 'Velocity', state: str = 'State',
+                 stop: str = 'Stop'):
+        self.position = position
+        self.velocity = velocity
+        self.state = state
+        self.stop = stop
+
+
+class SimDeviceSpec:
+    '''
+    SimDeviceSpec(attributes=(), commands=(), pipes=(), motion=None,
+                  version="1", started_date="")
+    Declarative description of a simulated Tango device. A single spec may be
+    shared by any number of devices in a SimBackend; each SimProxy keeps its
+    own attribute and pipe values. version and started_date are reported as
+    those of the device server by the simulated database.
+    '''
+    def __init__(self, attributes: Iterable[SimAttribute] = (),
+                 commands: Iterable[SimCommand] = (),
+                 pipes: Iterable[SimPipe] = (),
+                 motion: Optional[SimMotion] = None,
+                 version: str = '1', started_date: str = ''):
+        self.version = version
+        self.started_date = started_date
+        self.attributes = {attr.name: attr for attr in attributes}
+        self.commands = {command.name: command for command in commands}
+        self.pipes = {pipe.name: pipe for pipe in pipes}
+        self.motion = motion
+        if motion:
+            for attr_name in (motion.position, motion.velocity,
+                              motion.state):
+                if attr_name not in self.attributes:
+                    raise KeyError(f"Motion attribute {attr_name} is not"
+                                   " in the device spec")
+            if motion.stop not in self.commands:
+                self.commands[motion.stop] = SimCommand(motion.stop)
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> 'SimDeviceSpec':
+        '''Builds a spec from a dictionary of the form
+        {"attributes": {name: {"dtype": ..., "shape": ..., ...}},
+         "commands": [name, ...], "pipes": {name: {"value": ...}},
+         "motion": {"position": ..., ...} or true}'''
+        attributes = [SimAttribute(name, **attr_spec) for name, attr_spec
+                      in spec.get('attributes', {}).items()]
+        commands = [SimCommand(name) for name in spec.get('commands', [])]
+        pipes = [SimPipe(name, **pipe_spec) for name, pipe_spec
+                 in spec.get('pipes', {}).items()]
+        motion = spec.get('motion')
+        if motion is True:
+            motion = SimMotion()
+        elif motion:
+            motion = SimMotion(**motion)
+        return cls(attributes, commands, pipes, motion,
+                   spec.get('version', '1'), spec.get('started_date', ''))
+
+
+def sim_motor_spec() -> SimDeviceSpec:
+    '''Spec of a device resembling the Sardana motors used by TangoMotor'''
+    return SimDeviceSpec(
+        attributes=[SimAttribute('Position', CmdArgType.DevDouble),
+                    SimAttribute('Velocity', CmdArgType.DevDouble),
+                    SimAttribute('State', CmdArgType.DevState)],
+        commands=[SimCommand('Stop')],
+        motion=SimMotion())
+
+
+class SimBackend:
+    '''
+    SimBackend()
+    Registry of simulated devices by name, from which SimProxy looks up the
+    spec of the device it is instantiated with. Devices can be added
+    individually, in bulk sharing one spec, or loaded from a declarative
+    dictionary or JSON file of the form
+
+    ::
+
+        {"devices": [{"name": "sim/motor/{}", "count": 1000,
+                      "attributes": {...}, "commands": [...],
+                      "pipes": {...}, "motion": true}]}
+
+    where "{}" in a name is replaced by 0 ... count - 1.
+    '''
+    def __init__(self):
+        self._devices: Dict[str, SimDeviceSpec] = {}
+
+    def add_device(self, dev_name: str, spec: SimDeviceSpec):
+        self._devices[dev_name] = spec
+
+    def add_devices(self, dev_names: Iterable[str], spec: SimDeviceSpec):
+        for dev_name in dev_names:
+            self._devices[dev_name] = spec
+
+    def load(self, spec: Dict[str, Any]) -> List[str]:
+        '''Adds the devices described in the spec dictionary and returns
+        their names'''
+        added: List[str] = []
+        for device in spec.get('devices', []):
+            device = dict(device)
+            name = device.pop('name')
+            count = device.pop('count', None)
+            dev_names = [name] if count is None else \
+                [name.format(index) for index in range(count)]
+            self.add_devices(dev_names, SimDeviceSpec.from_dict(device))
+            added.extend(dev_names)
+        return added
+
+    def load_file(self, path: str) -> List[str]:
+        with open(path) as spec_file:
+            return self.load(json.load(spec_file))
+
+    def get_spec(self, dev_name: str) -> SimDeviceSpec:
+        if dev_name not in self._devices:
+            raise KeyError(f"No simulated device named {dev_name}")
+        return self._devices[dev_name]
+
+    @property
+    def device_names(self) -> List[str]:
+        return list(self._devices)
+
+    def __contains__(self, dev_name: str) -> bool:
+        return dev_name in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+
+_sim_backend = SimBackend()
+_sim_backend.add_device('mock/device/name', sim_motor_spec())
+
+
+def get_sim_backend() -> SimBackend:
+    return _sim_backend
+
+
+def set_sim_backend(backend: SimBackend) -> SimBackend:
+    '''Replaces the backend used by SimProxy, returning the previous one'''
+    global _sim_backend
+    previous, _sim_backend = _sim_backend, backend
+    return previous
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+import logging
+from typing import Callable, Dict, Optional, Tuple
+from .pool import ProxyHelper, ProxyHelpers
+from .proxy import DeviceProxy
+
+
+class _Subscription:
+    def __init__(self):
+        self.sub_id: Optional[int] = None
+        self.callbacks: Dict[int, Optional[Callable]] = {}
+        self.last_event = None
+        self.ready = asyncio.get_running_loop().create_future()
+
+    def dispatch(self, event):
+        self.last_event = event
+        for callback in list(self.callbacks.values()):
+            if callback:
+                try:
+                    callback(event)
+                except Exception:
+                    logging.exception(
+                        f"Error in event callback {callback!r}")
+
+
+class SubscriptionRegistry(ProxyHelper):
+    """
+    SubscriptionRegistry(proxy: DeviceProxy)
+    Shares Tango event subscriptions on a single DeviceProxy. The first call
+    to subscribe() for an (attribute, event type) pair subscribes on the
+    proxy; later calls add their callback to the same subscription and
+    receive the most recent event straight away. The Tango subscription is
+    only cancelled once every token returned by subscribe() has been passed
+    to unsubscribe().
+    """
+    def __init__(self, proxy: DeviceProxy):
+        super().__init__(proxy)
+        self._subscriptions: Dict[Tuple[str, int], _Subscription] = {}
+        self._tokens: Dict[int, Tuple[str, int]] = {}
+        self._token_count = itertools.count(1)
+
+    def subscriber_count(self, attr_name: str, event_type) -> int:
+        key = (attr_name.lower(), int(event_type))
+        if key not in self._subscriptions:
+            return 0
+        return len(self._subscriptions[key].callbacks)
+
+    async def subscribe(self, attr_name: str, event_type,
+                        callback: Optional[Callable] = None) -> int:
+        key = (attr_name.lower(), int(event_type))
+        token = next(self._token_count)
+        self._tokens[token] = key
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            subscription = _Subscription()
+            self._subscriptions[key] = subscription
+            subscription.callbacks[token] = callback
+            try:
+                subscription.sub_id = await self.proxy.subscribe_event(
+                    attr_name, event_type, subscription.dispatch)
+            except BaseException as exc:
+                del self._subscriptions[key]
+                for pending in subscription.callbacks:
+                    self._tokens.pop(pending, None)
+                subscription.ready.set_exception(exc)
+                subscription.ready.exception()  # mark as retrieved
+                raise
+            subscription.ready.set_result(None)
+            if not subscription.callbacks:  # unsubscribed while pending
+                self._release(key)
+        elif not subscription.ready.done():
+            # the initial event has not been dispatched yet, so the callback
+            # will receive it along with the first subscriber
+            subscription.callbacks[token] = callback
+            await asyncio.shield(subscription.ready)
+        else:
+            subscription.callbacks[token] = callback
+            if callback and subscription.last_event is not None:
+                callback(subscription.last_event)
+        return token
+
+    def unsubscribe(self, token: int):
+        key = self._tokens.pop(token)
+        subscription = self._subscriptions[key]
+        del subscription.callbacks[token]
+        if not subscription.callbacks and subscription.ready.done():
+            self._release(key)
+
+    def _release(self, key: Tuple[str, int]):
+        subscription = self._subscriptions.pop(key)
+        self.proxy.unsubscribe_event(subscription.sub_id)
+
+
+_subscription_registries = ProxyHelpers(SubscriptionRegistry)
+
+
+def get_subscription_registry(proxy: DeviceProxy) -> SubscriptionRegistry:
+    return _subscription_registries.get(proxy)
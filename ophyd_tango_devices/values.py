@@ -0,0 +1,24 @@
+import numpy as np  # type: ignore
+from PyTango._tango import CmdArgType  # type: ignore
+
+# numpy dtypes of the values of Tango attributes, by data type
+NUMPY_DTYPES = {
+    CmdArgType.DevDouble: np.float64,
+    CmdArgType.DevFloat: np.float32,
+    CmdArgType.DevShort: np.int16,
+    CmdArgType.DevUShort: np.uint16,
+    CmdArgType.DevLong: np.int32,
+    CmdArgType.DevULong: np.uint32,
+    CmdArgType.DevLong64: np.int64,
+    CmdArgType.DevULong64: np.uint64,
+    CmdArgType.DevUChar: np.uint8,
+    CmdArgType.DevBoolean: np.bool_,
+    CmdArgType.DevString: np.str_,
+}
+
+
+def values_equal(first, second) -> bool:
+    '''Compares two attribute values, either of which may be an array'''
+    if isinstance(first, np.ndarray) or isinstance(second, np.ndarray):
+        return np.array_equal(first, second)
+    return first == second
@@ -1,5 +1,55 @@
-from ophyd_tango_devices.motor import tango_motor
+from ophyd_tango_devices.motor import (TangoMotorComm, TangoMotorGroup,
+                                       tango_motor)
+from ophyd_tango_devices.proxy import SimProxy, _SimAttributeInfoEx
+from ophyd_tango_devices.limits import (AttributeLimits, OutsideLimitsError,
+                                        get_limits_cache)
+from ophyd_tango_devices.batching import ReadCoalescer, get_read_coalescer
+from ophyd_tango_devices.signals import (ConnectWithoutReading, TangoAttrR,
+                                         TangoCommand,
+                                         TangoSignalMonitor, _get_device_proxy,
+                                         get_proxy_pool, lazy_connect,
+                                         set_sim_proxy_class)
+from ophyd_tango_devices.subscriptions import (SubscriptionRegistry,
+                                               get_subscription_registry)
+from ophyd_tango_devices.pool import ProxyPool, ProxyReleasedError
+from ophyd_tango_devices.faults import (FaultInjectingProxy, FaultInjector,
+                                        FaultProfile, enable_fault_injection,
+                                        disable_fault_injection)
+from ophyd_tango_devices.deadlines import (DeadlinePolicy, DeadlineProxy,
+                                           TangoTimeoutError,
+                                           disable_deadlines,
+                                           enable_deadlines)
+from ophyd_tango_devices.resilience import (CircuitOpenError,
+                                            ResiliencePolicy, ResilientProxy,
+                                            disable_resilience,
+                                            enable_resilience)
+from ophyd_tango_devices.replay import (RecordingProxy, ReplayProxy, Trace,
+                                        record_trace, set_replay_trace)
+from ophyd_tango_devices.metrics import (MetricsProxy, MetricsRegistry,
+                                         disable_metrics, enable_metrics)
+from ophyd_tango_devices.buffers import (BoundedQueue, LatestValue,
+                                         RingBuffer, RingQueue)
+from ophyd_tango_devices.flyer import TangoFlyer
+from ophyd_tango_devices.polling import PollingScheduler
+from ophyd_tango_devices.simulation import (SimBackend, set_sim_backend,
+                                            sim_motor_spec)
+from ophyd_tango_devices.interface_cache import (InterfaceCache,
+                                                 disable_interface_cache,
+                                                 enable_interface_cache)
+from PyTango import DevError, DevFailed  # type: ignore
+from PyTango._tango import AttrDataFormat, DevState, EventType
+import asyncio
+import functools
+import gc
+import os
+import tempfile
+import threading
+import time
+import types
 import unittest
+import urllib.request
+import numpy as np  # type: ignore
+from unittest import mock
 from ophyd.v2.core import CommsConnector
 from bluesky.run_engine import RunEngine
 from bluesky.run_engine import call_in_bluesky_event_loop
@@ -11,6 +61,12 @@ from bluesky.callbacks import LiveTable
 RE = RunEngine()
 
 
+def dev_failed(reason: str) -> DevFailed:
+    error = DevError()
+    error.reason = reason
+    return DevFailed(error)
+
+
 class MotorTestMockDeviceProxy(unittest.IsolatedAsyncioTestCase):
     '''Replaces the (Async)DeviceProxy object with the MockDeviceProxy class,
     so makes no outside calls to the network for Tango commands'''
@@ -51,6 +107,21 @@ class MotorTestMockDeviceProxy(unittest.IsolatedAsyncioTestCase):
         call_in_bluesky_event_loop(self.test_motor.configure('velocity', 1000))
         RE(bps.mv(self.test_motor, rand_number))
 
+    async def test_read_is_batched(self):
+        coalescer = get_read_coalescer(self.test_motor.comm.position._proxy_)
+        batches = coalescer.batches
+        await self.test_motor.read()
+        assert coalescer.batches == batches + 1
+
+    async def test_describe_makes_no_network_calls(self):
+        proxy = self.test_motor.comm.position._proxy_
+        description = await self.test_motor.describe()
+        with mock.patch.object(proxy, "get_attribute_config",
+                               side_effect=AssertionError), \
+                mock.patch.object(proxy, "read_attribute",
+                                  side_effect=AssertionError):
+            assert await self.test_motor.describe() == description
+
     async def test_motor_scans(self):
         rand_number = random.random() + 1.0
         RE(scan([], self.test_motor, 0, rand_number, 2),
@@ -58,3 +129,954 @@ class MotorTestMockDeviceProxy(unittest.IsolatedAsyncioTestCase):
         currentPos = await self.test_motor.read()
         assert currentPos['test_motor-position']['value'] == rand_number, \
             "Final position does not equal set number"
+
+
+class TangoMotorGroupTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        for axis in "xyz":
+            backend.add_device(f"sim/stage/{axis}", sim_motor_spec())
+        self.previous_backend = set_sim_backend(backend)
+        for axis in "xyz":
+            get_proxy_pool(sim_mode=True).evict(f"sim/stage/{axis}")
+        with CommsConnector(sim_mode=True):
+            self.motors = [tango_motor(f"sim/stage/{axis}", f"stage-{axis}")
+                           for axis in "xyz"]
+        for motor in self.motors:
+            await motor.comm.velocity.put(20.0)
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    async def test_moves_together(self):
+        group = TangoMotorGroup(self.motors, "stage")
+        await group.set([1.0, 2.0, 3.0], timeout=2)
+        for motor, position in zip(self.motors, [1.0, 2.0, 3.0]):
+            assert await motor.comm.position.get_value() == position
+            assert await motor.comm.state.get_value() == DevState.ON
+
+    async def test_motors_sharing_a_proxy_are_written_together(self):
+        with CommsConnector(sim_mode=True):
+            other = tango_motor("sim/stage/x", "stage-x2")
+        proxy = self.motors[0].comm.position._proxy_
+        group = TangoMotorGroup([self.motors[0], other, self.motors[1]],
+                                "stage")
+        with mock.patch.object(proxy, "write_attributes",
+                               wraps=proxy.write_attributes) as write:
+            await group.set([0.5, 0.5, 0.5], timeout=2)
+        write.assert_called_once_with([("Position", 0.5),
+                                       ("Position", 0.5)])
+
+    def test_wrong_number_of_positions(self):
+        with self.assertRaises(ValueError):
+            TangoMotorGroup(self.motors, "stage").set([1.0])
+
+
+class MotorLimitsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        spec = sim_motor_spec()
+        spec.attributes["Position"].limits.update(min_value=-5, max_value=5)
+        backend = SimBackend()
+        backend.add_device("sim/motor/limited", spec)
+        self.previous_backend = set_sim_backend(backend)
+        get_proxy_pool(sim_mode=True).evict("sim/motor/limited")
+        with CommsConnector(sim_mode=True):
+            self.motor = tango_motor("sim/motor/limited", "limited")
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    async def test_limits_are_cached(self):
+        await self.motor.check_value(1.0)
+        proxy = self.motor.comm.position._proxy_
+        with mock.patch.object(proxy, "get_attribute_config",
+                               side_effect=AssertionError):
+            await self.motor.check_value(-5.0)
+            with self.assertRaises(OutsideLimitsError):
+                await self.motor.check_value(5.5)
+        assert get_limits_cache(proxy, "sim/motor/limited").fetches == 1
+
+    async def test_trajectory(self):
+        trajectory = np.linspace(-4, 4, 1000)
+        await self.motor.check_value(trajectory)
+        trajectory[500] = 6
+        with self.assertRaisesRegex(OutsideLimitsError, "at index 500"):
+            await self.motor.check_value(trajectory)
+
+    async def test_refreshed_on_conf_event(self):
+        await self.motor.check_value(4.0)
+        proxy = self.motor.comm.position._proxy_
+        registry = get_subscription_registry(proxy)
+        subscription = registry._subscriptions[
+            ("position", int(EventType.ATTR_CONF_EVENT))]
+        subscription.dispatch(types.SimpleNamespace(
+            err=False, attr_conf=_SimAttributeInfoEx(
+                limits={"min_value": 0, "max_value": 2})))
+        with self.assertRaises(OutsideLimitsError):
+            await self.motor.check_value(4.0)
+
+    def test_limits_parsed_like_tango(self):
+        limits = AttributeLimits.from_config(_SimAttributeInfoEx(
+            limits={"max_value": 3, "min_alarm": -1}))
+        assert limits.min_value is None
+        assert limits.max_value == 3.0
+        assert limits.min_alarm == -1.0
+        assert limits.max_warning is None
+
+
+class ReadCoalescerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+        self.coalescer = ReadCoalescer(self.proxy)
+
+    async def test_reads_in_one_tick_are_batched(self):
+        await self.proxy.write_attribute("Velocity", 3.0)
+        position, velocity, position_again = await asyncio.gather(
+            self.coalescer.read_attribute("Position"),
+            self.coalescer.read_attribute("Velocity"),
+            self.coalescer.read_attribute("Position"))
+        assert self.coalescer.batches == 1
+        assert velocity.value == 3.0
+        assert position is position_again
+
+    async def test_sequential_reads_are_not_batched(self):
+        await self.coalescer.read_attribute("Position")
+        await self.coalescer.read_attribute("Velocity")
+        assert self.coalescer.batches == 2
+
+    async def test_failed_batch_raises_for_every_read(self):
+        results = await asyncio.gather(
+            self.coalescer.read_attribute("Position"),
+            self.coalescer.read_attribute("NotAnAttribute"),
+            return_exceptions=True)
+        assert all(isinstance(r, KeyError) for r in results)
+
+
+class DescriptorCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+
+    async def connect_attr(self, attr_name):
+        attr = TangoAttrR()
+        await attr.connect("mock/device/name", attr_name, self.proxy)
+        return attr
+
+    async def test_descriptor_built_from_config(self):
+        position = await self.connect_attr("Position")
+        state = await self.connect_attr("State")
+        position_descriptor = await position.get_descriptor()
+        assert position_descriptor["shape"] == []
+        assert position_descriptor["dtype"] == "number"
+        assert (await state.get_descriptor())["dtype"] == "string"
+
+    async def test_descriptor_refetched_after_conf_event_error(self):
+        position = await self.connect_attr("Position")
+        registry = get_subscription_registry(self.proxy)
+        with mock.patch.object(self.proxy, "get_attribute_config",
+                               wraps=self.proxy.get_attribute_config) as conf:
+            await position.get_descriptor()
+            conf.assert_not_called()
+            registry._subscriptions[
+                ("position", int(EventType.ATTR_CONF_EVENT))].dispatch(
+                    mock.Mock(err=True))
+            await position.get_descriptor()
+            conf.assert_any_call(["Position"])
+
+    async def test_conf_subscription_shared_and_released(self):
+        registry = get_subscription_registry(self.proxy)
+        attrs = [await self.connect_attr("Position") for _ in range(2)]
+        assert registry.subscriber_count(
+            "Position", EventType.ATTR_CONF_EVENT) == 0
+        for attr in attrs:
+            await attr.get_descriptor()
+        assert registry.subscriber_count(
+            "Position", EventType.ATTR_CONF_EVENT) == 1
+        del attrs, attr
+        gc.collect()
+        assert registry.subscriber_count(
+            "Position", EventType.ATTR_CONF_EVENT) == 0
+
+
+class ValueCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+        self.velocity = TangoAttrR()
+        await self.velocity.connect("mock/device/name", "Velocity",
+                                    self.proxy)
+
+    async def asyncTearDown(self):
+        self.velocity.disable_value_cache()
+
+    async def wait_for_value(self, value):
+        while self.velocity._value_cache.get() is None or \
+                self.velocity._value_cache.get().value != value:
+            await asyncio.sleep(0.01)
+
+    async def test_value_served_from_change_events(self):
+        await self.velocity.enable_value_cache()
+        await self.proxy.write_attribute("Velocity", 2.5)
+        await asyncio.wait_for(self.wait_for_value(2.5), timeout=5)
+        with mock.patch.object(self.proxy, "read_attribute",
+                               side_effect=AssertionError):
+            assert await self.velocity.get_value() == 2.5
+            assert (await self.velocity.get_reading())["value"] == 2.5
+
+    async def test_stale_value_is_read(self):
+        await self.velocity.enable_value_cache(max_age=0)
+        await self.proxy.write_attribute("Velocity", 1.5)
+        with mock.patch.object(self.proxy, "read_attribute",
+                               wraps=self.proxy.read_attribute) as read:
+            assert await self.velocity.get_value() == 1.5
+            read.assert_called_once_with("Velocity")
+
+    async def test_errored_subscription_falls_back_to_read(self):
+        await self.velocity.enable_value_cache()
+        self.velocity._value_cache.on_event(mock.Mock(err=True))
+        with mock.patch.object(self.proxy, "read_attribute",
+                               wraps=self.proxy.read_attribute) as read:
+            await self.velocity.get_value()
+            read.assert_called_once_with("Velocity")
+
+
+class SubscriptionRegistryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+        self.registry = SubscriptionRegistry(self.proxy)
+
+    async def test_one_subscription_per_attribute(self):
+        first, second = [], []
+        with mock.patch.object(self.proxy, "subscribe_event",
+                               wraps=self.proxy.subscribe_event) as sub:
+            tokens = await asyncio.gather(
+                self.registry.subscribe(
+                    "Position", EventType.CHANGE_EVENT, first.append),
+                self.registry.subscribe(
+                    "Position", EventType.CHANGE_EVENT, second.append))
+            sub.assert_called_once()
+        assert first and second
+        for token in tokens:
+            self.registry.unsubscribe(token)
+
+    async def test_late_subscriber_receives_last_event(self):
+        first, second = [], []
+        token = await self.registry.subscribe(
+            "Position", EventType.CHANGE_EVENT, first.append)
+        while not first:
+            await asyncio.sleep(0.01)
+        other = await self.registry.subscribe(
+            "Position", EventType.CHANGE_EVENT, second.append)
+        assert second == first[-1:]
+        self.registry.unsubscribe(token)
+        self.registry.unsubscribe(other)
+
+    async def test_unsubscribes_after_last_monitor_closed(self):
+        position = TangoAttrR()
+        await position.connect("mock/device/name", "Position", self.proxy)
+        monitors = [TangoSignalMonitor(position) for _ in range(3)]
+        for monitor in monitors:
+            await monitor()
+        with mock.patch.object(self.proxy, "unsubscribe_event",
+                               wraps=self.proxy.unsubscribe_event) as unsub:
+            monitors[0].close()
+            monitors[1].close()
+            unsub.assert_not_called()
+            monitors[2].close()
+            unsub.assert_called_once()
+
+
+class SimProxyEventsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+
+    async def test_write_pushes_change_event(self):
+        events = asyncio.Queue()
+        await self.proxy.subscribe_event(
+            "Velocity", EventType.CHANGE_EVENT, events.put_nowait)
+        assert (await events.get()).attr_value.value == 0.0
+        await self.proxy.write_attribute("Velocity", 4.0)
+        assert (await events.get()).attr_value.value == 4.0
+
+    async def test_simulated_motion(self):
+        states, positions = asyncio.Queue(), []
+        await self.proxy.subscribe_event(
+            "State", EventType.CHANGE_EVENT,
+            lambda event: states.put_nowait(event.attr_value.value))
+        await self.proxy.subscribe_event(
+            "Position", EventType.CHANGE_EVENT,
+            lambda event: positions.append(event.attr_value.value))
+        await self.proxy.write_attribute("Velocity", 10.0)
+        await self.proxy.write_attribute("Position", 2.0)
+        assert await states.get() == DevState.ON
+        assert await states.get() == DevState.MOVING
+        assert await states.get() == DevState.ON
+        assert positions[-1] == 2.0
+        assert len(positions) > 2
+
+    async def test_retargeted_motion_stays_moving(self):
+        states = []
+        await self.proxy.subscribe_event(
+            "State", EventType.CHANGE_EVENT,
+            lambda event: states.append(event.attr_value.value))
+        await self.proxy.write_attribute("Velocity", 10.0)
+        await self.proxy.write_attribute("Position", 2.0)
+        await asyncio.sleep(0.1)
+        await self.proxy.write_attribute("Position", 1.0)
+        await asyncio.sleep(0.05)
+        assert states == [DevState.ON, DevState.MOVING]
+        while states[-1] != DevState.ON:
+            await asyncio.sleep(0.01)
+        assert (await self.proxy.read_attribute("Position")).value == 1.0
+        assert states == [DevState.ON, DevState.MOVING, DevState.ON]
+
+    async def test_many_monitors_without_threads(self):
+        threads = threading.active_count()
+        received = []
+        for _ in range(500):
+            await self.proxy.subscribe_event(
+                "Velocity", EventType.CHANGE_EVENT, received.append)
+        await self.proxy.write_attribute("Velocity", 1.0)
+        await asyncio.sleep(0)
+        assert len(received) == 1000
+        assert threading.active_count() == threads
+
+
+class ProxyPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_create_one_proxy(self):
+        pool = ProxyPool(SimProxy)
+        proxies = await asyncio.gather(
+            *[pool.get("mock/device/name") for _ in range(10)])
+        assert all(proxy is proxies[0] for proxy in proxies)
+        stats = pool.stats()
+        assert stats["created"] == 1
+        assert stats["misses"] + stats["joined"] + stats["hits"] == 10
+        assert await pool.get("mock/device/name") is proxies[0]
+        assert pool.stats()["hits"] == stats["hits"] + 1
+
+    async def test_failed_creation_is_not_cached(self):
+        pool = ProxyPool(SimProxy)
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                await pool.get("no/such/device")
+        assert pool.stats()["failed"] == 2
+        assert len(pool) == 0
+
+    async def test_lru_eviction(self):
+        backend = SimBackend()
+        backend.add_devices(["sim/motor/1", "sim/motor/2"], sim_motor_spec())
+        pool = ProxyPool(lambda name: SimProxy(name, backend), max_size=1)
+        first = await pool.get("sim/motor/1")
+        await pool.get("sim/motor/2")
+        assert "sim/motor/1" not in pool
+        assert await pool.get("sim/motor/1") is not first
+        assert pool.stats()["evicted"] == 2
+
+    async def test_idle_eviction(self):
+        pool = ProxyPool(SimProxy, idle_timeout=0)
+        first = await pool.get("mock/device/name")
+        await asyncio.sleep(0.01)
+        assert await pool.get("mock/device/name") is not first
+
+    async def test_helper_of_released_proxy(self):
+        proxy = await SimProxy("mock/device/name")
+        registry = get_subscription_registry(proxy)
+        assert get_subscription_registry(proxy) is registry
+        del proxy
+        gc.collect()
+        with self.assertRaises(ProxyReleasedError):
+            await registry.subscribe("Position", EventType.CHANGE_EVENT)
+
+
+class InterfaceCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "interfaces.json")
+        self.backend = SimBackend()
+        self.backend.add_device("sim/motor/1", sim_motor_spec())
+        self.proxy = await SimProxy("sim/motor/1", self.backend)
+
+    async def asyncTearDown(self):
+        disable_interface_cache()
+        self.directory.cleanup()
+
+    async def test_cold_start_populates_file(self):
+        cache = InterfaceCache(self.path)
+        interface = await cache.get(self.proxy, "sim/motor/1")
+        assert interface.has_attribute("position")
+        assert interface.has_command("Stop")
+        cache.save_if_dirty()
+        assert os.path.exists(self.path)
+        assert cache.stats["misses"] == 1
+
+    async def test_warm_start_skips_introspection(self):
+        cache = InterfaceCache(self.path)
+        await cache.get(self.proxy, "sim/motor/1")
+        cache.save()
+        warm = InterfaceCache(self.path)
+        with mock.patch.object(self.proxy, "get_attribute_list") as listing:
+            interface = await warm.get(self.proxy, "sim/motor/1")
+            listing.assert_not_called()
+        config = interface.attribute_config("Position")
+        assert config.data_format == AttrDataFormat.SCALAR
+        assert warm.stats["hits"] == 1
+        await asyncio.sleep(0.01)  # background revalidation
+        assert warm.stats["fresh"] == 1
+
+    async def test_stale_interface_is_refreshed(self):
+        cache = InterfaceCache(self.path)
+        await cache.get(self.proxy, "sim/motor/1")
+        cache.save()
+        self.backend.get_spec("sim/motor/1").version = "2"
+        warm = InterfaceCache(self.path)
+        assert not await warm.revalidate(self.proxy, "sim/motor/1")
+        assert warm.stats["stale"] == 1
+        assert await warm.revalidate(self.proxy, "sim/motor/1")
+
+    async def test_signals_connect_from_cache(self):
+        enable_interface_cache(self.path)
+        attr = TangoAttrR()
+        with mock.patch.object(self.proxy, "read_attribute") as read:
+            await attr.connect("sim/motor/1", "Position", self.proxy)
+            read.assert_not_called()
+        descriptor = await attr.get_descriptor()
+        assert descriptor["dtype"] == "number"
+        with self.assertRaises(KeyError):
+            await TangoAttrR().connect("sim/motor/1", "Missing", self.proxy)
+
+
+class IntrospectionTest(unittest.IsolatedAsyncioTestCase):
+    async def test_blocking_introspection_runs_concurrently(self):
+        backend = SimBackend()
+        names = [f"sim/motor/{i}" for i in range(5)]
+        backend.add_devices(names, sim_motor_spec())
+        proxies = [await SimProxy(name, backend) for name in names]
+
+        def slow_list(proxy):
+            time.sleep(0.2)
+            return list(proxy._attributes)
+        for proxy in proxies:
+            proxy.blocking_introspection = True
+            proxy.get_attribute_list = functools.partial(slow_list, proxy)
+        # lazily connected, so that only the connector under test connects
+        with CommsConnector(sim_mode=True), lazy_connect():
+            comms = [TangoMotorComm(name) for name in names]
+        start = time.monotonic()
+        await asyncio.gather(*[ConnectWithoutReading(comm, proxy)(
+            position="Position", velocity="Velocity", state="State",
+            stop="Stop") for comm, proxy in zip(comms, proxies)])
+        assert time.monotonic() - start < 0.6
+        assert all(comm.stop.connected for comm in comms)
+
+    async def test_missing_command_is_not_connected(self):
+        proxy = await SimProxy("mock/device/name")
+        with CommsConnector(sim_mode=True), lazy_connect():
+            comm = TangoMotorComm("mock/device/name")
+        with self.assertRaises(KeyError):
+            await ConnectWithoutReading(comm, proxy)(
+                position="Position", velocity="Velocity", state="State",
+                stop="Position")
+
+
+class PollingSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.proxy = await SimProxy("mock/device/name")
+        self.poller = PollingScheduler(self.proxy)
+
+    async def test_attributes_read_together(self):
+        received = []
+        with mock.patch.object(self.proxy, "read_attributes",
+                               wraps=self.proxy.read_attributes) as read:
+            tokens = [self.poller.subscribe(name, received.append, 0.01)
+                      for name in ("Position", "Velocity")]
+            await asyncio.sleep(0.05)
+        assert read.call_args_list[0].args[0] == ["Position", "Velocity"]
+        assert read.call_count == self.poller.ticks
+        assert sorted(event.attr_name for event in received) == \
+            ["Position", "Velocity"]  # only the first poll, values static
+        for token in tokens:
+            self.poller.unsubscribe(token)
+
+    async def test_backoff_while_static(self):
+        received = []
+        token = self.poller.subscribe("Velocity", received.append, 0.01)
+        await asyncio.sleep(0.1)
+        [(_, period)] = self.poller.polled_attributes()
+        assert period > 0.01
+        await self.proxy.write_attribute("Velocity", 3.0)
+        await asyncio.sleep(period + 0.02)
+        assert received[-1].attr_value.value == 3.0
+        assert self.poller.polled_attributes()[0][1] < period
+        self.poller.unsubscribe(token)
+        assert self.poller.polled_attributes() == []
+
+    async def test_monitor_falls_back_to_polling(self):
+        attr = TangoAttrR()
+        await attr.connect("mock/device/name", "Velocity", self.proxy)
+        values = []
+        with mock.patch.object(self.proxy, "subscribe_event",
+                               side_effect=dev_failed(
+                                   "API_EventPropertiesNotSet")), \
+                mock.patch.object(TangoSignalMonitor,
+                                  "fallback_poll_period", 0.01):
+            monitor = await attr.monitor_value(values.append)
+        assert monitor.polling
+        await asyncio.sleep(0.03)
+        await self.proxy.write_attribute("Velocity", 2.0)
+        await asyncio.sleep(0.05)
+        assert values[-1] == 2.0
+        monitor.close()
+
+    async def test_monitor_of_unreachable_device_raises(self):
+        attr = TangoAttrR()
+        await attr.connect("mock/device/name", "Velocity", self.proxy)
+        with mock.patch.object(self.proxy, "subscribe_event",
+                               side_effect=dev_failed(
+                                   "API_CantConnectToDevice")):
+            with self.assertRaises(DevFailed):
+                await attr.monitor_value(lambda value: None)
+        assert self.poller.polled_attributes() == []
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_overwrites_oldest(self):
+        buffer = RingBuffer(3)
+        for i in range(5):
+            buffer.append(i, float(i))
+        values, timestamps = buffer.drain()
+        assert values.tolist() == [2, 3, 4]
+        assert timestamps.tolist() == [2.0, 3.0, 4.0]
+        assert buffer.dropped == 2
+        assert len(buffer) == 0
+
+    def test_ragged_values(self):
+        buffer = RingBuffer(2, (3,), dtype=np.int32, ragged=True)
+        buffer.append([1, 2], 1.0)
+        buffer.append([3, 4, 5], 2.0)
+        assert buffer.latest()[0].tolist() == [3, 4, 5]
+        values, _ = buffer.drain()
+        assert [value.tolist() for value in values] == [[1, 2], [3, 4, 5]]
+
+
+class MonitorDeliveryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_queue_drops_newest(self):
+        queue = BoundedQueue(2)
+        for i in range(4):
+            queue.put(i)
+        assert queue.drain() == [0, 1]
+        assert queue.stats() == {'received': 4, 'delivered': 2,
+                                 'dropped': 2, 'coalesced': 0, 'pending': 0}
+
+    async def test_ring_queue_drops_oldest(self):
+        queue = RingQueue(2)
+        for i in range(4):
+            queue.put(i)
+        assert await queue.get() == 2
+        assert queue.get_nowait() == 3
+        assert queue.dropped == 2
+        with self.assertRaises(asyncio.QueueEmpty):
+            queue.get_nowait()
+
+    async def test_latest_value_coalesces(self):
+        latest = LatestValue()
+        getter = asyncio.ensure_future(latest.get())
+        await asyncio.sleep(0)
+        latest.put(1)
+        assert await getter == 1
+        for i in range(2, 5):
+            latest.put(i)
+        assert await latest.get() == 4
+        assert latest.coalesced == 2
+        assert latest.delivered == 2
+
+    async def test_monitor_queue(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/queue", sim_motor_spec())
+        proxy = await SimProxy("sim/motor/queue", backend)
+        position = TangoAttrR()
+        await position.connect("sim/motor/queue", "Position", proxy)
+        values = RingQueue(10)
+        monitor = await position.monitor_queue(values)
+        assert await asyncio.wait_for(values.get(), 1) == 0.0
+        await proxy.write_attribute("Position", 1.0)
+        while (await asyncio.wait_for(values.get(), 2)) != 1.0:
+            pass
+        monitor.close()
+        assert values.dropped == 0
+
+
+class TangoFlyerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/fly", sim_motor_spec())
+        self.proxy = await SimProxy("sim/motor/fly", backend)
+        self.position = TangoAttrR()
+        await self.position.connect("sim/motor/fly", "Position", self.proxy)
+        await self.proxy.write_attribute("Velocity", 20.0)
+
+    async def move_while_flying(self, flyer):
+        await flyer.kickoff()
+        await self.proxy.write_attribute("Position", 2.0)
+        await asyncio.sleep(0.3)
+        await flyer.complete()
+
+    async def test_collect_pages(self):
+        flyer = TangoFlyer({"position": self.position}, "flyer")
+        await self.move_while_flying(flyer)
+        description = await flyer.describe_collect()
+        assert list(description) == ["flyer-position"]
+        [page] = list(flyer.collect_pages())
+        positions = page["data"]["flyer-position"]
+        assert len(positions) > 2
+        assert positions == sorted(positions) and positions[-1] == 2.0
+        assert page["time"] == page["timestamps"]["flyer-position"]
+        assert list(flyer.collect_pages()) == []  # already collected
+        registry = get_subscription_registry(self.proxy)
+        assert registry.subscriber_count("Position",
+                                         EventType.CHANGE_EVENT) == 0
+
+    async def test_full_buffer_drops_oldest(self):
+        flyer = TangoFlyer({"position": self.position}, "flyer", capacity=2)
+        await self.move_while_flying(flyer)
+        events = list(flyer.collect())
+        assert [event["data"]["flyer-position"] for event in events][-1] \
+            == 2.0
+        assert len(events) == 2
+        assert flyer.dropped > 0
+
+    async def test_short_spectrum(self):
+        backend = SimBackend()
+        backend.load({"devices": [{
+            "name": "sim/spectrum/fly",
+            "attributes": {"counts": {"dtype": "DevLong", "shape": [4]}}}]})
+        proxy = await SimProxy("sim/spectrum/fly", backend)
+        counts = TangoAttrR()
+        await counts.connect("sim/spectrum/fly", "counts", proxy)
+        flyer = TangoFlyer({"counts": counts}, "flyer")
+        await flyer.kickoff()
+        await proxy.write_attribute("counts", [1, 2])
+        await proxy.write_attribute("counts", [3, 4, 5, 6])
+        await asyncio.sleep(0.01)
+        await flyer.complete()
+        [page] = list(flyer.collect_pages())
+        assert page["data"]["flyer-counts"] == [[0, 0, 0, 0], [1, 2],
+                                                [3, 4, 5, 6]]
+        assert flyer.errors == 0
+
+
+class MetricsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/metrics", sim_motor_spec())
+        self.registry = MetricsRegistry()
+        self.proxy = MetricsProxy(
+            await SimProxy("sim/motor/metrics", backend), "sim/motor/metrics",
+            self.registry)
+        self.position = TangoAttrR()
+        await self.position.connect("sim/motor/metrics", "Position",
+                                    self.proxy)
+
+    async def test_calls_and_events_recorded(self):
+        await self.position.get_reading()
+        await self.proxy.write_attribute("Velocity", 10.0)
+        with self.assertRaises(KeyError):
+            await self.proxy.read_attribute("Missing")
+        monitor = await self.position.monitor_value(lambda value: None)
+        await asyncio.sleep(0)
+        monitor.close()
+        snapshot = self.registry.snapshot()["sim/motor/metrics"]
+        assert snapshot["Position"]["read"]["count"] == 1
+        assert snapshot["Position"]["read"]["buckets"][float("inf")] == 1
+        assert snapshot["Velocity"]["write"]["errors"] == 0
+        assert snapshot["Missing"]["read"]["errors"] == 1
+        assert snapshot["Position"]["event"]["count"] == 1
+
+    async def test_prometheus_export(self):
+        await self.position.get_value()
+        text = self.registry.to_prometheus()
+        labels = ('device="sim/motor/metrics",signal="Position",'
+                  'operation="read"')
+        assert f'tango_operation_seconds_count{{{labels}}} 1' in text
+        assert f'tango_operation_seconds_bucket{{{labels},le="+Inf"}} 1' \
+            in text
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tango.prom")
+            self.registry.write_prometheus(path)
+            with open(path) as file:
+                assert file.read() == text
+        server = self.registry.serve_prometheus(port=0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            body = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: urllib.request.urlopen(url).read().decode())
+            assert body == text
+        finally:
+            server.shutdown()
+
+    async def test_enable_metrics_wraps_pool(self):
+        pool = ProxyPool(SimProxy)
+        enable_metrics(pool, self.registry)
+        assert isinstance(await pool.get("mock/device/name"), MetricsProxy)
+        disable_metrics(pool)
+        assert isinstance(await pool.get("mock/device/name"), SimProxy)
+
+
+class RecordReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "session.trace")
+        pool = ProxyPool(SimProxy)
+        recorder = record_trace(self.path, pool)
+        proxy = await pool.get("mock/device/name")
+        assert isinstance(proxy, RecordingProxy)
+        position = TangoAttrR()
+        await position.connect("mock/device/name", "Position", proxy)
+        self.reading = await position.get_reading()
+        await proxy.write_attribute("Velocity", 50.0)
+        self.values = []
+        monitor = await position.monitor_value(self.values.append)
+        await proxy.write_attribute("Position", 1.0)
+        while self.values[-1:] != [1.0]:
+            await asyncio.sleep(0.01)
+        monitor.close()
+        with self.assertRaises(KeyError):
+            await proxy.read_attribute("Missing")
+        recorder.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_replay(self):
+        proxy = await ReplayProxy("mock/device/name", Trace.load(self.path),
+                                  time_scale=0)
+        position = TangoAttrR()
+        await position.connect("mock/device/name", "Position", proxy)
+        reading = await position.get_reading()
+        assert reading["value"] == self.reading["value"]
+        assert reading["timestamp"] == self.reading["timestamp"]
+        await proxy.write_attribute("Velocity", 50.0)
+        values = []
+        monitor = await position.monitor_value(values.append)
+        while len(values) < len(self.values):
+            await asyncio.sleep(0.01)
+        monitor.close()
+        assert values == self.values
+        with self.assertRaises(KeyError):
+            await proxy.read_attribute("Missing")
+
+    async def test_selected_as_sim_proxy_class(self):
+        previous_trace = set_replay_trace(self.path, time_scale=0)
+        previous_class = set_sim_proxy_class(ReplayProxy)
+        try:
+            proxy = await _get_device_proxy("mock/device/name",
+                                            sim_mode=True)
+            assert isinstance(proxy, ReplayProxy)
+        finally:
+            set_sim_proxy_class(previous_class)
+            set_replay_trace(previous_trace)
+
+
+class FaultInjectionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/faulty", sim_motor_spec())
+        self.injector = FaultInjector(seed=1)
+        self.proxy = FaultInjectingProxy(
+            await SimProxy("sim/motor/faulty", backend), "sim/motor/faulty",
+            self.injector)
+
+    async def test_latency_per_attribute(self):
+        self.injector.set_profile(FaultProfile(latency=0.05),
+                                  device="sim/motor/faulty")
+        self.injector.set_profile(FaultProfile(), device="sim/motor/faulty",
+                                  attribute="Velocity")
+        start = time.perf_counter()
+        await self.proxy.read_attribute("Position")
+        assert time.perf_counter() - start >= 0.05
+        start = time.perf_counter()
+        await self.proxy.read_attribute("Velocity")
+        assert time.perf_counter() - start < 0.05
+        assert self.injector.stats()["sim/motor/faulty"]["calls"] == 2
+
+    async def test_errors(self):
+        self.injector.set_profile(FaultProfile(error_rate=1.0),
+                                  operation="write")
+        await self.proxy.read_attribute("Position")
+        with self.assertRaises(DevFailed):
+            await self.proxy.write_attribute("Position", 1.0)
+        assert self.injector.stats()["sim/motor/faulty"]["errors"] == 1
+
+    async def test_dropped_events(self):
+        self.injector.set_profile(FaultProfile(drop_rate=1.0))
+        events = []
+        await self.proxy.subscribe_event(
+            "Position", EventType.CHANGE_EVENT, events.append)
+        await asyncio.sleep(0.01)
+        assert events == []
+        assert self.injector.stats()["sim/motor/faulty"][
+            "dropped_events"] == 1
+
+    async def test_restart(self):
+        events = []
+        await self.proxy.subscribe_event(
+            "Velocity", EventType.CHANGE_EVENT, events.append)
+        await asyncio.sleep(0.01)
+        self.injector.restart("sim/motor/faulty", downtime=0.05)
+        assert events[-1].err
+        with self.assertRaises(DevFailed):
+            await self.proxy.read_attribute("Velocity")
+        await asyncio.sleep(0.06)
+        await self.proxy.write_attribute("Velocity", 3.0)
+        await asyncio.sleep(0.01)
+        assert len(events) == 2  # the subscription was lost
+
+    async def test_seeded_faults_repeat(self):
+        samples = []
+        for _ in range(2):
+            injector = FaultInjector(seed=5)
+            profile = FaultProfile(latency=0.01, jitter=0.5,
+                                   distribution="lognormal")
+            samples.append([profile.sample_latency(injector.rng)
+                            for _ in range(10)])
+        assert samples[0] == samples[1]
+
+    async def test_enable_fault_injection(self):
+        pool = ProxyPool(SimProxy)
+        injector = enable_fault_injection(pool=pool)
+        proxy = await pool.get("mock/device/name")
+        assert isinstance(proxy, FaultInjectingProxy)
+        assert proxy.injector is injector
+        disable_fault_injection(pool)
+        assert isinstance(await pool.get("mock/device/name"), SimProxy)
+
+
+class DeadlineTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/slow", sim_motor_spec())
+        self.sim = await SimProxy("sim/motor/slow", backend)
+        self.injector = FaultInjector()
+        self.injector.set_profile(FaultProfile(latency=0.2))
+        self.policy = DeadlinePolicy(timeout=0.05)
+        self.policy.set_timeout(None, operation="get_config")
+        self.registry = MetricsRegistry()
+        self.proxy = DeadlineProxy(
+            FaultInjectingProxy(self.sim, "sim/motor/slow", self.injector),
+            "sim/motor/slow", self.policy, self.registry)
+
+    async def test_read_times_out(self):
+        start = time.perf_counter()
+        with self.assertRaises(TangoTimeoutError) as context:
+            await self.proxy.read_attribute("Position")
+        assert time.perf_counter() - start < 0.2
+        assert isinstance(context.exception, asyncio.TimeoutError)
+        assert context.exception.operation == "read"
+        assert context.exception.attr_names == ("Position",)
+        snapshot = self.registry.snapshot()["sim/motor/slow"]
+        assert snapshot["Position"]["read"]["timeouts"] == 1
+
+    async def test_most_specific_deadline(self):
+        self.policy.set_timeout(None, device="sim/motor/slow",
+                                attribute="Velocity")
+        self.policy.set_timeout(0.5, operation="command")
+        assert (await self.proxy.read_attribute("Velocity")).value == 0.0
+        stop = TangoCommand()
+        await stop.connect("sim/motor/slow", "Stop", self.proxy)
+        await stop.execute()
+        with self.assertRaises(TangoTimeoutError):
+            await self.proxy.read_attributes(["Velocity", "Position"])
+
+    async def test_write_is_cancelled(self):
+        with self.assertRaises(TangoTimeoutError):
+            await self.proxy.write_attribute("Velocity", 2.0)
+        await asyncio.sleep(0.2)
+        assert self.sim._attribute_values["Velocity"] == 0.0
+
+    async def test_late_subscription_undone(self):
+        with self.assertRaises(TangoTimeoutError):
+            await self.proxy.subscribe_event(
+                "Position", EventType.CHANGE_EVENT, lambda event: None)
+        await asyncio.sleep(0.2)
+        assert self.sim._active_subs == {}
+        snapshot = self.registry.snapshot()["sim/motor/slow"]
+        assert snapshot["Position"]["subscribe"]["timeouts"] == 1
+
+    async def test_enable_deadlines(self):
+        pool = ProxyPool(SimProxy)
+        policy = enable_deadlines(self.policy, pool)
+        proxy = await pool.get("mock/device/name")
+        assert isinstance(proxy, DeadlineProxy)
+        assert proxy.policy is policy
+        disable_deadlines(pool)
+        assert isinstance(await pool.get("mock/device/name"), SimProxy)
+
+
+class ResilienceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.add_device("sim/motor/flaky", sim_motor_spec())
+        self.sim = await SimProxy("sim/motor/flaky", backend)
+        self.injector = FaultInjector()
+        self.policy = ResiliencePolicy(attempts=5, base_delay=0.02,
+                                       failure_threshold=2,
+                                       probe_period=0.05, seed=0)
+        self.proxy = ResilientProxy(
+            FaultInjectingProxy(self.sim, "sim/motor/flaky", self.injector),
+            "sim/motor/flaky", self.policy)
+
+    async def test_reads_retried(self):
+        self.policy.failure_threshold = 100
+        self.injector.restart("sim/motor/flaky", downtime=0.03)
+        assert (await self.proxy.read_attribute("Velocity")).value == 0.0
+        assert self.policy.retries >= 1
+        assert self.policy.stats()["sim/motor/flaky"]["failures"] == 0
+
+    async def test_writes_not_retried(self):
+        self.injector.restart("sim/motor/flaky", downtime=0.1)
+        with self.assertRaises(DevFailed):
+            await self.proxy.write_attribute("Velocity", 2.0)
+        assert self.injector.stats()["sim/motor/flaky"]["calls"] == 1
+        assert self.policy.retries == 0
+
+    async def test_breaker_fails_fast_until_probe_succeeds(self):
+        self.policy.attempts = 1
+        self.injector.restart("sim/motor/flaky", downtime=0.15)
+        for _ in range(2):
+            with self.assertRaises(DevFailed):
+                await self.proxy.read_attribute("Velocity")
+        calls = self.injector.stats()["sim/motor/flaky"]["calls"]
+        with self.assertRaises(CircuitOpenError):
+            await self.proxy.read_attribute("Velocity")
+        assert self.injector.stats()["sim/motor/flaky"]["calls"] == calls
+        stats = self.policy.stats()["sim/motor/flaky"]
+        assert stats["state"] == "open"
+        assert stats["trips"] == 1 and stats["rejected"] == 1
+        await asyncio.sleep(0.3)
+        assert self.policy.stats()["sim/motor/flaky"]["state"] == "closed"
+        assert (await self.proxy.read_attribute("Velocity")).value == 0.0
+
+    async def test_subscriptions_made_again(self):
+        events = []
+        registry = get_subscription_registry(self.proxy)
+        token = await registry.subscribe(
+            "Velocity", EventType.CHANGE_EVENT, events.append)
+        await asyncio.sleep(0.01)
+        self.injector.restart("sim/motor/flaky", downtime=0.1)
+        assert events[-1].err
+        self.policy.attempts = 1
+        for _ in range(2):
+            with self.assertRaises(DevFailed):
+                await self.proxy.read_attribute("Position")
+        await asyncio.sleep(0.2)
+        await self.proxy.write_attribute("Velocity", 2.0)
+        await asyncio.sleep(0.01)
+        assert events[-1].attr_value.value == 2.0
+        registry.unsubscribe(token)
+        assert self.sim._active_subs == {}
+
+    async def test_enable_resilience(self):
+        pool = ProxyPool(SimProxy)
+        policy = enable_resilience(self.policy, pool)
+        proxy = await pool.get("mock/device/name")
+        assert isinstance(proxy, ResilientProxy)
+        assert proxy.policy is policy
+        disable_resilience(pool)
+        assert isinstance(await pool.get("mock/device/name"), SimProxy)
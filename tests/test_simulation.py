@@ -0,0 +1,395 @@
+from ophyd_tango_devices.assets import FrameFileHandler
+from ophyd_tango_devices.devices import TangoDevice, configure_devices
+from ophyd_tango_devices.proxy import SimProxy
+from ophyd_tango_devices.pool import ProxyPool
+from ophyd_tango_devices.signals import (TangoAttrR, TangoAttrRW, TangoComm,
+                                         TangoCommand, TangoPipeRW,
+                                         ConnectSimilarlyNamed,
+                                         ConnectWithoutReading,
+                                         _get_device_proxy, get_proxy_pool,
+                                         lazy_connect)
+from ophyd_tango_devices.signal_index import get_signal_index
+from ophyd_tango_devices.subscriptions import get_subscription_registry
+from ophyd_tango_devices.simulation import (SimAttribute, SimBackend,
+                                            SimCommand, SimDeviceSpec,
+                                            set_sim_backend)
+from PyTango import DevFailed  # type: ignore
+from PyTango._tango import AttrQuality, EventType  # type: ignore
+from ophyd.v2.core import CommsConnector, SignalCollection  # type: ignore
+from bluesky.plans import count
+from bluesky.run_engine import RunEngine
+import numpy as np  # type: ignore
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+RE = RunEngine()
+
+DETECTOR_SPEC = {
+    "devices": [{
+        "name": "sim/detector/{}",
+        "count": 1000,
+        "attributes": {
+            "image": {"dtype": "DevUShort", "shape": [4, 3]},
+            "exposure": {"dtype": "float", "value": 0.1,
+                         "min_value": 0, "max_value": 10,
+                         "min_warning": 0.01, "max_warning": 5,
+                         "min_alarm": 0.001, "max_alarm": 8},
+        },
+        "commands": ["Reset"],
+        "pipes": {"settings": {"value": ["settings", []]}},
+    }]
+}
+
+
+class DetectorComm(TangoComm):
+    image: TangoAttrR
+    exposure: TangoAttrRW
+    reset: TangoCommand
+    settings: TangoPipeRW
+
+
+class DetectorDevice(TangoDevice):
+    @property
+    def read_signals(self):
+        return SignalCollection(image=self.comm.image,
+                                exposure=self.comm.exposure)
+
+
+class SimBackendTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.backend = SimBackend()
+        self.names = self.backend.load(DETECTOR_SPEC)
+        self.previous_backend = set_sim_backend(self.backend)
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    def test_devices_loaded_from_spec(self):
+        assert len(self.backend) == 1000
+        assert self.names[0] == "sim/detector/0"
+        assert "sim/detector/999" in self.backend
+
+    async def test_unknown_device_not_found(self):
+        with self.assertRaises(KeyError):
+            await _get_device_proxy("sim/detector/1000", sim_mode=True,
+                                    pool=ProxyPool(SimProxy))
+
+    async def test_array_attribute(self):
+        proxy = await SimProxy("sim/detector/1")
+        image = await proxy.read_attribute("image")
+        assert image.value.shape == (4, 3)
+        assert image.value.dtype == np.uint16
+        assert (image.dim_x, image.dim_y) == (3, 4)
+        config = await proxy.get_attribute_config("image")
+        assert (config.max_dim_x, config.max_dim_y) == (3, 4)
+
+    async def test_limits_and_quality(self):
+        proxy = await SimProxy("sim/detector/2")
+        with self.assertRaises(DevFailed):
+            await proxy.write_attribute("exposure", 11)
+        await proxy.write_attribute("exposure", 6)
+        reading = await proxy.read_attribute("exposure")
+        assert reading.quality == AttrQuality.ATTR_WARNING
+        await proxy.write_attribute("exposure", 9)
+        reading = await proxy.read_attribute("exposure")
+        assert reading.quality == AttrQuality.ATTR_ALARM
+
+    async def test_devices_have_separate_values(self):
+        first = await SimProxy("sim/detector/3")
+        second = await SimProxy("sim/detector/4")
+        await first.write_attribute("exposure", 2.0)
+        assert (await second.read_attribute("exposure")).value == 0.1
+
+    async def test_command_handler(self):
+        backend = SimBackend()
+        backend.add_device("sim/doubler/1", SimDeviceSpec(
+            attributes=[SimAttribute("value")],
+            commands=[SimCommand("double", lambda proxy, x: 2 * x)]))
+        proxy = await SimProxy("sim/doubler/1", backend)
+        assert await proxy.command_inout("double", 2.5) == 5.0
+
+
+class SimDetectorCommTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        backend = SimBackend()
+        backend.load(DETECTOR_SPEC)
+        self.previous_backend = set_sim_backend(backend)
+        with CommsConnector(sim_mode=True):
+            self.comm = DetectorComm("sim/detector/5")
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    async def test_image_descriptor(self):
+        descriptor = await self.comm.image.get_descriptor()
+        assert descriptor["shape"] == [4, 3]
+        assert descriptor["dtype"] == "array"
+
+    async def test_image_read_as_ndarray(self):
+        descriptor = await self.comm.image.get_descriptor()
+        assert descriptor["dtype_numpy"] == np.dtype(np.uint16).str
+        reading = await self.comm.image.get_reading()
+        assert isinstance(reading["value"], np.ndarray)
+        assert reading["value"].dtype == np.uint16
+        assert list(reading["value"].shape) == descriptor["shape"]
+
+    async def test_image_read_into_buffer(self):
+        buffer = np.full((4, 3), 7, dtype=np.uint16)
+        value = await self.comm.image.get_value(out=buffer)
+        assert value is buffer
+        assert not buffer.any()
+        with self.assertRaises(ValueError):
+            await self.comm.image.get_value(out=np.empty((3, 4)))
+
+    async def test_pipe_and_command(self):
+        await self.comm.settings.put(("settings", [{"name": "gain"}]))
+        assert (await self.comm.settings.get_value())[1] == [{"name": "gain"}]
+        assert await self.comm.reset.execute() is None
+
+
+class LazyConnectTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        backend = SimBackend()
+        backend.load(DETECTOR_SPEC)
+        self.previous_backend = set_sim_backend(backend)
+        get_proxy_pool(sim_mode=True).evict("sim/detector/6")
+        with CommsConnector(sim_mode=True), lazy_connect():
+            self.comm = DetectorComm("sim/detector/6")
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    def test_nothing_connected_on_creation(self):
+        assert "sim/detector/6" not in get_proxy_pool(sim_mode=True)
+        assert not any(signal.connected
+                       for signal in self.comm._signals_.values())
+
+    async def test_signal_connects_on_first_use(self):
+        assert await self.comm.exposure.get_value() == 0.1
+        assert self.comm.exposure.connected
+        assert not self.comm.image.connected
+        assert await self.comm.reset.execute() is None
+        assert self.comm.reset.connected
+
+    async def test_concurrent_first_use_is_deduplicated(self):
+        with mock.patch.object(TangoAttrR, "connect",
+                               side_effect=TangoAttrR.connect,
+                               autospec=True) as connect:
+            await asyncio.gather(*[self.comm.exposure.get_value(),
+                                   self.comm.exposure.get_value(),
+                                   self.comm.image.get_descriptor()])
+        assert connect.call_count == 2
+        assert self.comm.image.connected
+
+    async def test_failed_connection_is_retried(self):
+        set_sim_backend(SimBackend())
+        with self.assertRaises(KeyError):
+            await self.comm.exposure.put(1.0)
+        set_sim_backend(self.previous_backend)
+        backend = SimBackend()
+        backend.load(DETECTOR_SPEC)
+        set_sim_backend(backend)
+        await self.comm.exposure.put(1.0)
+        assert await self.comm.exposure.get_value() == 1.0
+
+    async def test_bad_name_fails_alone(self):
+        with CommsConnector(sim_mode=True), lazy_connect():
+            comm = MisnamedComm("sim/detector/6")
+        exposure, missing = await asyncio.gather(
+            comm.exposure.get_value(), comm.missing.get_value(),
+            return_exceptions=True)
+        assert exposure == 0.1
+        assert isinstance(missing, ValueError)
+
+    async def test_cancelled_connection_resolves_waiters(self):
+        with mock.patch("ophyd_tango_devices.signals._get_device_proxy",
+                        side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(self.comm.exposure.get_value(), 1)
+        assert self.comm._lazy_pending == {}
+        assert await self.comm.exposure.get_value() == 0.1
+
+
+class MisnamedComm(TangoComm):
+    exposure: TangoAttrRW
+    missing: TangoAttrR
+
+
+class SignalIndexTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend = SimBackend()
+        backend.load(DETECTOR_SPEC)
+        self.proxy = await SimProxy("sim/detector/7", backend)
+
+    def make_comm(self):
+        with CommsConnector(sim_mode=True), lazy_connect():
+            return DetectorComm("sim/detector/7")
+
+    async def test_connect_reads_no_values(self):
+        comm = self.make_comm()
+        with mock.patch.object(self.proxy, "read_attribute",
+                               side_effect=AssertionError), \
+                mock.patch.object(self.proxy, "read_pipe",
+                                  side_effect=AssertionError):
+            await ConnectSimilarlyNamed(comm, self.proxy)
+        assert all(signal.connected for signal in comm._signals_.values())
+        assert get_signal_index(self.proxy, "sim/detector/7") \
+            .config_batches == 1
+        descriptor = await comm.image.get_descriptor()
+        assert descriptor["shape"] == [4, 3]
+
+    async def test_missing_attribute_not_connected(self):
+        with self.assertRaises(KeyError):
+            await TangoAttrR().connect("sim/detector/7", "missing",
+                                       self.proxy)
+
+    async def test_connectors_share_signal_lists(self):
+        with mock.patch.object(self.proxy, "get_attribute_list",
+                               wraps=self.proxy.get_attribute_list) as listing:
+            await ConnectWithoutReading(self.make_comm(), self.proxy)(
+                image="image", exposure="exposure", reset="Reset")
+            await ConnectSimilarlyNamed(self.make_comm(), self.proxy)
+        assert listing.call_count == 1
+
+    async def test_watched_config_refreshed(self):
+        index = get_signal_index(self.proxy, "sim/detector/7")
+        registry = get_subscription_registry(self.proxy)
+        fetched = await index.attribute_config("exposure")
+        tokens = [await index.watch_config("exposure"),
+                  await index.watch_config("Exposure")]
+        assert registry.subscriber_count(
+            "exposure", EventType.ATTR_CONF_EVENT) == 1
+        config = mock.Mock()
+        registry._subscriptions[
+            ("exposure", int(EventType.ATTR_CONF_EVENT))].dispatch(
+                mock.Mock(err=False, attr_conf=config))
+        assert await index.attribute_config("exposure") is config
+        for token in tokens:
+            index.unwatch_config(token)
+        assert registry.subscriber_count(
+            "exposure", EventType.ATTR_CONF_EVENT) == 0
+        config = await index.attribute_config("exposure")
+        assert config is not fetched  # fetched again once unwatched
+        assert index.config_batches == 2
+
+
+class ExternalAssetTest(unittest.TestCase):
+    def setUp(self):
+        backend = SimBackend()
+        backend.load(DETECTOR_SPEC)
+        self.previous_backend = set_sim_backend(backend)
+        with CommsConnector(sim_mode=True):
+            self.detector = DetectorDevice(DetectorComm("sim/detector/8"))
+        self.directory = tempfile.TemporaryDirectory()
+        self.detector.write_arrays_externally(self.directory.name)
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+        self.directory.cleanup()
+
+    def test_count_writes_frames_externally(self):
+        docs = []
+        RE(count([self.detector], num=3),
+           lambda name, doc: docs.append((name, doc)))
+        names = [name for name, _ in docs]
+        assert names.count("resource") == 1
+        assert names.count("datum") == 3
+        [descriptor] = [doc for name, doc in docs if name == "descriptor"]
+        data_keys = descriptor["data_keys"]
+        assert data_keys["sim-detector-8-image"]["external"] == "FILESTORE:"
+        assert "external" not in data_keys["sim-detector-8-exposure"]
+        [resource] = [doc for name, doc in docs if name == "resource"]
+        handler = FrameFileHandler(
+            os.path.join(resource["root"], resource["resource_path"]),
+            **resource["resource_kwargs"])
+        events = [doc for name, doc in docs if name == "event"]
+        datum_ids = [event["data"]["sim-detector-8-image"]
+                     for event in events]
+        assert datum_ids[-1].endswith("/2")
+        frame = handler(2)
+        assert frame.shape == (4, 3) and frame.dtype == np.uint16
+        assert events[0]["data"]["sim-detector-8-exposure"] == 0.1
+
+    def test_invalid_frame_not_written(self):
+        docs = []
+        with mock.patch.object(TangoAttrR, "_array_value",
+                               return_value=None):
+            RE(count([self.detector], num=2),
+               lambda name, doc: docs.append((name, doc)))
+        names = [name for name, _ in docs]
+        assert "resource" not in names and "datum" not in names
+        events = [doc for name, doc in docs if name == "event"]
+        assert events[-1]["data"]["sim-detector-8-image"] is None
+
+
+CAMERA_SPEC = {
+    "devices": [{
+        "name": "sim/camera/{}",
+        "count": 3,
+        "attributes": {
+            "exposure": {"dtype": "float", "value": 0.1},
+            "gain": {"dtype": "float", "value": 1.0},
+        },
+    }]
+}
+
+
+class CameraComm(TangoComm):
+    exposure: TangoAttrRW
+    gain: TangoAttrRW
+
+
+class CameraDevice(TangoDevice):
+    @property
+    def conf_signals(self):
+        return SignalCollection(exposure=self.comm.exposure,
+                                gain=self.comm.gain)
+
+
+class ConfigureTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        backend = SimBackend()
+        backend.load(CAMERA_SPEC)
+        self.previous_backend = set_sim_backend(backend)
+        for i in range(3):
+            get_proxy_pool(sim_mode=True).evict(f"sim/camera/{i}")
+        with CommsConnector(sim_mode=True):
+            self.cameras = [CameraDevice(CameraComm(f"sim/camera/{i}"),
+                                         f"camera{i}") for i in range(3)]
+
+    def tearDown(self):
+        set_sim_backend(self.previous_backend)
+
+    async def test_values_written_together(self):
+        camera = self.cameras[0]
+        proxy = camera.comm.exposure._proxy_
+        with mock.patch.object(proxy, "write_attributes",
+                               wraps=proxy.write_attributes) as write:
+            old, new = await camera.configure("exposure", 0.5, "gain", 2.0)
+        write.assert_called_once_with([("exposure", 0.5), ("gain", 2.0)])
+        assert old["camera0-exposure"]["value"] == 0.1
+        assert new["camera0-exposure"]["value"] == 0.5
+        assert new["camera0-gain"]["value"] == 2.0
+
+    async def test_unchanged_values_not_written(self):
+        camera = self.cameras[0]
+        proxy = camera.comm.exposure._proxy_
+        with mock.patch.object(proxy, "write_attribute",
+                               wraps=proxy.write_attribute) as write:
+            old, new = await camera.configure("exposure", 0.1, "gain", 3.0)
+            write.assert_called_once_with("gain", 3.0)
+            write.reset_mock()
+            old, new = await camera.configure("gain", 3.0)
+            write.assert_not_called()
+        assert old == new
+
+    async def test_configure_devices(self):
+        results = await configure_devices(
+            {camera: {"exposure": 0.2 * i} for i, camera
+             in enumerate(self.cameras, 1)})
+        for i, camera in enumerate(self.cameras, 1):
+            _, new = results[camera]
+            assert new[f"camera{i - 1}-exposure"]["value"] == 0.2 * i